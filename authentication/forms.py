@@ -58,6 +58,9 @@ class UploadProfilePhotoform(forms.ModelForm):
 
     Fields:
         profile_photo: An image file for the user's avatar.
+
+    Saving the user builds the square thumbnails of a new photo (see
+    User.save).
     """
     class Meta:
         """
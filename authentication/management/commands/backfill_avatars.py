@@ -0,0 +1,39 @@
+"""
+Management command normalising the profile photos uploaded before the
+avatar thumbnails existed.
+
+Usage:
+    python manage.py backfill_avatars [--force]
+
+Each photo is cropped into the square thumbnails of User.AVATAR_SIZES,
+like a new upload. With --force, users that already have thumbnails are
+processed again.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Build the avatar thumbnails of existing users.
+    """
+    help = "Build the square avatar thumbnails of existing profile photos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Process users that already have avatar thumbnails.")
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.exclude(profile_photo='')
+        if not options['force']:
+            users = users.filter(avatar_variants={})
+        count = 0
+        for user in users.iterator():
+            if not user.profile_photo.storage.exists(user.profile_photo.name):
+                self.stderr.write(
+                    f"{user.username}: missing file {user.profile_photo.name}")
+                continue
+            user.process_profile_photo()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} avatar(s) processed."))
@@ -0,0 +1,36 @@
+"""
+Management command computing the follow suggestions of every user.
+
+Usage:
+    python manage.py suggest_follows [--top N]
+
+The follow graph is read once into NumPy arrays; each user is suggested
+the accounts most followed by the users they follow, except the users
+they already follow and those blocked by or blocking them (see
+authentication.suggestions). The FollowSuggestion rows are replaced a
+thousand users at a time, in short transactions that let the site write
+meanwhile. Run it periodically, e.g. nightly from cron: suggestions are
+not updated when follows change.
+"""
+import time
+from django.core.management.base import BaseCommand
+from authentication import suggestions
+
+
+class Command(BaseCommand):
+    """
+    Recompute the friends-of-friends follow suggestions.
+    """
+    help = "Compute the friends-of-friends follow suggestions of every user."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=suggestions.TOP_K,
+            help=f"Suggestions per user (default {suggestions.TOP_K}).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        users, count = suggestions.compute_suggestions(top_k=options['top'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} suggestions stored for {users} users "
+            f"in {time.perf_counter() - started:.1f}s."))
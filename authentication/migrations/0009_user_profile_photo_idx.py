@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('authentication', '0008_user_username_lower_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['profile_photo'], name='user_profile_photo_idx'),
+        ),
+    ]
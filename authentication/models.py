@@ -3,12 +3,18 @@ This module defines a custom user model for a Django application,
 extending Django's built-in AbstractUser to include additional fields
 for user profile management.
 It includes:
-- A profile photo field for user avatars.
+- A profile photo field for user avatars, normalised into small
+  square thumbnails when uploaded.
 - Many-to-many relationships for following and blocking other users.
+- FollowSuggestion: The accounts suggested to a user, computed in batch.
 This allows users to manage their social interactions within the application.
 """
 from django.contrib.auth.models import AbstractUser
+from django.core.files.base import ContentFile
 from django.db import models
+from django.db.models.functions import Lower
+from litrevu import images
+from litrevu import storage as media
 
 
 class User(AbstractUser):
@@ -19,10 +25,13 @@ class User(AbstractUser):
 
     Attributes:
         profile_photo (ImageField): Optional profile image for the user.
+        avatar_variants (JSONField): Storage names of the square thumbnails
+            of the profile photo, by size in pixels.
         follows (ManyToManyField): Users that this user is following.
         blocked (ManyToManyField): Users that this user has blocked.
     """
     profile_photo = models.ImageField(verbose_name='Photo de profil')
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     follows = models.ManyToManyField(
         'self',
         symmetrical=False,
@@ -36,3 +45,158 @@ class User(AbstractUser):
         blank=True,
         verbose_name='bloqué',
     )
+
+    class Meta(AbstractUser.Meta):
+        """
+        Meta class to define the case-insensitive index of the username
+        prefix lookups (see blog.views.username_autocomplete), and the index
+        of the media reference counts (see litrevu.storage.reference_count).
+        """
+        indexes = [
+            models.Index(Lower('username'), name='user_username_lower_idx'),
+            models.Index(fields=['profile_photo'], name='user_profile_photo_idx'),
+        ]
+
+    AVATAR_SIZES = (40, 80, 160)
+    AVATAR_MAX_BYTES = 12 * 1024
+    # Set by prepare_profile_photo until the row is saved.
+    _photo_uploads = ()
+
+    def write_avatars(self):
+        """
+        Crop the stored profile photo into square JPEG thumbnails.
+
+        The photo is center-cropped, EXIF metadata is dropped, and one
+        thumbnail is written per AVATAR_SIZES, each within AVATAR_MAX_BYTES.
+        The largest thumbnail replaces the photo. The row is not saved.
+
+        Returns:
+            str: The name of the cropped photo, to release once the row
+            no longer references it.
+        """
+        storage = self.profile_photo.storage
+        uploaded = self.profile_photo.name
+        image = images.open_image(self.profile_photo)
+        self.profile_photo.close()
+        variants = {}
+        for size in self.AVATAR_SIZES:
+            data = images.encode_within(
+                images.square(image, size), 'jpg', self.AVATAR_MAX_BYTES)
+            variants[str(size)] = storage.save(
+                images.variant_name(uploaded, f'avatar{size}', 'jpg'), ContentFile(data))
+        self.avatar_variants = variants
+        self.profile_photo.name = variants[str(max(self.AVATAR_SIZES))]
+        return uploaded
+
+    def prepare_profile_photo(self):
+        """
+        Store a new upload and crop it into thumbnails before the row is
+        saved. Does nothing if the photo did not change.
+
+        Runs no query, so that views do it before their write rather than
+        while holding the write lock (see litrevu.writes); save() calls it
+        otherwise.
+        """
+        if not self.profile_photo or self.profile_photo._committed:
+            return
+        self.profile_photo.save(
+            self.profile_photo.name, self.profile_photo.file, save=False)
+        self._photo_uploads = (self.write_avatars(),)
+
+    def process_profile_photo(self):
+        """
+        Crop a photo stored before the thumbnails existed, save the row and
+        release the previous files (see the backfill_avatars command).
+        """
+        previous_files = list(self.avatar_variants.values())
+        previous_files.append(self.write_avatars())
+        self.save(update_fields=['profile_photo', 'avatar_variants'])
+        media.release(previous_files, self.profile_photo.storage)
+
+    def save(self, *args, **kwargs):
+        """
+        Override save method to crop a new profile photo into thumbnails.
+
+        A new upload is processed by prepare_profile_photo, unless the
+        caller already did; a cleared photo drops its thumbnails. The files
+        of a replaced or cleared photo, and the uploaded file the thumbnails
+        replace, are released (see litrevu.storage).
+        """
+        self.prepare_profile_photo()
+        photo_cleared = not self.profile_photo and bool(self.avatar_variants)
+        previous_files = []
+        if (self._photo_uploads or photo_cleared) and self.pk:
+            previous = User.objects.filter(pk=self.pk).first()
+            previous_files = previous.media_names() if previous else []
+        if photo_cleared:
+            self.avatar_variants = {}
+        super().save(*args, **kwargs)
+        released = [*previous_files, *self._photo_uploads]
+        self._photo_uploads = ()
+        media.release(released, self.profile_photo.storage)
+
+    def media_names(self):
+        """
+        Return the storage names of the profile photo and of its thumbnails.
+        """
+        names = [self.profile_photo.name] if self.profile_photo else []
+        return names + list(self.avatar_variants.values())
+
+    def avatar_url(self, size):
+        """
+        Return the URL of the square thumbnail of the given size, falling back
+        to the profile photo itself; None if the user has no photo.
+        """
+        name = self.avatar_variants.get(str(size))
+        if name:
+            return self.profile_photo.storage.url(name)
+        if self.profile_photo:
+            return self.profile_photo.url
+        return None
+
+    @property
+    def avatar_small_url(self):
+        """
+        Return the URL of the 40px avatar shown in cards and in the navbar.
+        """
+        return self.avatar_url(40)
+
+    @property
+    def avatar_srcset(self):
+        """
+        Return the srcset attribute of the 40px avatar (1x and 2x).
+        """
+        if not self.avatar_variants:
+            return ''
+        return f'{self.avatar_url(40)} 1x, {self.avatar_url(80)} 2x'
+
+
+class FollowSuggestion(models.Model):
+    """
+    An account suggested to a user: followed by some of the users they follow.
+
+    The rows of all users are replaced by the suggest_follows command
+    (see authentication.suggestions); the follow page reads them by rank.
+
+    Attributes:
+        user (ForeignKey): The user the account is suggested to.
+        suggested (ForeignKey): The suggested account.
+        mutual (PositiveIntegerField): Number of users followed by user
+            who follow the suggested account.
+        rank (PositiveSmallIntegerField): Position in the suggestions, from 0.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='follow_suggestions')
+    suggested = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+')
+    mutual = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        """
+        Meta class to define the (user, rank) index read by the follow page.
+        """
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'rank'], name='unique_follow_suggestion_rank'),
+        ]
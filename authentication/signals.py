@@ -0,0 +1,43 @@
+"""
+Signal handlers of the authentication application.
+It includes:
+- release_user_files: Releases the profile photo files of deleted users.
+- invalidate_social_graph: Drops the cached graphs touched by a change of
+  User.follows or User.blocked.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+from litrevu import storage
+from . import social
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=User)
+def release_user_files(sender, instance, **kwargs):
+    """
+    Release the profile photo and thumbnails of a deleted user; they are
+    deleted unless another ticket or user shares them.
+    """
+    storage.release(instance.media_names())
+
+
+@receiver(m2m_changed, sender=User.follows.through)
+@receiver(m2m_changed, sender=User.blocked.through)
+def invalidate_social_graph(sender, instance, action, pk_set, **kwargs):
+    """
+    Drop the cached graphs of both sides of a follow or block change.
+
+    A clear() gives no pk_set to its post_clear signal, so the users on
+    the other side are read during pre_clear.
+    """
+    if action == 'pre_clear':
+        pairs = sender.objects.filter(
+            Q(from_user=instance) | Q(to_user=instance)
+        ).values_list('from_user_id', 'to_user_id')
+        pk_set = {pk for pair in pairs for pk in pair}
+    elif action not in ('post_add', 'post_remove'):
+        return
+    social.invalidate({instance.pk, *(pk_set or ())})
@@ -0,0 +1,198 @@
+"""
+Cached social graph of the users: who they follow and block.
+
+It includes:
+- SocialGraph: The follows, blocked and blocked_by id sets of a user.
+- load_graph: Read the graph of a user from the database (two queries).
+- get_graph: The same graph, read through the caches.
+- invalidate: Drop cached graphs, called by authentication.signals.
+
+A graph is kept in a small per-process LRU for SOCIAL_GRAPH_LOCAL_TTL
+seconds at most, and, when settings.SOCIAL_GRAPH_CACHE names a cache shared
+by the processes (Redis, Memcached), stored there as three packed arrays
+of ids. The signals drop the local copy of the process making the change
+and the shared copy; the other processes drop their local copy once its
+TTL runs out. A process-local cache (LocMemCache) must not be used for the
+shared tier: the other processes would keep their copy in it.
+"""
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import NamedTuple
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+
+CACHE_KEY = 'social-graph:{}'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+class SocialGraph(NamedTuple):
+    """
+    The relations of one user, as frozensets of user ids.
+
+    Attributes:
+        follows (frozenset): Users followed by the user.
+        blocked (frozenset): Users blocked by the user.
+        blocked_by (frozenset): Users blocking the user.
+    """
+    follows: frozenset
+    blocked: frozenset
+    blocked_by: frozenset
+
+    @property
+    def hidden(self):
+        """
+        Users whose posts the user does not see: blocked either way.
+        """
+        return self.blocked | self.blocked_by
+
+    def pack(self):
+        """
+        Return the graph as a compact tuple of bytes, for the Django cache.
+        """
+        return tuple(array('q', sorted(ids)).tobytes() for ids in self)
+
+    @classmethod
+    def unpack(cls, packed):
+        """
+        Rebuild a graph from the value returned by pack().
+        """
+        return cls(*(frozenset(array('q', data)) for data in packed))
+
+
+class _LocalGraphs:
+    """
+    Per-process LRU of graphs, each kept at most ttl seconds.
+    """
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._graphs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._graphs.get(user_id)
+            if entry is None:
+                return None
+            expires_at, graph = entry
+            if expires_at < time.monotonic():
+                del self._graphs[user_id]
+                return None
+            self._graphs.move_to_end(user_id)
+            return graph
+
+    def set(self, user_id, graph):
+        with self._lock:
+            self._graphs[user_id] = (time.monotonic() + self.ttl, graph)
+            self._graphs.move_to_end(user_id)
+            while len(self._graphs) > self.max_size:
+                self._graphs.popitem(last=False)
+
+    def discard(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._graphs.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._graphs.clear()
+
+
+_local = _LocalGraphs(
+    getattr(settings, 'SOCIAL_GRAPH_LRU_SIZE', 1024),
+    getattr(settings, 'SOCIAL_GRAPH_LOCAL_TTL', 5))
+
+
+def _shared_cache():
+    """
+    Return the cache shared by the processes, None if not configured.
+    """
+    alias = getattr(settings, 'SOCIAL_GRAPH_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _user_id(user):
+    return getattr(user, 'pk', user)
+
+
+def load_graph(user):
+    """
+    Read the graph of a user from the database, bypassing the caches.
+
+    Args:
+        user (User | int): The user, or their id.
+
+    Returns:
+        SocialGraph: The relations of the user.
+    """
+    from .models import User
+    user_id = _user_id(user)
+    follows = User.follows.through.objects.filter(
+        from_user_id=user_id).values_list('to_user_id', flat=True)
+    blocked, blocked_by = set(), set()
+    for from_id, to_id in User.blocked.through.objects.filter(
+            Q(from_user_id=user_id) | Q(to_user_id=user_id)
+    ).values_list('from_user_id', 'to_user_id'):
+        if from_id == user_id:
+            blocked.add(to_id)
+        if to_id == user_id:
+            blocked_by.add(from_id)
+    return SocialGraph(frozenset(follows), frozenset(blocked), frozenset(blocked_by))
+
+
+def get_graph(user):
+    """
+    Return the graph of a user from the local LRU, the shared cache, or
+    the database, in that order, filling the caches on the way back.
+
+    Args:
+        user (User | int): The user, or their id.
+
+    Returns:
+        SocialGraph: The relations of the user.
+    """
+    user_id = _user_id(user)
+    graph = _local.get(user_id)
+    if graph is not None:
+        return graph
+    shared = _shared_cache()
+    packed = shared.get(CACHE_KEY.format(user_id)) if shared is not None else None
+    if packed is not None:
+        graph = SocialGraph.unpack(packed)
+    else:
+        graph = load_graph(user_id)
+        if shared is not None:
+            shared.set(CACHE_KEY.format(user_id), graph.pack(), CACHE_TIMEOUT)
+    _local.set(user_id, graph)
+    return graph
+
+
+def invalidate(user_ids):
+    """
+    Drop the cached graphs of the given users.
+
+    The graphs are dropped right away and again once the current
+    transaction commits, so that a graph read from the database in
+    between, before the change was visible, is not kept.
+    """
+    user_ids = set(user_ids)
+
+    def drop():
+        _local.discard(user_ids)
+        shared = _shared_cache()
+        if shared is not None:
+            shared.delete_many([CACHE_KEY.format(user_id) for user_id in user_ids])
+
+    drop()
+    transaction.on_commit(drop)
+
+
+def clear_local():
+    """
+    Empty the per-process LRU (the shared cache is left as is).
+    """
+    _local.clear()
@@ -0,0 +1,248 @@
+"""
+Friends-of-friends follow suggestions, computed in batch.
+
+It includes:
+- FollowMatrix: A directed graph of users in CSR (compressed sparse row)
+  arrays, with load_follows and load_blocks reading it from the database.
+- suggest: The top-K suggestions of a batch of users, as NumPy arrays.
+- compute_suggestions: Compute the suggestions of every user and replace
+  the FollowSuggestion rows in short transactions, used by the
+  suggest_follows command.
+
+An account is suggested to a user when users they follow follow it; the
+more of them, the higher it ranks, then the more followers it has. Users
+already followed, the user, and users blocked by or blocking the user are
+left out. The whole follow graph is read once into arrays, and the
+two-hop paths of a batch of users are counted with sorts rather than one
+query per followed user, so the cost is the number of two-hop paths:
+MAX_FANOUT bounds the follows walked through any followed user.
+"""
+from typing import NamedTuple
+import numpy as np
+from django.db import connections, router, transaction
+from .models import FollowSuggestion, User
+
+TOP_K = 10
+# Follows of a followed user walked for the suggestions, the most recent.
+MAX_FANOUT = 500
+# Two-hop paths counted at once; bounds the memory of a batch.
+BATCH_PATHS = 4_000_000
+# Users whose suggestions are replaced in one transaction.
+WRITE_USERS = 1000
+FETCH_SIZE = 100_000
+
+
+class FollowMatrix(NamedTuple):
+    """
+    A directed graph of users in CSR arrays.
+
+    Attributes:
+        ids (ndarray): The user ids, sorted; row i is the user ids[i].
+        indptr (ndarray): Row i's edges are indices[indptr[i]:indptr[i + 1]].
+        indices (ndarray): The target rows of the edges, each row's most
+            recent edge first.
+    """
+    ids: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+
+    @classmethod
+    def from_edges(cls, ids, edges):
+        """
+        Build the matrix of edges.
+
+        Args:
+            ids (ndarray): The sorted user ids.
+            edges (ndarray): (edge id, source user id, target user id) rows;
+                the edge id orders the edges of a row, newest first.
+        """
+        rows = np.searchsorted(ids, edges[:, 1])
+        columns = np.searchsorted(ids, edges[:, 2]).astype(np.int32)
+        order = np.lexsort((-edges[:, 0], rows))
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(ids)), out=indptr[1:])
+        return cls(ids, indptr, columns[order])
+
+    def degrees(self):
+        """
+        Return the number of edges of each row.
+        """
+        return np.diff(self.indptr)
+
+    def expand(self, rows, cap=None):
+        """
+        Return the edges of rows, at most cap per row.
+
+        Returns:
+            tuple: (positions, targets) arrays: the edge targets, and the
+            position in rows of the row each edge comes from.
+        """
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        if cap is not None:
+            lengths = np.minimum(lengths, cap)
+        positions = np.repeat(np.arange(len(rows)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return positions, self.indices[np.repeat(starts, lengths) + offsets]
+
+
+def _read(sql, columns, using):
+    """
+    Read the integer rows of a query into an (n, columns) int64 array.
+    """
+    chunks = [np.empty((0, columns), dtype=np.int64)]
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql)
+        while rows := cursor.fetchmany(FETCH_SIZE):
+            chunks.append(np.array(rows, dtype=np.int64).reshape(-1, columns))
+    return np.concatenate(chunks)
+
+
+def _user_ids(using):
+    return _read(f'SELECT id FROM {User._meta.db_table} ORDER BY id', 1, using)[:, 0]
+
+
+def _edges(through, using):
+    table = through._meta.db_table
+    return _read(f'SELECT id, from_user_id, to_user_id FROM {table}', 3, using)
+
+
+def load_follows(ids, using=None):
+    """
+    Read User.follows into a FollowMatrix: a row per follower.
+    """
+    using = using or router.db_for_read(User)
+    return FollowMatrix.from_edges(ids, _edges(User.follows.through, using))
+
+
+def load_blocks(ids, using=None):
+    """
+    Read User.blocked into a FollowMatrix with both directions of each
+    block: a row per user, with the users they block or are blocked by.
+    """
+    using = using or router.db_for_read(User)
+    edges = _edges(User.blocked.through, using)
+    return FollowMatrix.from_edges(ids, np.concatenate([edges, edges[:, [0, 2, 1]]]))
+
+
+def suggest(follows, blocks, rows, top_k=TOP_K, followers=None):
+    """
+    Return the top_k suggestions of a batch of users.
+
+    Args:
+        follows (FollowMatrix): The follow graph.
+        blocks (FollowMatrix): The blocks, in both directions.
+        rows (ndarray): The rows of the users.
+        top_k (int): Suggestions per user.
+        followers (ndarray): Number of followers of each row, the tie-break;
+            computed from follows by default.
+
+    Returns:
+        tuple: (users, suggested, mutual) arrays of rows and counts, by
+        user then rank.
+    """
+    size = len(follows.ids)
+    if followers is None:
+        followers = np.bincount(follows.indices, minlength=size)
+    positions, middles = follows.expand(rows)
+    hops, candidates = follows.expand(middles, cap=MAX_FANOUT)
+    keys, mutual = np.unique(positions[hops] * size + candidates, return_counts=True)
+    blocked_positions, blocked = blocks.expand(rows)
+    excluded = np.concatenate([
+        positions * size + middles,
+        blocked_positions * size + blocked,
+        np.arange(len(rows)) * size + rows,
+    ])
+    keep = ~np.isin(keys, excluded)
+    keys, mutual = keys[keep], mutual[keep]
+    owners, candidates = np.divmod(keys, size)
+    order = np.lexsort((-followers[candidates], -mutual, owners))
+    owners, candidates, mutual = owners[order], candidates[order], mutual[order]
+    firsts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    ranks = np.arange(len(owners)) - np.repeat(firsts, np.diff(np.r_[firsts, len(owners)]))
+    top = ranks < top_k
+    return rows[owners[top]], candidates[top], mutual[top]
+
+
+def _batches(follows, rows):
+    """
+    Split rows into batches of about BATCH_PATHS two-hop paths.
+    """
+    fanout = np.minimum(follows.degrees(), MAX_FANOUT)
+    walked = np.r_[0, np.cumsum(fanout[follows.indices])]
+    paths = np.cumsum(walked[follows.indptr[rows + 1]] - walked[follows.indptr[rows]])
+    start = 0
+    while start < len(rows):
+        done = paths[start - 1] if start else 0
+        end = max(int(np.searchsorted(paths, done + BATCH_PATHS, side='right')), start + 1)
+        yield rows[start:end]
+        start = end
+
+
+def _replace(using, after, until, rows, batch_size):
+    """
+    Replace the suggestions of the users whose ids are in (after, until],
+    in one short transaction; None leaves a bound open.
+
+    Args:
+        rows (iterable): (user_id, suggested_id, mutual, rank) tuples.
+    """
+    stored = FollowSuggestion.objects.using(using)
+    if after is not None:
+        stored = stored.filter(user_id__gt=after)
+    if until is not None:
+        stored = stored.filter(user_id__lte=until)
+    with transaction.atomic(using=using):
+        stored.delete()
+        FollowSuggestion.objects.using(using).bulk_create(
+            (FollowSuggestion(user_id=user_id, suggested_id=suggested_id,
+                              mutual=mutual, rank=rank)
+             for user_id, suggested_id, mutual, rank in rows),
+            batch_size=batch_size)
+
+
+def compute_suggestions(top_k=TOP_K, using=None, batch_size=2000):
+    """
+    Compute the suggestions of every user and replace the FollowSuggestion
+    rows.
+
+    The rows are replaced WRITE_USERS users at a time, each group in its
+    own transaction, so the SQLite write lock is only held for short
+    writes: the site keeps accepting submissions during the job. A user's
+    suggestions are replaced at once; users without follows, or deleted,
+    lose theirs.
+
+    Args:
+        top_k (int): Suggestions per user.
+        using (str): The database alias, the default write database by default.
+        batch_size (int): Rows per INSERT.
+
+    Returns:
+        tuple: The numbers of users and of suggestions stored.
+    """
+    using = using or router.db_for_write(FollowSuggestion)
+    ids = _user_ids(using)
+    follows = load_follows(ids, using)
+    blocks = load_blocks(ids, using)
+    followers = np.bincount(follows.indices, minlength=len(ids))
+    # Only users who follow someone can get suggestions.
+    rows = np.flatnonzero(follows.degrees() > 0)
+    users = count = 0
+    replaced = None
+    for batch in _batches(follows, rows):
+        owners, suggested, mutual = suggest(follows, blocks, batch, top_k, followers)
+        ranks = np.arange(len(owners)) - np.searchsorted(owners, owners)
+        for start in range(0, len(batch), WRITE_USERS):
+            group = batch[start:start + WRITE_USERS]
+            # owners is sorted, like batch.
+            first = np.searchsorted(owners, group[0])
+            end = np.searchsorted(owners, group[-1], side='right')
+            until = int(ids[group[-1]])
+            _replace(using, replaced, until, zip(
+                ids[owners[first:end]].tolist(), ids[suggested[first:end]].tolist(),
+                mutual[first:end].tolist(), ranks[first:end].tolist()), batch_size)
+            replaced = until
+        users += len(np.unique(owners))
+        count += len(owners)
+    _replace(using, replaced, None, (), batch_size)
+    return users, count
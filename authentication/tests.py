@@ -0,0 +1,284 @@
+"""
+Tests for the authentication application.
+
+SocialGraphTests checks that the cached social graph follows the changes
+of User.follows and User.blocked, from either side of the relations, and
+from another process once the local copy expires.
+
+FollowSuggestionTests checks the friends-of-friends suggestions computed
+by the suggest_follows command.
+
+AvatarTests checks the square thumbnails of profile photos, the release
+of the files they replace and the backfill_avatars command.
+"""
+import os
+import random
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from . import social, suggestions
+from .models import FollowSuggestion, User
+
+
+class SocialGraphTests(TestCase):
+    """
+    Check the social graph cache against its invalidation signals.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='password')
+        cls.bob = User.objects.create_user('bob', password='password')
+        cls.carol = User.objects.create_user('carol', password='password')
+
+    def setUp(self):
+        cache.clear()
+        social.clear_local()
+
+    def assertGraph(self, user, follows=(), blocked=(), blocked_by=()):
+        """
+        Check the cached graph of user, then that it matches the database.
+        """
+        expected = social.SocialGraph(
+            frozenset(u.pk for u in follows), frozenset(u.pk for u in blocked),
+            frozenset(u.pk for u in blocked_by))
+        self.assertEqual(social.get_graph(user), expected)
+        self.assertEqual(social.load_graph(user), expected)
+
+    @override_settings(SOCIAL_GRAPH_CACHE='default')
+    def test_cached_graph_is_reused(self):
+        self.alice.follows.add(self.bob)
+        self.assertGraph(self.alice, follows=[self.bob])
+        with self.assertNumQueries(0):
+            social.get_graph(self.alice)
+        social.clear_local()
+        with self.assertNumQueries(0):
+            self.assertEqual(social.get_graph(self.alice).follows, {self.bob.pk})
+
+    def test_follows_invalidate(self):
+        self.assertGraph(self.alice)
+        self.alice.follows.add(self.bob, self.carol)
+        self.assertGraph(self.alice, follows=[self.bob, self.carol])
+        self.alice.follows.remove(self.carol)
+        self.assertGraph(self.alice, follows=[self.bob])
+        self.carol.followers.add(self.alice)
+        self.assertGraph(self.alice, follows=[self.bob, self.carol])
+        self.alice.follows.clear()
+        self.assertGraph(self.alice)
+
+    @override_settings(SOCIAL_GRAPH_CACHE='default')
+    def test_blocks_invalidate_both_sides(self):
+        self.assertGraph(self.alice)
+        self.assertGraph(self.bob)
+        self.alice.blocked.add(self.bob)
+        self.assertGraph(self.alice, blocked=[self.bob])
+        self.assertGraph(self.bob, blocked_by=[self.alice])
+        self.bob.blocked_by.clear()
+        self.assertGraph(self.alice)
+        self.assertGraph(self.bob)
+
+    def test_changes_of_another_process_seen_once_the_local_copy_expires(self):
+        self.assertGraph(self.bob)
+        # Another process blocks bob: its signals do not reach this one.
+        User.blocked.through.objects.create(from_user=self.alice, to_user=self.bob)
+        self.assertEqual(social.get_graph(self.bob).blocked_by, frozenset())
+        # The local copy expires after SOCIAL_GRAPH_LOCAL_TTL.
+        social.clear_local()
+        self.assertGraph(self.bob, blocked_by=[self.alice])
+
+    def test_pack_round_trip(self):
+        graph = social.SocialGraph(
+            frozenset({1, 2 ** 40}), frozenset(), frozenset({7}))
+        self.assertEqual(social.SocialGraph.unpack(graph.pack()), graph)
+
+
+class FollowSuggestionTests(TestCase):
+    """
+    Check the follow suggestions (authentication.suggestions).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {name: User.objects.create_user(name, password='password')
+                     for name in ('alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'grace')}
+        follows = {
+            'alice': ['bob', 'carol', 'dave'],
+            'bob': ['erin', 'frank', 'grace', 'alice'],
+            'carol': ['erin', 'frank', 'dave'],
+            'dave': ['erin'],
+            'grace': ['frank'],
+        }
+        for name, followed in follows.items():
+            cls.users[name].follows.add(*(cls.users[other] for other in followed))
+        # grace blocks alice: hidden from alice although bob follows her.
+        cls.users['grace'].blocked.add(cls.users['alice'])
+
+    def setUp(self):
+        cache.clear()
+        social.clear_local()
+
+    def suggested(self, name):
+        return [
+            (suggestion.suggested.username, suggestion.mutual)
+            for suggestion in FollowSuggestion.objects.filter(
+                user=self.users[name]).select_related('suggested').order_by('rank')
+        ]
+
+    def test_friends_of_friends_ranked_without_follows_nor_blocks(self):
+        call_command('suggest_follows', stdout=StringIO())
+        # erin is followed by bob, carol and dave, frank by bob and carol;
+        # dave is already followed, and grace blocks alice.
+        self.assertEqual(self.suggested('alice'), [('erin', 3), ('frank', 2)])
+        # Ties go to the most followed account: dave has two followers.
+        self.assertEqual(self.suggested('bob'), [('dave', 1), ('carol', 1)])
+        self.assertEqual(self.suggested('grace'), [])
+
+    def test_batches_and_top_k_give_the_same_suggestions(self):
+        suggestions.compute_suggestions(top_k=1)
+        self.assertEqual(self.suggested('alice'), [('erin', 3)])
+        with mock.patch.object(suggestions, 'BATCH_PATHS', 1):
+            self.assertEqual(suggestions.compute_suggestions(), (2, 4))
+        self.assertEqual(self.suggested('alice'), [('erin', 3), ('frank', 2)])
+
+    def test_suggestions_replaced_in_a_transaction_per_group_of_users(self):
+        suggestions.compute_suggestions()
+        self.users['bob'].follows.clear()
+        with mock.patch.object(suggestions, 'WRITE_USERS', 1), \
+                mock.patch.object(suggestions, '_replace', wraps=suggestions._replace) as replace:
+            suggestions.compute_suggestions()
+        # alice, carol, dave and grace follow someone, then the users after them.
+        self.assertEqual(replace.call_count, 5)
+        # Without bob, erin is followed by carol and dave, frank by carol.
+        self.assertEqual(self.suggested('alice'), [('erin', 2), ('frank', 1)])
+        self.assertEqual(self.suggested('bob'), [])
+
+    def test_follow_page_reads_current_suggestions(self):
+        suggestions.compute_suggestions()
+        alice = self.users['alice']
+        alice.follows.add(self.users['erin'])
+        self.client.force_login(alice)
+        response = self.client.get(reverse('follow_users'))
+        self.assertEqual(
+            [suggestion.suggested.username for suggestion in response.context['suggestions']],
+            ['frank'])
+        self.assertContains(response, 'suivi par 2 de vos abonnements')
+
+
+class AvatarTests(TestCase):
+    """
+    Check the square thumbnails of profile photos, on a temporary MEDIA_ROOT.
+    """
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = User.objects.create_user('alice', password='password')
+        self.client.force_login(self.user)
+
+    @staticmethod
+    def photo(size=(600, 300), seed=0):
+        """
+        Return the JPEG bytes of a noisy photo carrying EXIF metadata.
+        """
+        noise = random.Random(seed).randbytes(size[0] * size[1] * 3)
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        exif[0x0132] = '2024:01:01 12:00:00'
+        buffer = BytesIO()
+        Image.frombytes('RGB', size, noise).save(buffer, 'JPEG', quality=95, exif=exif)
+        return buffer.getvalue()
+
+    @staticmethod
+    def stored_files():
+        return {
+            os.path.relpath(os.path.join(path, name), settings.MEDIA_ROOT).replace(os.sep, '/')
+            for path, _, names in os.walk(settings.MEDIA_ROOT) for name in names}
+
+    def upload(self, data, name='photo.jpg'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('profile_photo_upload'), {
+                'profile_photo': SimpleUploadedFile(name, data, content_type='image/jpeg')})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.user.refresh_from_db()
+
+    def test_upload_writes_square_thumbnails_without_exif(self):
+        original = Image.open(BytesIO(self.photo()))
+        self.assertEqual(original.getexif()[0x010F], 'Camera')
+        self.upload(self.photo())
+        variants = self.user.avatar_variants
+        self.assertEqual(set(variants), {'40', '80', '160'})
+        for size in User.AVATAR_SIZES:
+            with self.subTest(size=size), default_storage.open(variants[str(size)]) as file:
+                data = file.read()
+                image = Image.open(BytesIO(data))
+                self.assertEqual((image.format, image.size), ('JPEG', (size, size)))
+                self.assertEqual(dict(image.getexif()), {})
+                self.assertNotIn('exif', image.info)
+                self.assertLessEqual(len(data), User.AVATAR_MAX_BYTES)
+        self.assertEqual(self.user.profile_photo.name, variants['160'])
+        self.assertEqual(self.stored_files(), set(variants.values()))
+
+    def test_replaced_photo_releases_its_thumbnails(self):
+        self.upload(self.photo(seed=1))
+        first = set(self.user.avatar_variants.values())
+        self.upload(self.photo(seed=2))
+        second = set(self.user.avatar_variants.values())
+        self.assertFalse(first & second)
+        self.assertEqual(self.stored_files(), second)
+
+    def test_thumbnails_kept_while_shared(self):
+        other = User.objects.create_user('bob', password='password')
+        self.upload(self.photo(seed=1))
+        shared = set(self.user.avatar_variants.values())
+        self.client.force_login(other)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('profile_photo_upload'), {
+                'profile_photo': SimpleUploadedFile('photo.jpg', self.photo(seed=1))})
+        self.client.force_login(self.user)
+        self.upload(self.photo(seed=2))
+        self.assertEqual(self.stored_files(), shared | set(self.user.avatar_variants.values()))
+
+    def write_legacy_photo(self, user, name='legacy.jpg'):
+        """
+        Give user a photo stored before the thumbnails existed.
+        """
+        name = FileSystemStorage(location=settings.MEDIA_ROOT).save(name, ContentFile(self.photo()))
+        User.objects.filter(pk=user.pk).update(profile_photo=name, avatar_variants={})
+        user.refresh_from_db()
+        return name
+
+    def test_legacy_photo_released_when_replaced(self):
+        legacy = self.write_legacy_photo(self.user)
+        self.upload(self.photo(seed=1))
+        self.assertNotIn(legacy, self.stored_files())
+        self.assertEqual(self.stored_files(), set(self.user.avatar_variants.values()))
+
+    def test_backfill_avatars(self):
+        legacy = self.write_legacy_photo(self.user)
+        missing = User.objects.create_user('bob', password='password')
+        User.objects.filter(pk=missing.pk).update(profile_photo='gone.jpg')
+        out, err = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('backfill_avatars', stdout=out, stderr=err)
+        self.assertIn('1 avatar(s) processed', out.getvalue())
+        self.assertIn('bob: missing file gone.jpg', err.getvalue())
+        self.user.refresh_from_db()
+        self.assertEqual(set(self.user.avatar_variants), {'40', '80', '160'})
+        self.assertEqual(self.stored_files(), set(self.user.avatar_variants.values()))
+        self.assertNotIn(legacy, self.stored_files())
+
+        out = StringIO()
+        call_command('backfill_avatars', stdout=out, stderr=StringIO())
+        self.assertIn('0 avatar(s) processed', out.getvalue())
+        call_command('backfill_avatars', force=True, stdout=out, stderr=StringIO())
+        self.assertIn('1 avatar(s) processed', out.getvalue())
@@ -24,12 +24,21 @@ Functions:
         On POST, validates and updates the user's password,
         then redirects to the password_change_done page.
 
+Classes:
+    LoginView, LogoutView:
+        Django's views, writing the login or logout through
+        litrevu.writes.run_write once the password was checked.
+
 """
+from functools import partial
 from django.conf import settings
-from django.contrib.auth import login, update_session_auth_hash
+from django.contrib.auth import login, logout, update_session_auth_hash
+from django.contrib.auth import views as auth_views
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseRedirect
 from django.shortcuts import render, redirect
+from litrevu import writes
 
 from . import forms
 
@@ -56,8 +65,12 @@ POST (validate & process) requests,and redirects appropriately on success.
     if request.method == 'POST':
         form = forms.SignupForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            login(request, user)
+            user = form.save(commit=False)
+
+            def register():
+                user.save()
+                login(request, user)
+            writes.run_write(register)
             return redirect(settings.LOGIN_REDIRECT_URL)
     return render(request,
                   'authentication/signup.html', context={'form': form})
@@ -79,7 +92,9 @@ def upload_profile_photo(request):
         form = forms.UploadProfilePhotoform(request.POST, request.FILES,
                                             instance=request.user)
         if form.is_valid():
-            form.save()
+            user = form.save(commit=False)
+            user.prepare_profile_photo()
+            writes.run_write(user.save)
             return redirect('home')
     return render(request,
                   'authentication/upload_photo_profile.html',
@@ -98,8 +113,12 @@ def password_change(request):
     if request.method == 'POST':
         form = PasswordChangeForm(request.user, request.POST)
         if form.is_valid():
-            user = form.save()
-            update_session_auth_hash(request, user)
+            user = form.save(commit=False)
+
+            def change_password():
+                user.save()
+                update_session_auth_hash(request, user)
+            writes.run_write(change_password)
             return redirect('password_change_done')
     else:
         form = PasswordChangeForm(request.user)
@@ -107,3 +126,27 @@ def password_change(request):
         field.widget.attrs.update({'class': 'form-control'})
     return render(request, 'authentication/registration.html',
                   context={'form': form})
+
+
+class LoginView(auth_views.LoginView):
+    """
+    Django's login view, holding the write slot for the login only.
+
+    The password is checked by the form, before the slot: a login, failed
+    or not, does not stall the writes of the process while it is hashed.
+    """
+    def form_valid(self, form):
+        writes.run_write(partial(login, self.request, form.get_user()))
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class LogoutView(auth_views.LogoutView):
+    """
+    Django's logout view, deleting the session through run_write.
+    """
+    def post(self, request, *args, **kwargs):
+        writes.run_write(partial(logout, request))
+        redirect_to = self.get_success_url()
+        if redirect_to != request.get_full_path():
+            return HttpResponseRedirect(redirect_to)
+        return super().get(request, *args, **kwargs)
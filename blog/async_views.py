@@ -0,0 +1,179 @@
+"""
+docstring: blog/async_views.py
+This module contains async versions of the read-only views of the blog
+application: the home feed, the user's posts, and the ticket and review pages.
+They are served by the ASGI entry point (see litrevu.asgi_urls), where a
+view waiting on the database no longer holds a worker thread.
+The queries are awaited one after another: Django's async ORM runs them
+all on one thread and connection (sync_to_async, thread_sensitive), so
+awaiting them together would not overlap them. The templates are
+rendered with sync_to_async.
+It includes:
+- areviewed_ticket_ids: The tickets of a feed page the viewer reviewed.
+- viewer, render_feed, get_or_404: Helpers shared by the views.
+- home, display_posts, view_ticket, view_review: The async views.
+"""
+from functools import partial
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.db.models import Q
+from django.http import Http404
+from django.shortcuts import render
+from authentication import social
+from . import feed, models
+from .decorators import query_budget
+
+
+async def areviewed_ticket_ids(user, rows):
+    """
+    Return the ids of the tickets, shown by a feed page, that the user reviewed.
+
+    Works on the feed rows, before they are hydrated: the tickets nested
+    in reviews are found by a subquery rather than from the hydrated
+    reviews.
+
+    Args:
+        user (User): The viewer.
+        rows (list): Feed rows with 'kind' and 'object_id'.
+
+    Returns:
+        set: Primary keys of the tickets already reviewed by the user.
+    """
+    if not rows:
+        return set()
+    ticket_ids = [row['object_id'] for row in rows if row['kind'] == feed.TICKET]
+    review_ids = [row['object_id'] for row in rows if row['kind'] == feed.REVIEW]
+    reviewed = models.Review.objects.filter(user=user).filter(
+        Q(ticket_id__in=ticket_ids)
+        | Q(ticket_id__in=models.Review.objects.filter(
+            pk__in=review_ids).values('ticket_id'))
+    ).values_list('ticket_id', flat=True)
+    return {ticket_id async for ticket_id in reviewed}
+
+
+async def viewer(request):
+    """
+    Return the authenticated user, and make it request.user for the templates.
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+async def render_feed(request, user, template_name, feed_rows, show_edit):
+    """
+    Paginate a feed, with the tickets of the page the user reviewed, and render it.
+    """
+    page_obj, (reviewed,) = await feed.apaginate_feed(
+        request, feed_rows, also=[partial(areviewed_ticket_ids, user)])
+    return await sync_to_async(render)(request, template_name, {
+        'page_obj': page_obj,
+        'reviewed_ticket_ids': reviewed,
+        'show_edit': show_edit,
+    })
+
+
+@login_required
+@query_budget(7)
+async def home(request):
+    """
+    Async version of views.home.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: Renders 'blog/home.html' with context
+        {'page_obj', 'reviewed_ticket_ids'}.
+    """
+    user = await viewer(request)
+    # Without the feed store, the social graph may have to be read.
+    feed_rows = await sync_to_async(feed.home_feed)(user)
+    return await render_feed(request, user, 'blog/home.html', feed_rows, show_edit=False)
+
+
+@login_required
+@query_budget(7)
+async def display_posts(request):
+    """
+    Async version of views.display_posts.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: Renders 'blog/posts.html' with context
+        {'page_obj', 'reviewed_ticket_ids'}.
+    """
+    user = await viewer(request)
+    feed_rows = partial(
+        feed.merged_feed,
+        models.Ticket.objects.filter(user=user),
+        models.Review.objects.filter(user=user))
+    return await render_feed(request, user, 'blog/posts.html', feed_rows, show_edit=True)
+
+
+async def get_or_404(queryset, **lookup):
+    """
+    Async get_object_or_404().
+    """
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+@login_required
+@query_budget(7)
+async def view_ticket(request, ticket_id):
+    """
+    Async version of views.view_ticket.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        ticket_id (int): Primary key of the ticket to view.
+
+    Returns:
+        HttpResponse: Renders 'blog/view_ticket.html' with
+        {'ticket', 'reviewed_ticket_ids', 'page_obj', 'order', 'page_params'}.
+    """
+    user = await viewer(request)
+    graph = await sync_to_async(social.get_graph)(user)
+    order = feed.review_order(request)
+    ticket = await get_or_404(models.Ticket.objects.for_cards(), id=ticket_id)
+    reviewed = await areviewed_ticket_ids(
+        user, [{'kind': feed.TICKET, 'object_id': ticket_id}])
+    page_obj = await feed.apaginate_reviews(request, ticket_id, graph.hidden)
+    return await sync_to_async(render)(request, 'blog/view_ticket.html', {
+        'ticket': ticket,
+        'reviewed_ticket_ids': reviewed,
+        'page_obj': page_obj,
+        'order': order,
+        'page_params': urlencode({'order': order}) + '&',
+        'show_edit': True,
+    })
+
+
+@login_required
+@query_budget(4)
+async def view_review(request, review_id):
+    """
+    Async version of views.view_review.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        review_id (int): Primary key of the review to view.
+
+    Returns:
+        HttpResponse: Renders 'blog/view_review.html' with
+        {'review', 'reviewed_ticket_ids'}.
+    """
+    user = await viewer(request)
+    review = await get_or_404(models.Review.objects.for_cards(), id=review_id)
+    reviewed = await areviewed_ticket_ids(
+        user, [{'kind': feed.REVIEW, 'object_id': review_id}])
+    return await sync_to_async(render)(request, 'blog/view_review.html', {
+        'review': review,
+        'reviewed_ticket_ids': reviewed,
+        'show_edit': True,
+    })
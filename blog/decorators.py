@@ -0,0 +1,61 @@
+"""
+docstring: blog/decorators.py
+Decorators shared by the views of the blog application.
+It includes:
+- query_budget: Declares the maximum number of SQL queries of a view.
+- rate_limit: Caps the requests of each user to a view, through the cache.
+"""
+import time
+from functools import wraps
+from django.core.cache import cache
+from django.http import JsonResponse
+
+
+def query_budget(max_queries):
+    """
+    Declare the maximum number of SQL queries a view may run per request.
+
+    The budget covers the whole request, session and user lookups included,
+    and must not grow with the number of items displayed. It is stored on
+    the view as ``query_budget`` and enforced by blog/tests.py.
+
+    Args:
+        max_queries (int): The maximum number of queries.
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def rate_limit(name, limit, period):
+    """
+    Answer 429 Too Many Requests to a user past limit requests to the view
+    within a window of period seconds.
+
+    Requests are counted per user and window in the Django cache, so the
+    limit holds across processes when the cache is shared. Costs no query.
+
+    Args:
+        name (str): The name of the counter, unique per view.
+        limit (int): The maximum number of requests per window.
+        period (int): The length of a window, in seconds.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            window = int(time.time() // period)
+            key = f'rate-limit:{name}:{request.user.pk}:{window}'
+            cache.add(key, 0, period)
+            try:
+                count = cache.incr(key)
+            except ValueError:
+                # Expired between add() and incr().
+                count = 1
+            if count > limit:
+                response = JsonResponse({'error': 'Trop de requêtes.'}, status=429)
+                response['Retry-After'] = str(period - int(time.time()) % period)
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,199 @@
+"""
+docstring: blog/duplicates.py
+This module finds the tickets whose title is close to a new one, so that
+users review an existing ticket rather than opening the same one again.
+It includes:
+- normalize, shingles: The character trigrams of a title, accents,
+  case and punctuation aside.
+- similarity: The Jaccard similarity of two titles' trigrams.
+- title_buckets: The locality-sensitive hash buckets of a title.
+- index_ticket, index_tickets: Store the buckets of tickets (TicketTitleBand).
+- similar_tickets: The tickets most similar to a title.
+
+Titles are compared by MinHash: NUM_BANDS bands of BAND_ROWS minimum hashes
+of their trigrams. Two titles share a band, and so a bucket, with a
+probability that rises steeply with their similarity, about one half at a
+Jaccard similarity of (1 / NUM_BANDS) ** (1 / BAND_ROWS), 0.44. A lookup
+reads the tickets of NUM_BANDS buckets through an index, then keeps the
+candidates whose actual similarity reaches MIN_SIMILARITY. At most
+BUCKET_LIMIT tickets are read per bucket, the newest, so the cost of a
+lookup depends neither on the number of tickets nor on the size of the
+buckets of common titles.
+"""
+import hashlib
+import random
+import re
+import unicodedata
+from functools import lru_cache
+from django.db import connections, router, transaction
+from . import models
+
+NUM_BANDS = 12
+BAND_ROWS = 3
+MIN_SIMILARITY = 0.5
+MAX_CANDIDATES = 50
+BUCKET_LIMIT = 50
+MAX_SUGGESTIONS = 5
+
+# Universal hashing (a * x + b) mod p, one function per minimum hash;
+# the seed is fixed, as the stored buckets depend on it.
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20261018)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+    for _ in range(NUM_BANDS * BAND_ROWS)
+]
+
+
+def normalize(title):
+    """
+    Return a title lowercased, without accents nor punctuation.
+    """
+    text = unicodedata.normalize('NFKD', title.casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'[^\W_]+', text))
+
+
+def shingles(title):
+    """
+    Return the set of character trigrams of a normalized title, words
+    padded with a space so that their first and last letters count.
+    """
+    text = f' {normalize(title)} '
+    if not text.strip():
+        return set()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(first, second):
+    """
+    Return the Jaccard similarity of the trigrams of two titles, in [0, 1].
+    """
+    first, second = shingles(first), shingles(second)
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+@lru_cache(maxsize=65536)
+def _hashes(shingle):
+    """
+    Return the NUM_BANDS * BAND_ROWS hashes of a trigram.
+    """
+    value = int.from_bytes(
+        hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big')
+    return [(a * value + b) % _PRIME for a, b in _PERMUTATIONS]
+
+
+def title_buckets(title):
+    """
+    Return the NUM_BANDS buckets of a title: for each band, a signed
+    64-bit hash of the band number and of its BAND_ROWS minimum hashes.
+
+    Returns:
+        list: The buckets, empty for a title without letters or digits.
+    """
+    hashes = [_hashes(shingle) for shingle in shingles(title)]
+    if not hashes:
+        return []
+    signature = [min(column) for column in zip(*hashes)]
+    buckets = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * BAND_ROWS:(band + 1) * BAND_ROWS]
+        digest = hashlib.blake2b(
+            repr((band, rows)).encode(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'big', signed=True))
+    return buckets
+
+
+def _bands(ticket_id, title):
+    return [
+        models.TicketTitleBand(ticket_id=ticket_id, bucket=bucket)
+        for bucket in title_buckets(title)
+    ]
+
+
+def index_ticket(ticket, created=False):
+    """
+    Store the buckets of a ticket, replacing its previous ones unless
+    it was just created.
+    """
+    bands = _bands(ticket.pk, ticket.title)
+    if created:
+        models.TicketTitleBand.objects.bulk_create(bands)
+        return
+    with transaction.atomic():
+        models.TicketTitleBand.objects.filter(ticket=ticket).delete()
+        models.TicketTitleBand.objects.bulk_create(bands)
+
+
+def index_tickets(tickets, batch_size=2000):
+    """
+    Store the buckets of tickets, in batches.
+
+    Args:
+        tickets (QuerySet): The tickets to index.
+        batch_size (int): Tickets per INSERT.
+
+    Returns:
+        int: The number of tickets indexed.
+    """
+    count = 0
+    bands = []
+    for ticket_id, title in tickets.values_list('id', 'title').iterator(batch_size):
+        bands.extend(_bands(ticket_id, title))
+        count += 1
+        if count % batch_size == 0:
+            models.TicketTitleBand.objects.bulk_create(bands)
+            bands = []
+    models.TicketTitleBand.objects.bulk_create(bands)
+    return count
+
+
+def similar_tickets(title, hidden=()):
+    """
+    Return the tickets whose title is most similar to title.
+
+    Args:
+        title (str): The title typed by the user.
+        hidden (iterable): Ids of the users whose tickets are left out.
+
+    Returns:
+        list: Up to MAX_SUGGESTIONS dicts {'id', 'title', 'similarity'},
+        most similar first.
+    """
+    buckets = title_buckets(title)
+    if not buckets:
+        return []
+    # The newest BUCKET_LIMIT tickets of each bucket, read from the
+    # covering (bucket, ticket) index, ranked by the buckets they share.
+    band_table = models.TicketTitleBand._meta.db_table
+    bucket_sql = ' UNION ALL '.join(
+        [f'SELECT * FROM (SELECT ticket_id FROM {band_table} WHERE bucket = %s '
+         f'ORDER BY ticket_id DESC LIMIT {BUCKET_LIMIT})'] * len(buckets))
+    hidden = sorted(hidden)
+    hidden_sql = ''
+    if hidden:
+        hidden_sql = f"WHERE ticket.user_id NOT IN ({', '.join(['%s'] * len(hidden))})"
+    sql = f"""
+        SELECT ticket.id, ticket.title FROM (
+            SELECT ticket_id, count(*) AS shared FROM ({bucket_sql})
+            GROUP BY ticket_id
+        ) AS candidate
+        JOIN {models.Ticket._meta.db_table} AS ticket ON ticket.id = candidate.ticket_id
+        {hidden_sql}
+        ORDER BY candidate.shared DESC, ticket.id DESC
+        LIMIT {MAX_CANDIDATES}
+    """
+    alias = router.db_for_read(models.Ticket)
+    with connections[alias].cursor() as cursor:
+        cursor.execute(sql, [*buckets, *hidden])
+        candidates = cursor.fetchall()
+    suggestions = []
+    for ticket_id, candidate in candidates:
+        score = similarity(title, candidate)
+        if score >= MIN_SIMILARITY:
+            suggestions.append({
+                'id': ticket_id, 'title': candidate, 'similarity': round(score, 2)})
+    suggestions.sort(key=lambda suggestion: -suggestion['similarity'])
+    return suggestions[:MAX_SUGGESTIONS]
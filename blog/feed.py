@@ -0,0 +1,579 @@
+"""
+docstring: blog/feed.py
+This module builds the merged ticket and review feeds inside the database.
+It includes:
+- feed_querysets: The tickets and reviews visible in a user's home feed.
+- merged_feed: A UNION of both tables ordered by creation time.
+- FeedCursor: An opaque "older than" position inside a merged feed.
+- stored_feed: The same rows read from the materialized FeedEntry store.
+- home_feed: The row source used by the home page.
+- FeedPage: One keyset page of a merged feed.
+- paginate_feed: Keyset pagination, with a ``?page=`` compatibility mode.
+- ahydrate, apaginate_feed: The same with the async ORM, for the async views.
+- ReviewCursor, ticket_reviews, paginate_reviews, apaginate_reviews: Keyset
+  pages of the reviews of a ticket, by recency or by rating.
+- push, sync_feed, rebuild_feed, check_feed: Maintenance of the FeedEntry store.
+"""
+import base64
+import binascii
+from datetime import datetime
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import CharField, F, Q, Value
+from authentication import social
+from . import models
+
+PAGE_SIZE = 6
+REVIEWS_PAGE_SIZE = 10
+# The kind is part of the sort key: at equal creation time,
+# tickets ('ticket' > 'review') come before reviews.
+TICKET = 'ticket'
+REVIEW = 'review'
+
+
+def feed_querysets(user, graph=None):
+    """
+    Return the tickets and reviews that make up the home feed of a user.
+
+    - Tickets and reviews by followed users and by the user themself.
+    - Reviews answering one of the user's tickets.
+    - Posts by users blocked by, or blocking, the user are excluded.
+
+    Args:
+        user (User): The user whose feed is built.
+        graph (SocialGraph): The cached relations of the user (see
+            authentication.social). When omitted, they are read by
+            subqueries, which always see the current relations.
+
+    Returns:
+        tuple: (tickets queryset, reviews queryset).
+    """
+    if graph is None:
+        following = Q(user__in=user.follows.all()) | Q(user=user)
+        hidden = Q(user__in=user.blocked.all()) | Q(user__in=user.blocked_by.all())
+    else:
+        following = Q(user__in=graph.follows) | Q(user=user)
+        hidden = Q(user__in=graph.hidden)
+    tickets = models.Ticket.objects.filter(following).exclude(hidden)
+    reviews = models.Review.objects.filter(
+        following | Q(ticket__user=user)
+    ).exclude(hidden)
+    return tickets, reviews
+
+
+class FeedCursor:
+    """
+    Position of a feed item, used to ask for the items older than it.
+
+    The cursor follows the feed ordering: (time_created, kind, object id),
+    all descending, which makes it unique across both tables.
+    """
+    def __init__(self, time_created, kind, id):
+        self.time_created = time_created
+        self.kind = kind
+        self.id = id
+
+    @classmethod
+    def from_instance(cls, instance):
+        """
+        Build the cursor pointing at a Ticket or Review instance.
+        """
+        kind = TICKET if isinstance(instance, models.Ticket) else REVIEW
+        return cls(instance.time_created, kind, instance.id)
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Build the cursor pointing at a feed row.
+        """
+        return cls(row['time_created'], row['kind'], row['object_id'])
+
+    def encode(self):
+        """
+        Return the cursor as an URL-safe string.
+        """
+        raw = f'{self.time_created.isoformat()}|{self.kind}|{self.id}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, value):
+        """
+        Parse a string built by encode(); return None if it is missing or invalid.
+        """
+        if not value:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+            time_created, kind, id = raw.decode().split('|')
+            cursor = cls(datetime.fromisoformat(time_created), kind, int(id))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+        if cursor.kind not in (TICKET, REVIEW) or cursor.time_created.tzinfo is None:
+            return None
+        return cursor
+
+    def older(self, kind):
+        """
+        Return the Q filter selecting rows of the given kind older than the cursor.
+        """
+        older = Q(time_created__lt=self.time_created)
+        if kind == self.kind:
+            older |= Q(time_created=self.time_created, id__lt=self.id)
+        elif kind < self.kind:
+            older |= Q(time_created=self.time_created)
+        return older
+
+    def older_entries(self):
+        """
+        Return the Q filter selecting FeedEntry rows older than the cursor.
+        """
+        return (
+            Q(time_created__lt=self.time_created)
+            | Q(time_created=self.time_created, kind__lt=self.kind)
+            | Q(time_created=self.time_created, kind=self.kind,
+                object_id__lt=self.id)
+        )
+
+
+ORDERING = ('-time_created', '-kind', '-object_id')
+
+
+def _rows(queryset, kind, cursor):
+    """
+    Return the (time_created, kind, object_id) rows of a queryset, older than cursor.
+    """
+    if cursor is not None:
+        queryset = queryset.filter(cursor.older(kind))
+    return queryset.order_by().annotate(
+        kind=Value(kind, output_field=CharField()),
+        object_id=F('id'),
+    ).values('time_created', 'kind', 'object_id')
+
+
+def merged_feed(tickets, reviews, cursor=None):
+    """
+    Merge tickets and reviews with a database-side UNION.
+
+    Args:
+        tickets (QuerySet): Tickets to include.
+        reviews (QuerySet): Reviews to include.
+        cursor (FeedCursor): Only keep the items older than this position.
+
+    Returns:
+        QuerySet: Dicts with 'time_created', 'kind' and 'object_id', newest first.
+    """
+    return _rows(tickets, TICKET, cursor).union(
+        _rows(reviews, REVIEW, cursor), all=True
+    ).order_by(*ORDERING)
+
+
+def stored_feed(user, cursor=None):
+    """
+    Read the home feed of a user from the FeedEntry store.
+
+    Args:
+        user (User): The owner of the feed.
+        cursor (FeedCursor): Only keep the items older than this position.
+
+    Returns:
+        QuerySet: Dicts with 'time_created', 'kind' and 'object_id', newest first.
+    """
+    entries = models.FeedEntry.objects.filter(owner=user)
+    if cursor is not None:
+        entries = entries.filter(cursor.older_entries())
+    return entries.order_by(*ORDERING).values(
+        'time_created', 'kind', 'object_id')
+
+
+def home_feed(user):
+    """
+    Return the row source of the home feed of a user, for paginate_feed().
+
+    Reads the FeedEntry store, unless settings.BLOG_FEED_STORE is False,
+    in which case the feed is merged from the live tables.
+    """
+    if getattr(settings, 'BLOG_FEED_STORE', True):
+        return partial(stored_feed, user)
+    return partial(merged_feed, *feed_querysets(user, social.get_graph(user)))
+
+
+def hydrate(rows):
+    """
+    Replace feed rows with their model instances.
+
+    Uses one query per table, whatever the number of rows, with the
+    relations rendered by the cards already loaded. Rows whose post was
+    deleted since they were read are skipped.
+    """
+    rows = list(rows)
+    ids = {TICKET: [], REVIEW: []}
+    for row in rows:
+        ids[row['kind']].append(row['object_id'])
+    instances = {
+        TICKET: models.Ticket.objects.for_cards().in_bulk(ids[TICKET]),
+        REVIEW: models.Review.objects.for_cards().in_bulk(ids[REVIEW]),
+    }
+    return _present(rows, instances)
+
+
+def _present(rows, instances):
+    """
+    Return the instances of rows, in order, leaving out the missing ones.
+    """
+    found = (instances[row['kind']].get(row['object_id']) for row in rows)
+    return [instance for instance in found if instance is not None]
+
+
+class FeedPage:
+    """
+    One keyset page of a merged feed.
+
+    Attributes:
+        object_list (list): Tickets and reviews of the page, newest first.
+        next_cursor (str): Encoded cursor of the next page, or None.
+        is_first (bool): Whether the page is the head of the feed.
+    """
+    paginator = None
+
+    def __init__(self, object_list, next_cursor, is_first):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.is_first = is_first
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        """
+        Return True if older items exist after this page.
+        """
+        return self.next_cursor is not None
+
+
+def paginate_feed(request, feed_rows, per_page=PAGE_SIZE):
+    """
+    Return the page of the feed asked for by the request.
+
+    - ``?before=<cursor>``: keyset page of the items older than the cursor,
+      the cost of a page does not depend on its depth.
+    - ``?page=<n>``: compatibility mode for numbered links, using Paginator
+      with LIMIT/OFFSET on the same rows.
+    - No parameter: the first keyset page.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        feed_rows (callable): Takes a FeedCursor, or None, and returns the
+            rows older than it (see merged_feed and stored_feed).
+        per_page (int): Number of items per page.
+
+    Returns:
+        FeedPage | Page: The page, iterable over Ticket and Review instances.
+    """
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        paginator = Paginator(feed_rows(None), per_page)
+        page_obj = paginator.get_page(page_number)
+        page_obj.object_list = hydrate(page_obj.object_list)
+        return page_obj
+    cursor = FeedCursor.decode(request.GET.get('before'))
+    rows = list(feed_rows(cursor)[:per_page + 1])
+    object_list = hydrate(rows[:per_page])
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = FeedCursor.from_row(rows[per_page - 1]).encode()
+    return FeedPage(object_list, next_cursor, is_first=cursor is None)
+
+
+async def ahydrate(rows):
+    """
+    Async version of hydrate().
+    """
+    ids = {TICKET: [], REVIEW: []}
+    for row in rows:
+        ids[row['kind']].append(row['object_id'])
+    tickets = await models.Ticket.objects.for_cards().ain_bulk(ids[TICKET])
+    reviews = await models.Review.objects.for_cards().ain_bulk(ids[REVIEW])
+    return _present(rows, {TICKET: tickets, REVIEW: reviews})
+
+
+async def apaginate_feed(request, feed_rows, per_page=PAGE_SIZE, also=()):
+    """
+    Async version of paginate_feed().
+
+    Once the rows of the page are known, they are hydrated, then passed
+    to the coroutines of also.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        feed_rows (callable): Takes a FeedCursor, or None, and returns the
+            rows older than it (see merged_feed and stored_feed).
+        per_page (int): Number of items per page.
+        also (iterable): Coroutine functions taking the list of rows of the
+            page, e.g. a lookup of the tickets already reviewed.
+
+    Returns:
+        tuple: (FeedPage | Page, list of the results of also).
+    """
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        paginator = Paginator(feed_rows(None), per_page)
+        page_obj = await sync_to_async(paginator.get_page)(page_number)
+        rows = await sync_to_async(list)(page_obj.object_list)
+    else:
+        page_obj = None
+        cursor = FeedCursor.decode(request.GET.get('before'))
+        rows = [row async for row in feed_rows(cursor)[:per_page + 1]]
+    page_rows = rows[:per_page]
+    object_list = await ahydrate(page_rows)
+    results = [await func(page_rows) for func in also]
+    if page_obj is not None:
+        page_obj.object_list = object_list
+        return page_obj, results
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = FeedCursor.from_row(rows[per_page - 1]).encode()
+    return FeedPage(object_list, next_cursor, is_first=cursor is None), results
+
+
+# Sort keys of the reviews of a ticket, each served by an index of Review.
+REVIEW_ORDERINGS = {
+    'recent': ('-time_created', '-id'),
+    'rating': ('-rating', '-time_created', '-id'),
+}
+
+
+class ReviewCursor:
+    """
+    Position of a review in the reviews of a ticket, used to ask for the
+    reviews after it in one of REVIEW_ORDERINGS (all keys descending).
+    """
+    def __init__(self, order, rating, time_created, id):
+        self.order = order
+        self.rating = rating
+        self.time_created = time_created
+        self.id = id
+
+    @classmethod
+    def from_instance(cls, order, review):
+        """
+        Build the cursor pointing at a Review instance.
+        """
+        return cls(order, review.rating, review.time_created, review.id)
+
+    def encode(self):
+        """
+        Return the cursor as an URL-safe string.
+        """
+        raw = f'{self.order}|{self.rating}|{self.time_created.isoformat()}|{self.id}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, value, order):
+        """
+        Parse a string built by encode() for the given order; return None
+        if it is missing, invalid or built for another order.
+        """
+        if not value:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+            cursor_order, rating, time_created, id = raw.decode().split('|')
+            cursor = cls(cursor_order, int(rating),
+                         datetime.fromisoformat(time_created), int(id))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+        if cursor.order != order or cursor.time_created.tzinfo is None:
+            return None
+        return cursor
+
+    def after(self):
+        """
+        Return the Q filter selecting the reviews after the cursor.
+
+        The redundant upper bound on the first key lets the index range
+        start at the cursor instead of at the first review of the ticket.
+        """
+        older = (
+            Q(time_created__lt=self.time_created)
+            | Q(time_created=self.time_created, id__lt=self.id)
+        )
+        if self.order == 'recent':
+            return Q(time_created__lte=self.time_created) & older
+        return Q(rating__lte=self.rating) & (
+            Q(rating__lt=self.rating) | (Q(rating=self.rating) & older))
+
+
+def ticket_reviews(ticket_id, hidden, order, cursor=None):
+    """
+    Return the reviews of a ticket in the given order, with their authors.
+
+    Args:
+        ticket_id (int): The reviewed ticket.
+        hidden (iterable): Ids of the users whose reviews are left out,
+            those blocked by, or blocking, the viewer.
+        order (str): A key of REVIEW_ORDERINGS.
+        cursor (ReviewCursor): Only keep the reviews after this position.
+
+    Returns:
+        QuerySet: The reviews.
+    """
+    reviews = models.Review.objects.filter(
+        ticket_id=ticket_id).exclude(user__in=hidden).select_related('user')
+    if cursor is not None:
+        reviews = reviews.filter(cursor.after())
+    return reviews.order_by(*REVIEW_ORDERINGS[order])
+
+
+def review_order(request):
+    """
+    Return the order of the reviews asked for by ``?order=``, 'recent' by default.
+    """
+    order = request.GET.get('order')
+    return order if order in REVIEW_ORDERINGS else 'recent'
+
+
+def _review_page(reviews, order, per_page, cursor):
+    next_cursor = None
+    if len(reviews) > per_page:
+        next_cursor = ReviewCursor.from_instance(order, reviews[per_page - 1]).encode()
+    return FeedPage(reviews[:per_page], next_cursor, is_first=cursor is None)
+
+
+def paginate_reviews(request, ticket_id, hidden, per_page=REVIEWS_PAGE_SIZE):
+    """
+    Return the keyset page of the reviews of a ticket asked for by the
+    request: ``?order=recent|rating`` and ``?before=<cursor>``.
+
+    A page is one range scan of the index of the order, whatever its depth.
+
+    Returns:
+        FeedPage: The reviews of the page.
+    """
+    order = review_order(request)
+    cursor = ReviewCursor.decode(request.GET.get('before'), order)
+    reviews = list(ticket_reviews(ticket_id, hidden, order, cursor)[:per_page + 1])
+    return _review_page(reviews, order, per_page, cursor)
+
+
+async def apaginate_reviews(request, ticket_id, hidden, per_page=REVIEWS_PAGE_SIZE):
+    """
+    Async version of paginate_reviews().
+    """
+    order = review_order(request)
+    cursor = ReviewCursor.decode(request.GET.get('before'), order)
+    reviews = [review async for review in
+               ticket_reviews(ticket_id, hidden, order, cursor)[:per_page + 1]]
+    return _review_page(reviews, order, per_page, cursor)
+
+
+def _entries(owner_id, tickets, reviews):
+    """
+    Yield the FeedEntry objects of owner_id for the given tickets and reviews.
+    """
+    for ticket in tickets.values('id', 'user_id', 'time_created'):
+        yield models.FeedEntry(
+            owner_id=owner_id, author_id=ticket['user_id'], kind=TICKET,
+            ticket_id=ticket['id'], object_id=ticket['id'],
+            time_created=ticket['time_created'])
+    for review in reviews.values('id', 'user_id', 'time_created'):
+        yield models.FeedEntry(
+            owner_id=owner_id, author_id=review['user_id'], kind=REVIEW,
+            review_id=review['id'], object_id=review['id'],
+            time_created=review['time_created'])
+
+
+def recipients(post):
+    """
+    Return the ids of the users whose home feed shows a new ticket or review.
+
+    The author, their followers and, for a review, the owner of the reviewed
+    ticket; minus the users blocked by, or blocking, the author.
+    """
+    author = post.user
+    owners = set(author.followers.values_list('id', flat=True))
+    owners.add(author.id)
+    if isinstance(post, models.Review):
+        owners.add(post.ticket.user_id)
+    owners.difference_update(social.get_graph(author).hidden)
+    return owners
+
+
+def push(post):
+    """
+    Fan a newly created ticket or review out to the feeds that show it.
+
+    Returns:
+        set: The ids of the owners of those feeds.
+    """
+    kind = TICKET if isinstance(post, models.Ticket) else REVIEW
+    owner_ids = recipients(post)
+    models.FeedEntry.objects.bulk_create([
+        models.FeedEntry(
+            owner_id=owner_id, author_id=post.user_id, kind=kind,
+            ticket=post if kind == TICKET else None,
+            review=post if kind == REVIEW else None,
+            object_id=post.id, time_created=post.time_created)
+        for owner_id in owner_ids
+    ], ignore_conflicts=True)
+    return owner_ids
+
+
+def sync_feed(owner_ids, author_ids):
+    """
+    Rebuild the entries of some authors inside the feeds of some owners.
+
+    Called when follows or blocks change between them: the entries are
+    pruned, then backfilled from the live feed query.
+
+    Args:
+        owner_ids (iterable): Ids of the users whose feed is updated.
+        author_ids (iterable): Ids of the authors whose posts are re-synced.
+    """
+    author_ids = list(author_ids)
+    User = get_user_model()
+    with transaction.atomic():
+        for owner in User.objects.filter(pk__in=owner_ids):
+            models.FeedEntry.objects.filter(
+                owner=owner, author__in=author_ids).delete()
+            tickets, reviews = feed_querysets(owner)
+            models.FeedEntry.objects.bulk_create(_entries(
+                owner.id,
+                tickets.filter(user__in=author_ids),
+                reviews.filter(user__in=author_ids),
+            ), ignore_conflicts=True)
+
+
+def rebuild_feed(owner):
+    """
+    Rebuild the whole feed of a user from the live feed query.
+    """
+    with transaction.atomic():
+        models.FeedEntry.objects.filter(owner=owner).delete()
+        models.FeedEntry.objects.bulk_create(
+            _entries(owner.id, *feed_querysets(owner)))
+
+
+def check_feed(owner):
+    """
+    Compare the stored feed of a user with the live feed query.
+
+    Returns:
+        tuple: (missing, extra) sets of (kind, object_id) pairs; missing
+        items are in the live feed only, extra items in the store only.
+    """
+    live = {
+        (row['kind'], row['object_id'])
+        for row in merged_feed(*feed_querysets(owner))
+    }
+    stored = {
+        (row['kind'], row['object_id'])
+        for row in stored_feed(owner)
+    }
+    return live - stored, stored - live
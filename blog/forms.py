@@ -9,8 +9,12 @@ It includes:
 - DeleteReviewForm: For confirming review deletion.
 - UnfollowUsersForm: For confirming unfollowing a user.
 """
+from pathlib import PurePosixPath
 from django import forms
 from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from litrevu.storage import ContentAddressedStorage
 from . import models
 
 User = get_user_model()
@@ -29,7 +33,9 @@ class FollowUsersForm(forms.ModelForm):
     username = forms.CharField(widget=forms.TextInput(
         attrs={
             'class': 'form-control',
-            "placeholder": "Nom d'utilisateur"}),
+            "placeholder": "Nom d'utilisateur",
+            'list': 'username-suggestions',
+            'autocomplete': 'off'}),
         label=""
     )
 
@@ -86,11 +92,14 @@ class TicketForm(forms.ModelForm):
         title (CharField): Title of the ticket.
         description (Textarea): Detailed description of the ticket.
         image (ClearableFileInput): Optional image upload for the ticket.
+        pending_image (HiddenInput): Storage name of an image uploaded with
+            a previous submission of the form (see keep_image).
     """
     edit_ticket = forms.BooleanField(
         widget=forms.HiddenInput,
         initial=True
         )
+    pending_image = forms.CharField(widget=forms.HiddenInput, required=False)
 
     class Meta:
         """
@@ -124,6 +133,44 @@ class TicketForm(forms.ModelForm):
             }
             }
 
+    def clean_pending_image(self):
+        """
+        Return the pending image name if it names a stored upload; ignore
+        any other value.
+        """
+        name = self.cleaned_data['pending_image']
+        storage = self.instance.image.storage
+        if ContentAddressedStorage.is_content_name(name) and storage.exists(name):
+            return name
+        return ''
+
+    def clean(self):
+        """
+        Use the pending image as the upload when no file was sent again.
+        """
+        cleaned_data = super().clean()
+        name = cleaned_data.get('pending_image')
+        if name and not cleaned_data.get('image'):
+            with self.instance.image.storage.open(name) as file:
+                cleaned_data['image'] = ContentFile(file.read(), name=PurePosixPath(name).name)
+        return cleaned_data
+
+    def keep_image(self):
+        """
+        Store the uploaded image and carry its name in pending_image, for
+        a form rendered again after a valid submission (e.g. to confirm a
+        duplicate): browsers do not send file inputs again.
+
+        The image is stored as uploaded; the ticket processes it when it
+        is saved, and the view releases the pending file afterwards.
+        """
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return
+        self.data = self.data.copy()
+        self.data[self.add_prefix('pending_image')] = self.instance.image.storage.save(
+            image.name, image)
+
 
 class DeleteTicketForm(forms.Form):
     """
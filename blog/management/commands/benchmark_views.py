@@ -0,0 +1,169 @@
+"""
+Management command measuring the main views through the test client.
+
+Usage:
+    python manage.py benchmark_views [--requests N] [--users N] [--view NAME ...]
+        [--output FILE] [--compare FILE] [--seed N]
+
+Each view is requested --requests times, as users sampled among those with
+the most posts in their feed. The report gives, per view, the latency
+percentiles, the number of queries and the peak of memory allocated
+while rendering. Latencies are measured without query capture or memory
+tracing; those are measured on separate requests.
+With --output, the results are saved as JSON; with --compare, the p50
+and p95 latencies are compared with a previously saved run.
+"""
+import json
+import platform
+import random
+import time
+import tracemalloc
+from urllib.parse import urlencode
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from blog import models
+from litrevu import metrics
+
+# Requests per view used to count queries and trace memory.
+TRACED_REQUESTS = 5
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the home, posts, ticket, follow and search pages.
+    """
+    help = "Measure the latency, queries and memory of the main views."
+
+    VIEWS = ('home', 'display_posts', 'view_ticket', 'follow_users', 'search')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help="Requests per view (default: 50).")
+        parser.add_argument('--users', type=int, default=10,
+                            help="Number of users the requests are spread over (default: 10).")
+        parser.add_argument('--view', action='append', dest='views', choices=self.VIEWS,
+                            help="Only benchmark this view (repeatable).")
+        parser.add_argument('--output', metavar='FILE',
+                            help="Save the results as JSON.")
+        parser.add_argument('--compare', metavar='FILE',
+                            help="Compare with the JSON results of a previous run.")
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Seed of the random generator (default: 0).")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        users = list(get_user_model().objects.annotate(
+            entries=Count('feed_entries')
+        ).order_by('-entries', 'pk')[:max(options['users'], 1)])
+        tickets = list(models.Ticket.objects.order_by(
+            '-time_created').values_list('id', 'title')[:1000])
+        ticket_ids = [ticket_id for ticket_id, title in tickets]
+        if not users or not ticket_ids:
+            raise CommandError(
+                "No data to benchmark; see the generate_dataset command.")
+        self.clients = []
+        for user in users:
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            self.clients.append(client)
+        urls = {
+            'home': lambda: reverse('home'),
+            'display_posts': lambda: reverse('posts'),
+            'view_ticket': lambda: reverse(
+                'view-ticket', args=[self.random.choice(ticket_ids)]),
+            'follow_users': lambda: reverse('follow_users'),
+            # Searches for the title of a recent ticket, as typed so far.
+            'search': lambda: reverse('search') + '?' + urlencode({
+                'q': self.random.choice(tickets)[1][:self.random.randint(4, 16)]}),
+        }
+        results = {
+            'meta': {
+                'date': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'users': get_user_model().objects.count(),
+                'tickets': models.Ticket.objects.count(),
+                'reviews': models.Review.objects.count(),
+                'requests': options['requests'],
+            },
+            'views': {},
+        }
+        for name in options['views'] or self.VIEWS:
+            results['views'][name] = self.measure(urls[name], options['requests'])
+            self.report(name, results['views'][name])
+        if options['compare']:
+            self.compare(results, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results saved to {options['output']}."))
+
+    def request(self, url_for):
+        """
+        Request a URL as a random user; return the response.
+        """
+        response = self.random.choice(self.clients).get(url_for())
+        if response.status_code != 200:
+            raise CommandError(f"{response.request['PATH_INFO']} returned {response.status_code}.")
+        return response
+
+    def measure(self, url_for, count):
+        """
+        Return the latency summary, query counts and memory peak of a view.
+        """
+        self.request(url_for)
+        durations = []
+        for _ in range(count):
+            start = time.perf_counter()
+            self.request(url_for)
+            durations.append(time.perf_counter() - start)
+        queries, peaks = [], []
+        for _ in range(TRACED_REQUESTS):
+            with CaptureQueriesContext(connection) as captured:
+                tracemalloc.start()
+                self.request(url_for)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            queries.append(len(captured))
+        return {
+            **metrics.summarize(durations),
+            'queries_max': max(queries),
+            'peak_memory_kb': round(max(peaks) / 1024, 1),
+        }
+
+    def report(self, name, result):
+        """
+        Print the results of one view.
+        """
+        self.stdout.write(
+            f"{name:<14} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"p99 {result['p99_ms']:8.2f} ms  {result['queries_max']:3d} queries  "
+            f"{result['peak_memory_kb']:8.1f} KB peak")
+
+    def compare(self, results, path):
+        """
+        Print the relative change of the p50 and p95 latencies against a saved run.
+        """
+        try:
+            with open(path, encoding='utf-8') as file:
+                baseline = json.load(file)['views']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f"Cannot read {path}: {error}")
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Compared with {path}:"))
+        for name, result in results['views'].items():
+            if name not in baseline:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'queries_max'):
+                before, after = baseline[name][key], result[key]
+                change = (after - before) / before * 100 if before else 0
+                changes.append(f"{key} {before} -> {after} ({change:+.0f}%)")
+            self.stdout.write(f"{name:<14} " + ", ".join(changes))
@@ -0,0 +1,37 @@
+"""
+Management command building the resized variants of ticket images.
+
+Usage:
+    python manage.py build_image_variants [--force]
+
+Tickets saved before the variants existed only have their original image;
+this command records its hash and size and writes its WebP and JPEG
+variants. With --force, every ticket image is processed again.
+"""
+from django.core.management.base import BaseCommand
+from blog.models import Ticket
+
+
+class Command(BaseCommand):
+    """
+    Process the ticket images stored before their variants existed.
+    """
+    help = "Build the WebP and JPEG variants of ticket images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Rebuild the variants of every ticket, even up-to-date ones.")
+
+    def handle(self, *args, **options):
+        count = 0
+        tickets = Ticket.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            tickets = tickets.filter(image_processed=False)
+        for ticket in tickets.iterator():
+            if not ticket.image.storage.exists(ticket.image.name):
+                self.stderr.write(f"Ticket {ticket.pk}: missing file {ticket.image.name}")
+                continue
+            ticket.process_stored_image()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} ticket image(s) processed."))
@@ -0,0 +1,50 @@
+"""
+Management command compacting the review counters of the trending page
+(TicketActivity).
+
+Usage:
+    python manage.py compact_trending [--rebuild | --check]
+
+The counters are updated by signals when a review is created or deleted,
+one bucket per ticket and hour. Run this command daily: it rolls the
+hourly buckets of the days before yesterday into daily buckets, and
+deletes the buckets older than the 7-day window. With --rebuild, the
+buckets are first recounted from the reviews, e.g. after reviews were
+written in bulk. With --check, the counters of the 7-day window are
+compared with the reviews and the command fails if any differ.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from blog import trending
+
+
+class Command(BaseCommand):
+    """
+    Compact, rebuild or check the trending counters.
+    """
+    help = "Roll the hourly review counters of the trending page into daily ones."
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument(
+            '--rebuild', action='store_true',
+            help="Recount the buckets from the reviews before compacting them.")
+        group.add_argument(
+            '--check', action='store_true',
+            help="Compare the counters of the 7-day window with the reviews.")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            broken = trending.check()
+            if broken:
+                shown = ', '.join(str(pk) for pk in broken[:10])
+                raise CommandError(
+                    f"{len(broken)} ticket(s) with inconsistent counters: {shown}"
+                    + (", ..." if len(broken) > 10 else "") + ".")
+            self.stdout.write(self.style.SUCCESS("All trending counters are consistent."))
+            return
+        if options['rebuild']:
+            count = trending.rebuild()
+            self.stdout.write(f"{count} hourly buckets recounted.")
+        rolled, deleted = trending.compact()
+        self.stdout.write(self.style.SUCCESS(
+            f"{rolled} hourly buckets rolled up, {deleted} buckets deleted."))
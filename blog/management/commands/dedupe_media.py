@@ -0,0 +1,166 @@
+"""
+Management command moving existing media files to content-addressed names.
+
+Usage:
+    python manage.py dedupe_media [--dry-run] [--delete-orphans]
+
+Every file referenced by Ticket.image and User.profile_photo is re-saved
+through ContentAddressedStorage, and the rows are rewritten to the new
+names. Copies of the same content (e.g. 'cover.jpg' and
+'cover_NMfYUX3.jpg') end up as one file, and the old files are deleted
+once nothing references them. Variants not named after their source
+(see litrevu.storage.family) are built again from it.
+With --delete-orphans, media files referenced by no row are deleted too.
+"""
+import os
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from litrevu.storage import (
+    MEDIA_REFERENCES, ContentAddressedStorage, delete_unreferenced, family,
+    is_claimed, reference_count)
+
+
+def rename(value, mapping):
+    """
+    Return value with every string found in mapping replaced, recursively.
+    """
+    if isinstance(value, dict):
+        return {key: rename(item, mapping) for key, item in value.items()}
+    if isinstance(value, list):
+        return [rename(item, mapping) for item in value]
+    if isinstance(value, str):
+        return mapping.get(value, value)
+    return value
+
+
+def strings(value):
+    """
+    Return the strings found in a JSON value, recursively.
+    """
+    if isinstance(value, dict):
+        return [s for item in value.values() for s in strings(item)]
+    if isinstance(value, list):
+        return [s for item in value for s in strings(item)]
+    return [value] if isinstance(value, str) else []
+
+
+def walk(storage, path=''):
+    """
+    Yield the names of all the files of a storage, recursively.
+    """
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield os.path.join(path, name) if path else name
+    for directory in directories:
+        yield from walk(storage, os.path.join(path, directory) if path else directory)
+
+
+class Command(BaseCommand):
+    """
+    Rewrite media references to content-addressed names and reclaim duplicates.
+    """
+    help = "Move media files to content-addressed names and delete duplicates."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report what would change without writing anything.")
+        parser.add_argument(
+            '--delete-orphans', action='store_true',
+            help="Also delete the media files that no row references.")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError(
+                "The default storage is not a ContentAddressedStorage.")
+        self.dry_run = options['dry_run']
+        self.mapping = {}
+        self.stale = set()
+        rebuilt = 0
+        for label, file_field, variants_field, rebuild in MEDIA_REFERENCES:
+            rebuilt += self.rewrite(
+                apps.get_model(label), file_field, variants_field, rebuild)
+        moved = {old: new for old, new in self.mapping.items() if old != new}
+        self.stdout.write(
+            f"{len(moved)} file(s) moved to "
+            f"{len(set(moved.values()))} content-addressed file(s), "
+            f"variants of {rebuilt} row(s) rebuilt.")
+        old_names = set(moved) | self.stale
+        if options['delete_orphans']:
+            old_names.update(walk(default_storage))
+        reclaimed = self.delete_unreferenced(old_names)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(self.mapping) + len(self.stale)} file(s) checked, "
+            f"{len(reclaimed)} deleted ({sum(reclaimed) / 1024:.0f} KB reclaimed)."))
+
+    def relocate(self, name):
+        """
+        Return the content-addressed name of a stored file, saving it there.
+        """
+        if name in self.mapping:
+            return self.mapping[name]
+        new_name = name
+        if not name or ContentAddressedStorage.is_content_name(name) \
+                or ContentAddressedStorage.is_variant_name(name):
+            pass
+        elif not default_storage.exists(name):
+            self.stderr.write(f"Missing file: {name}")
+        elif self.dry_run:
+            with default_storage.open(name) as file:
+                new_name = default_storage.content_name(name, file)
+        else:
+            with default_storage.open(name) as file:
+                new_name = default_storage.save(name, file)
+        self.mapping[name] = new_name
+        return new_name
+
+    def rewrite(self, model, file_field, variants_field, rebuild):
+        """
+        Point the file field of every row to its content name, and rebuild
+        the variants not named after it with the model method rebuild.
+
+        Returns:
+            int: The number of rows whose variants are rebuilt.
+        """
+        rows = model._default_manager.exclude(**{file_field: ''}).exclude(
+            **{f'{file_field}__isnull': True}
+        ).order_by('pk').values_list('pk', file_field, variants_field)
+        rebuilt = 0
+        for pk, name, variants in rows.iterator():
+            new_name = self.relocate(name)
+            key = family(new_name)
+            stale = [old for old in strings(variants)
+                     if old != name and family(old) != key] if key else []
+            self.stale.update(stale)
+            rebuilt += bool(stale)
+            if self.dry_run:
+                continue
+            if new_name != name:
+                with transaction.atomic():
+                    model._default_manager.filter(pk=pk).update(**{
+                        file_field: new_name,
+                        variants_field: rename(variants, {name: new_name}),
+                    })
+            if stale:
+                getattr(model._default_manager.get(pk=pk), rebuild)()
+        return rebuilt
+
+    def delete_unreferenced(self, names):
+        """
+        Delete the given files that no row references, except those claimed
+        by an upload (see litrevu.storage); return their sizes.
+        """
+        sizes = []
+        for name in sorted(names):
+            if (reference_count(name) or not default_storage.exists(name)
+                    or is_claimed(default_storage, name)):
+                continue
+            size = default_storage.size(name)
+            if self.dry_run:
+                self.stdout.write(f"Would delete {name}")
+            elif not delete_unreferenced(default_storage, name):
+                continue
+            sizes.append(size)
+        return sizes
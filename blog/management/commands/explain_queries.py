@@ -0,0 +1,78 @@
+"""
+Management command printing the query plans and timings of the hot queries.
+
+Usage:
+    python manage.py explain_queries [--user USERNAME] [--repeat N]
+
+For one user (by default, the author of the most tickets), the queries
+behind the posts page, the home feed and the "already reviewed" checks
+are explained with the database's EXPLAIN, and run --repeat times to
+report their median duration. Run it before and after a schema change
+to compare the plans.
+"""
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from blog import feed, models
+
+
+class Command(BaseCommand):
+    """
+    Explain and time the queries of the feed and posts pages.
+    """
+    help = "Print the query plans and timings of the feed and posts queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', dest='username', metavar='USERNAME',
+            help="Run the queries for this user (default: the most active author).")
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help="Number of runs of each query for the timing (default: 5).")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.annotate(
+                tickets=Count('ticket')).order_by('-tickets').first()
+        if user is None:
+            raise CommandError("No such user.")
+        self.repeat = max(options['repeat'], 1)
+        self.stdout.write(
+            f"User {user.username}: {models.Ticket.objects.count()} tickets, "
+            f"{models.Review.objects.count()} reviews in the database.")
+        page = feed.PAGE_SIZE + 1
+        tickets = models.Ticket.objects.filter(user=user)
+        reviews = models.Review.objects.filter(user=user)
+        ticket_ids = list(models.Ticket.objects.order_by(
+            '-time_created').values_list('id', flat=True)[:feed.PAGE_SIZE])
+        queries = {
+            'posts page': feed.merged_feed(tickets, reviews)[:page],
+            'live home feed page': feed.merged_feed(*feed.feed_querysets(user))[:page],
+            'stored home feed page': feed.stored_feed(user)[:page],
+            'reviewed tickets of a page': models.Review.objects.filter(
+                user=user, ticket_id__in=ticket_ids).values_list('ticket_id', flat=True),
+            'review of a ticket by a user': models.Review.objects.filter(
+                ticket_id=ticket_ids[0] if ticket_ids else 0, user=user
+            ).values_list('id', flat=True)[:1],
+        }
+        for name, queryset in queries.items():
+            self.explain(name, queryset)
+
+    def explain(self, name, queryset):
+        """
+        Print the plan of a queryset and the median duration of its evaluation.
+        """
+        durations = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            durations.append(time.perf_counter() - start)
+        median = statistics.median(durations) * 1000
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{name} ({median:.2f} ms)"))
+        for line in queryset.explain().splitlines():
+            self.stdout.write(f"  {line}")
@@ -0,0 +1,264 @@
+"""
+Management command generating a synthetic dataset for benchmarks.
+
+Usage:
+    python manage.py generate_dataset [--users N] [--tickets N] [--reviews N]
+        [--follows N] [--exponent X] [--block-rate X] [--image-rate X]
+        [--images N] [--days N] [--prefix PREFIX] [--seed N]
+
+Creates users named '<prefix>_000000', ... (password 'password'), a
+power-law follow graph (a few users are followed by many), some blocks,
+tickets, a share of them with placeholder images, and reviews.
+Rows are written with bulk_create, which bypasses the signals, so the
+derived data is rebuilt afterwards by REPAIR_COMMANDS.
+"""
+import random
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from PIL import Image, ImageDraw
+from authentication import social
+from blog import models
+from litrevu import images
+
+# Commands rebuilding what the signals maintain for rows saved one by one.
+REPAIR_COMMANDS = (
+    ('rebuild_feed', {}),
+    ('rebuild_title_index', {}),
+    ('rebuild_review_stats', {}),
+    ('compact_trending', {'rebuild': True}),
+)
+
+
+class Command(BaseCommand):
+    """
+    Generate users, follows, blocks, tickets and reviews in bulk.
+    """
+    help = "Generate a synthetic social graph, tickets and reviews for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500,
+                            help="Number of users (default: 500).")
+        parser.add_argument('--tickets', type=int, default=5000,
+                            help="Number of tickets (default: 5000).")
+        parser.add_argument('--reviews', type=int, default=10000,
+                            help="Number of reviews (default: 10000).")
+        parser.add_argument('--follows', type=int, default=20,
+                            help="Mean number of users followed by a user (default: 20).")
+        parser.add_argument('--exponent', type=float, default=1.1,
+                            help="Zipf exponent of the users' popularity (default: 1.1).")
+        parser.add_argument('--block-rate', type=float, default=0.02,
+                            help="Share of the users blocking someone (default: 0.02).")
+        parser.add_argument('--image-rate', type=float, default=0.3,
+                            help="Share of the tickets with an image (default: 0.3).")
+        parser.add_argument('--images', type=int, default=12,
+                            help="Number of distinct placeholder images (default: 12).")
+        parser.add_argument('--days', type=int, default=365,
+                            help="Posts are spread over this many past days (default: 365).")
+        parser.add_argument('--prefix', default='synthetic',
+                            help="Prefix of the generated usernames (default: 'synthetic').")
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Seed of the random generator (default: 0).")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Rows per INSERT (default: 1000).")
+
+    def handle(self, *args, **options):
+        self.User = get_user_model()
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        if options['users'] < 2:
+            raise CommandError("At least 2 users are needed.")
+        if self.User.objects.filter(username__startswith=f'{self.prefix}_').exists():
+            raise CommandError(
+                f"Users named '{self.prefix}_*' already exist; use another --prefix.")
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options['days'])
+
+        user_ids = self.create_users(options['users'])
+        weights = self.popularity(user_ids, options['exponent'])
+        follows = self.create_follows(user_ids, weights, options['follows'])
+        blocks = self.create_blocks(user_ids, options['block_rate'])
+        ticket_ids = self.create_tickets(
+            user_ids, weights, options['tickets'],
+            options['image_rate'], options['images'])
+        reviews = self.create_reviews(user_ids, weights, ticket_ids, options['reviews'])
+        self.stdout.write(
+            f"{len(user_ids)} users, {follows} follows, {blocks} blocks, "
+            f"{len(ticket_ids)} tickets, {reviews} reviews created.")
+
+        social.invalidate(user_ids)
+        for name, command_options in REPAIR_COMMANDS:
+            call_command(name, stdout=self.stdout, **command_options)
+        self.stdout.write(self.style.SUCCESS("Dataset generated."))
+
+    def bulk_create(self, model, objects):
+        """
+        Insert objects in batches; return the number of objects given.
+        """
+        objects = list(objects)
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True)
+        return len(objects)
+
+    def timestamps(self, count):
+        """
+        Return count random creation times between start and now, ascending.
+        """
+        span = (self.now - self.start).total_seconds()
+        return sorted(
+            self.start + timedelta(seconds=self.random.uniform(0, span))
+            for _ in range(count))
+
+    def create_users(self, count):
+        """
+        Create the users and return their ids.
+        """
+        password = make_password('password')
+        self.bulk_create(self.User, (
+            self.User(username=f'{self.prefix}_{i:06d}', password=password)
+            for i in range(count)))
+        return list(self.User.objects.filter(
+            username__startswith=f'{self.prefix}_'
+        ).order_by('username').values_list('id', flat=True))
+
+    def popularity(self, user_ids, exponent):
+        """
+        Return a Zipf weight per user (in user_ids order), the most popular
+        users being spread at random among the ids.
+        """
+        ranks = list(range(1, len(user_ids) + 1))
+        self.random.shuffle(ranks)
+        return [rank ** -exponent for rank in ranks]
+
+    def create_follows(self, user_ids, weights, mean):
+        """
+        Give every user a Pareto-distributed number of follows, towards
+        users picked by popularity; return the number of follows.
+        """
+        Follow = self.User.follows.through
+        pairs = set()
+        for user_id in user_ids:
+            # paretovariate(1.5) has a mean of 3.
+            degree = min(round(self.random.paretovariate(1.5) * mean / 3),
+                         len(user_ids) - 1)
+            targets = self.random.choices(user_ids, weights, k=degree)
+            pairs.update((user_id, target) for target in targets if target != user_id)
+        return self.bulk_create(Follow, (
+            Follow(from_user_id=from_id, to_user_id=to_id) for from_id, to_id in pairs))
+
+    def create_blocks(self, user_ids, rate):
+        """
+        Make a share of the users block one to three random users;
+        return the number of blocks.
+        """
+        Block = self.User.blocked.through
+        pairs = set()
+        for user_id in self.random.sample(user_ids, round(len(user_ids) * rate)):
+            for target in self.random.sample(user_ids, 3)[:self.random.randint(1, 3)]:
+                if target != user_id:
+                    pairs.add((user_id, target))
+        return self.bulk_create(Block, (
+            Block(from_user_id=from_id, to_user_id=to_id) for from_id, to_id in pairs))
+
+    def placeholder(self, index):
+        """
+        Return the bytes of a JPEG placeholder image, different for each index.
+        """
+        rng = random.Random(index)
+        size = (rng.choice([600, 800, 1200]), rng.choice([800, 1000, 1600]))
+        image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            box = sorted(rng.randrange(size[0]) for _ in range(2))
+            height = sorted(rng.randrange(size[1]) for _ in range(2))
+            draw.rectangle([box[0], height[0], box[1], height[1]],
+                           fill=tuple(rng.randrange(256) for _ in range(3)))
+        return images.encode_as(image, 'JPEG')
+
+    def image_templates(self, user_ids, count):
+        """
+        Create one ticket per placeholder image through Ticket.save, which
+        stores and processes the image; return them.
+        """
+        templates = []
+        for index in range(count):
+            ticket = models.Ticket(
+                title=f'Placeholder {index}', user_id=self.random.choice(user_ids))
+            ticket.image = ContentFile(self.placeholder(index), name=f'placeholder{index}.jpg')
+            ticket.save()
+            templates.append(ticket)
+        return templates
+
+    def create_tickets(self, user_ids, weights, count, image_rate, image_count):
+        """
+        Create the tickets, by authors picked by popularity; a share of
+        them reuse the stored placeholder images. Return their ids.
+        """
+        templates = self.image_templates(user_ids, min(image_count, count))
+        authors = self.random.choices(user_ids, weights, k=count - len(templates))
+        tickets = []
+        for i, author_id in enumerate(authors):
+            ticket = models.Ticket(
+                title=f'Livre {i}', description=f'Recherche une critique du livre {i}.',
+                user_id=author_id)
+            if templates and self.random.random() < image_rate:
+                template = self.random.choice(templates)
+                ticket.image = template.image.name
+                for field in models.Ticket.IMAGE_METADATA_FIELDS:
+                    setattr(ticket, field, getattr(template, field))
+            tickets.append(ticket)
+        self.bulk_create(models.Ticket, tickets)
+        ticket_ids = [ticket.pk for ticket in templates] + list(
+            models.Ticket.objects.filter(
+                user_id__in=user_ids, title__startswith='Livre '
+            ).order_by('id').values_list('id', flat=True))
+        self.spread(models.Ticket, ticket_ids, self.timestamps(len(ticket_ids)))
+        return ticket_ids
+
+    def create_reviews(self, user_ids, weights, ticket_ids, count):
+        """
+        Create at most count reviews, one per user and ticket at most, by
+        reviewers picked by popularity; return the number created.
+        """
+        ticket_times = dict(models.Ticket.objects.filter(
+            pk__in=ticket_ids).values_list('id', 'time_created'))
+        reviewers = self.random.choices(user_ids, weights, k=count)
+        pairs = {}
+        for reviewer_id in reviewers:
+            ticket_id = self.random.choice(ticket_ids)
+            delay = (self.now - ticket_times[ticket_id]).total_seconds()
+            pairs[ticket_id, reviewer_id] = (
+                ticket_times[ticket_id]
+                + timedelta(seconds=self.random.uniform(0, delay)))
+        created = self.bulk_create(models.Review, (
+            models.Review(
+                ticket_id=ticket_id, user_id=reviewer_id,
+                rating=self.random.randint(1, 5), headline='Critique',
+                body='Une critique générée pour les mesures de performance.')
+            for ticket_id, reviewer_id in pairs))
+        rows = models.Review.objects.filter(
+            user_id__in=user_ids, ticket_id__in=ticket_ids
+        ).values_list('id', 'ticket_id', 'user_id')
+        ids, times = [], []
+        for pk, ticket_id, user_id in rows.iterator():
+            if (ticket_id, user_id) in pairs:
+                ids.append(pk)
+                times.append(pairs[ticket_id, user_id])
+        self.spread(models.Review, ids, times)
+        return created
+
+    def spread(self, model, ids, times):
+        """
+        Set the creation and update times of rows; bulk_create cannot, as
+        auto_now_add overrides them.
+        """
+        objects = [
+            model(pk=pk, time_created=time, update_at=time)
+            for pk, time in zip(ids, times)]
+        model.objects.bulk_update(
+            objects, ['time_created', 'update_at'], batch_size=self.batch_size)
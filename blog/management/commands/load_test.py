@@ -0,0 +1,224 @@
+"""
+Management command running a concurrent load test against the site.
+
+Usage:
+    python manage.py load_test [--url URL] [--workers N] [--processes N]
+        [--server wsgi|asgi] [--server-threads N]
+        [--duration SECONDS] [--mix browse=60,post=15,review=15,follow=10]
+        [--prefix PREFIX] [--password PASSWORD] [--output FILE]
+
+Without --url, the site is served in-process on the configured database:
+with --server wsgi (the default), litrevu.wsgi.application by a wsgiref
+server with --server-threads threads; with --server asgi, the ASGI
+application with the async views of litrevu.asgi_urls, by uvicorn.
+With --url, an already running server is targeted. --workers simulated users per process
+log in as random '<prefix>_*' users (see generate_dataset) and run
+sessions picked from --mix until --duration is over.
+The report gives the throughput, latency percentiles per action, error
+rate and the number of "database is locked" errors.
+"""
+import json
+import logging
+import multiprocessing
+import sys
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import got_request_exception
+from django.db import OperationalError
+from django.test.utils import override_settings
+from litrevu import loadtest, writes
+
+DEFAULT_MIX = 'browse=60,post=15,review=15,follow=10'
+
+
+def parse_mix(value):
+    """
+    Parse 'browse=60,post=15' into {'browse': 60.0, 'post': 15.0}.
+    """
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in loadtest.SESSIONS:
+            raise CommandError(
+                f"Unknown session '{name}'; choose among {', '.join(loadtest.SESSIONS)}.")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight in '{item}'.")
+    return mix
+
+
+class Command(BaseCommand):
+    """
+    Load the site with concurrent scripted sessions and report the results.
+    """
+    help = "Run concurrent user sessions against the site and report latency and errors."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url',
+                            help="Base URL of a running server (default: serve the app in-process).")
+        parser.add_argument('--workers', type=int, default=8,
+                            help="Concurrent simulated users per process (default: 8).")
+        parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi',
+                            help="In-process server: wsgiref with a thread pool, or "
+                                 "uvicorn with the async views (default: wsgi).")
+        parser.add_argument('--server-threads', type=int, default=16,
+                            help="Threads of the in-process server (default: 16).")
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Client processes, each running --workers threads (default: 1).")
+        parser.add_argument('--duration', type=float, default=30,
+                            help="Seconds of load (default: 30).")
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help=f"Weights of the sessions (default: {DEFAULT_MIX}).")
+        parser.add_argument('--prefix', default='synthetic',
+                            help="Prefix of the usernames to log in as (default: 'synthetic').")
+        parser.add_argument('--password', default='password',
+                            help="Password of those users (default: 'password').")
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Seed of the random generators (default: 0).")
+        parser.add_argument('--output', metavar='FILE',
+                            help="Save the report as JSON.")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        usernames = list(get_user_model().objects.filter(
+            username__startswith=f"{options['prefix']}_"
+        ).values_list('username', flat=True))
+        if not usernames:
+            raise CommandError(
+                f"No '{options['prefix']}_*' users; see the generate_dataset command.")
+        context = {
+            'usernames': usernames,
+            'password': options['password'],
+            'images': [loadtest.sample_image(seed) for seed in range(8)],
+        }
+        server = None
+        base_url = options['url']
+        request_logger = logging.getLogger('django.request')
+        log_level = request_logger.level
+        urlconf = None
+        if base_url is None:
+            server, base_url, urlconf = self.serve(options)
+            # Errors are counted in the report instead of logged one by one.
+            request_logger.setLevel(logging.CRITICAL)
+        self.server_locked = 0
+        got_request_exception.connect(self.count_locked)
+        self.stdout.write(
+            f"{options['processes']} x {options['workers']} workers against "
+            f"{base_url} for {options['duration']:g} s "
+            f"(database profile: {settings.DB_PROFILE}"
+            + (f", {options['server']} server" if server is not None else "")
+            + ")...")
+        try:
+            records, elapsed, failures = self.run(base_url, context, mix, options)
+        finally:
+            got_request_exception.disconnect(self.count_locked)
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+                request_logger.setLevel(log_level)
+            if urlconf is not None:
+                urlconf.disable()
+        results = loadtest.report(records, elapsed)
+        results['failed_logins'] = failures
+        if server is not None:
+            results['server'] = options['server']
+            results['server_locked'] = self.server_locked
+            results['write_queue'] = writes.stats()
+            results['database'] = {
+                'profile': settings.DB_PROFILE,
+                'pragmas': settings.SQLITE_PRAGMAS,
+                'conn_max_age': settings.DATABASES['default'].get('CONN_MAX_AGE', 0),
+            }
+        self.print_report(results)
+        if options['output']:
+            results['options'] = {
+                key: options[key] for key in (
+                    'url', 'server', 'workers', 'processes', 'duration', 'mix', 'seed')}
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report saved to {options['output']}."))
+
+    def serve(self, options):
+        """
+        Start the in-process server chosen by --server.
+
+        Returns:
+            tuple: (server, base URL, the override_settings enabled for the
+            ASGI URLs, or None).
+        """
+        if options['server'] == 'wsgi':
+            from litrevu.wsgi import application
+            server, base_url = loadtest.serve(
+                application, threads=options['server_threads'])
+            return server, base_url, None
+        from django.core.asgi import get_asgi_application
+        from blog.streams import with_event_streams
+        urlconf = override_settings(ROOT_URLCONF='litrevu.asgi_urls')
+        urlconf.enable()
+        try:
+            server, base_url = loadtest.serve_asgi(
+                with_event_streams(get_asgi_application()))
+        except ImportError:
+            urlconf.disable()
+            raise CommandError("--server asgi needs uvicorn: pip install uvicorn.")
+        return server, base_url, urlconf
+
+    def run(self, base_url, context, mix, options):
+        """
+        Run the workers in this process, or in --processes client processes.
+
+        Returns:
+            tuple: (request records, elapsed seconds, failed logins).
+        """
+        args = [
+            (base_url, context, mix, options['workers'], options['duration'],
+             options['seed'] + index)
+            for index in range(options['processes'])]
+        if options['processes'] == 1:
+            return loadtest.run_workers(*args[0])
+        spawn = multiprocessing.get_context('spawn')
+        with spawn.Pool(options['processes']) as pool:
+            start = time.perf_counter()
+            results = pool.map(loadtest.run_process, args)
+            elapsed = time.perf_counter() - start
+        records = [record for rows, _ in results for record in rows]
+        return records, elapsed, sum(failures for _, failures in results)
+
+    def count_locked(self, sender, request=None, **kwargs):
+        """
+        Count the "database is locked" errors raised by the in-process server.
+        """
+        error = sys.exc_info()[1]
+        if isinstance(error, OperationalError) and loadtest.LOCKED in str(error):
+            self.server_locked += 1
+
+    def print_report(self, results):
+        """
+        Print the totals, then one line per action.
+        """
+        self.stdout.write(
+            f"{results['requests']} requests in {results['elapsed_s']} s: "
+            f"{results['throughput_rps']} req/s, error rate {results['error_rate']}, "
+            f"{results['locked']} 'database is locked' responses"
+            + (f" ({results['server_locked']} raised in the server)"
+               if 'server_locked' in results else "")
+            + f", {results['failed_logins']} failed logins.")
+        if 'write_queue' in results:
+            queue = results['write_queue']
+            self.stdout.write(
+                f"Write queue: {queue['admitted']} writes admitted, max depth "
+                f"{queue['max_depth']}, wait p50 {queue['wait_p50_ms']} ms / "
+                f"p95 {queue['wait_p95_ms']} ms, {queue['retries']} retries, "
+                f"{queue['failures']} failures.")
+        self.stdout.write(
+            f"{'action':<20} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'p99 ms':>9} {'errors':>7} {'locked':>7}")
+        for action, row in results['actions'].items():
+            self.stdout.write(
+                f"{action:<20} {row['count']:>6} {row['p50_ms']:>9.2f} "
+                f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+                f"{row['errors']:>7} {row['locked']:>7}")
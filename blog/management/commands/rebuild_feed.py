@@ -0,0 +1,57 @@
+"""
+Management command rebuilding the materialized home feeds (FeedEntry).
+
+Usage:
+    python manage.py rebuild_feed [--check] [--user USERNAME ...]
+
+Without --check, every feed is rebuilt from the live feed query.
+With --check, the stored feeds are compared to the live query and the
+command fails if any of them differ.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from blog import feed
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the FeedEntry store, or check its consistency.
+    """
+    help = "Rebuild the materialized home feeds, or check their consistency."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Compare the stored feeds with the live query without changing them.")
+        parser.add_argument(
+            '--user', action='append', dest='usernames', metavar='USERNAME',
+            help="Only handle this user (repeatable).")
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        if options['check']:
+            self.check_feeds(users)
+            return
+        count = 0
+        for user in users.iterator():
+            feed.rebuild_feed(user)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} feeds rebuilt."))
+
+    def check_feeds(self, users):
+        """
+        Report the users whose stored feed differs from the live query.
+        """
+        broken = 0
+        for user in users.iterator():
+            missing, extra = feed.check_feed(user)
+            if missing or extra:
+                broken += 1
+                self.stdout.write(
+                    f"{user.username}: {len(missing)} missing, "
+                    f"{len(extra)} extra")
+        if broken:
+            raise CommandError(f"{broken} inconsistent feed(s).")
+        self.stdout.write(self.style.SUCCESS("All feeds are consistent."))
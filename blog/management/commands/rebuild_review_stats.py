@@ -0,0 +1,40 @@
+"""
+Management command recomputing the review aggregates of the tickets
+(review_count, rating_sum, rating_1 to rating_5).
+
+Usage:
+    python manage.py rebuild_review_stats [--check]
+
+The aggregates are updated by signals when a review is saved or deleted;
+reviews written in bulk or by queryset updates need this command.
+Without --check, every ticket is recomputed from its reviews in one UPDATE.
+With --check, the stored aggregates are compared with the reviews and
+the command fails if any differ.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from blog import ratings
+
+
+class Command(BaseCommand):
+    """
+    Recompute the review aggregates of the tickets, or check them.
+    """
+    help = "Recompute the review counts and ratings of the tickets, or check them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Compare the stored aggregates with the reviews without changing them.")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            broken = ratings.check_aggregates()
+            if broken:
+                shown = ', '.join(str(pk) for pk in broken[:10])
+                raise CommandError(
+                    f"{len(broken)} ticket(s) with inconsistent aggregates: {shown}"
+                    + (", ..." if len(broken) > 10 else "") + ".")
+            self.stdout.write(self.style.SUCCESS("All review aggregates are consistent."))
+            return
+        count = ratings.rebuild_aggregates()
+        self.stdout.write(self.style.SUCCESS(f"{count} tickets updated."))
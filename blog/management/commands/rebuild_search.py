@@ -0,0 +1,47 @@
+"""
+Management command rebuilding the full-text search index (blog_search).
+
+Usage:
+    python manage.py rebuild_search [--check]
+
+The index is kept in sync by triggers; rebuilding it is only needed
+after it was altered by hand, after a migration dropped the triggers, or
+to merge its segments after a bulk load.
+Without --check, the missing triggers are created and the index is
+filled again from the tickets and reviews.
+With --check, the index is compared with them and the command fails if
+they differ.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from blog import search
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the search index, or check its consistency.
+    """
+    help = "Rebuild the full-text search index, or check its consistency."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Compare the index with the tickets and reviews without changing it.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The search index requires SQLite (FTS5).")
+        if options['check']:
+            triggers = search.missing_triggers()
+            if triggers:
+                raise CommandError(
+                    f"Missing search index triggers: {', '.join(triggers)}; "
+                    "run rebuild_search.")
+            missing, extra = search.check()
+            if missing or extra:
+                raise CommandError(
+                    f"Inconsistent search index: {missing} missing, {extra} extra.")
+            self.stdout.write(self.style.SUCCESS("The search index is consistent."))
+            return
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{count} posts indexed."))
@@ -0,0 +1,31 @@
+"""
+Management command rebuilding the title buckets of the tickets
+(TicketTitleBand), used by the near-duplicate suggestions.
+
+Usage:
+    python manage.py rebuild_title_index [--batch-size N]
+
+The buckets are stored by a signal when a ticket is saved; tickets
+created in bulk, or before the index existed, need this command.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blog import duplicates, models
+
+
+class Command(BaseCommand):
+    """
+    Compute the title buckets of every ticket again.
+    """
+    help = "Rebuild the title index of the near-duplicate ticket suggestions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Tickets per INSERT (default: 2000).")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            models.TicketTitleBand.objects.all().delete()
+            count = duplicates.index_tickets(
+                models.Ticket.objects.order_by('pk'), options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{count} ticket titles indexed."))
@@ -0,0 +1,60 @@
+"""
+Management command copying the primary SQLite database to its replicas.
+
+Usage:
+    python manage.py sync_replicas [--alias ALIAS ...]
+
+Each replica of settings.DATABASE_REPLICAS is overwritten with the
+SQLite online backup API: the copy is a consistent snapshot of the
+primary, even while it is written to, and readers of the replica see
+either the old or the new content. Run it every minute (e.g. from cron):
+the default stickiness window of litrevu.replicas, 90 seconds, covers
+that period and the copy; change both together.
+"""
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    """
+    Refresh the SQLite replicas from the primary database.
+    """
+    help = "Copy the primary SQLite database to the read replicas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--alias', action='append', dest='aliases',
+            help="Only refresh this replica (repeatable).")
+
+    def handle(self, *args, **options):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            raise CommandError(
+                "No replica configured; set LITREVU_DB_REPLICAS, e.g. to 2.")
+        aliases = options['aliases'] or replicas
+        unknown = set(aliases) - set(replicas)
+        if unknown:
+            raise CommandError(f"Unknown replicas: {', '.join(sorted(unknown))}.")
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("Only SQLite databases can be copied.")
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in aliases:
+                start = time.perf_counter()
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    # A replica can be copied again: skip the fsyncs.
+                    target.execute('PRAGMA synchronous = OFF')
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(
+                    f"{alias}: copied in {(time.perf_counter() - start) * 1000:.0f} ms.")
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Replicas synchronized: {', '.join(aliases)}."))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_review_update_at_ticket_update_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ticket', 'Billet'), ('review', 'Critique')], max_length=6)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('time_created', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+                ('review', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.review')),
+                ('ticket', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.ticket')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-time_created', '-kind', '-object_id'], name='feed_entry_page_idx'), models.Index(fields=['owner', 'author'], name='feed_entry_author_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'kind', 'object_id'), name='unique_feed_entry')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def delete_duplicate_reviews(apps, schema_editor):
+    """
+    Keep one review per (ticket, user), the most recently updated one,
+    so that the unique constraint can be created.
+    """
+    Review = apps.get_model('blog', 'Review')
+    pairs = Review.objects.values('ticket_id', 'user_id').annotate(
+        count=models.Count('id')).filter(count__gt=1)
+    for pair in pairs:
+        reviews = Review.objects.filter(
+            ticket_id=pair['ticket_id'], user_id=pair['user_id']
+        ).order_by('-update_at', '-id')
+        Review.objects.filter(
+            pk__in=list(reviews.values_list('id', flat=True)[1:])).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_ticket_image_metadata'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user', '-time_created'], name='review_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['user', '-time_created'], name='ticket_user_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('ticket', 'user'), name='unique_review_per_user'),
+        ),
+    ]
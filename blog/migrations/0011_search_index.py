@@ -0,0 +1,99 @@
+# Generated by Django 5.2.1 on 2026-10-18 22:00
+
+from django.db import migrations
+
+# Full-text index of the tickets and reviews (see blog/search.py).
+# rowid is 2 * id for a ticket and 2 * id + 1 for a review, so the
+# triggers reach the row of a post without a lookup; user_id is stored,
+# unindexed, to leave out the authors the viewer does not see. The
+# prefix indexes serve the last word of a search, matched as a prefix.
+CREATE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE blog_search USING fts5(
+        title, body, user_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )
+    """,
+    # Titles and headlines weigh ten times the descriptions and bodies.
+    "INSERT INTO blog_search (blog_search, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    """
+    CREATE TRIGGER blog_search_ticket_insert AFTER INSERT ON blog_ticket BEGIN
+        INSERT INTO blog_search (rowid, title, body, user_id)
+        VALUES (new.id * 2, new.title, new.description, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER blog_search_ticket_update
+    AFTER UPDATE OF title, description, user_id ON blog_ticket BEGIN
+        UPDATE blog_search
+        SET title = new.title, body = new.description, user_id = new.user_id
+        WHERE rowid = new.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER blog_search_ticket_delete AFTER DELETE ON blog_ticket BEGIN
+        DELETE FROM blog_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER blog_search_review_insert AFTER INSERT ON blog_review BEGIN
+        INSERT INTO blog_search (rowid, title, body, user_id)
+        VALUES (new.id * 2 + 1, new.headline, new.body, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER blog_search_review_update
+    AFTER UPDATE OF headline, body, user_id ON blog_review BEGIN
+        UPDATE blog_search
+        SET title = new.headline, body = new.body, user_id = new.user_id
+        WHERE rowid = new.id * 2 + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER blog_search_review_delete AFTER DELETE ON blog_review BEGIN
+        DELETE FROM blog_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+    """
+    INSERT INTO blog_search (rowid, title, body, user_id)
+    SELECT id * 2, title, description, user_id FROM blog_ticket
+    """,
+    """
+    INSERT INTO blog_search (rowid, title, body, user_id)
+    SELECT id * 2 + 1, headline, body, user_id FROM blog_review
+    """,
+]
+
+DROP_INDEX = [
+    'DROP TRIGGER IF EXISTS blog_search_ticket_insert',
+    'DROP TRIGGER IF EXISTS blog_search_ticket_update',
+    'DROP TRIGGER IF EXISTS blog_search_ticket_delete',
+    'DROP TRIGGER IF EXISTS blog_search_review_insert',
+    'DROP TRIGGER IF EXISTS blog_search_review_update',
+    'DROP TRIGGER IF EXISTS blog_search_review_delete',
+    'DROP TABLE IF EXISTS blog_search',
+]
+
+
+def run_on_sqlite(statements):
+    """
+    Return a RunPython function executing statements on SQLite only:
+    FTS5 and these triggers are specific to it.
+    """
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in statements:
+                schema_editor.execute(statement, params=None)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_review_unique_and_time_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_INDEX), run_on_sqlite(DROP_INDEX)),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketTitleBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField()),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='title_bands', to='blog.ticket')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket', 'ticket'], name='ticket_title_bucket_idx')],
+            },
+        ),
+    ]
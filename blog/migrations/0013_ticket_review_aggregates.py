@@ -0,0 +1,83 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:52
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+from blog import search
+
+
+def create_search_triggers(apps, schema_editor):
+    """
+    Create the search index triggers again: on SQLite, adding or removing
+    the fields copies blog_ticket into a new table, without its triggers.
+    """
+    if schema_editor.connection.vendor == 'sqlite':
+        search.create_triggers(schema_editor.connection)
+
+
+def compute_aggregates(apps, schema_editor):
+    """
+    Count the existing reviews of every ticket.
+    """
+    Ticket = apps.get_model('blog', 'Ticket')
+    Review = apps.get_model('blog', 'Review')
+    reviews = Review.objects.filter(
+        ticket=models.OuterRef('pk')).order_by().values('ticket')
+
+    def aggregate(queryset, expression):
+        return Coalesce(
+            models.Subquery(queryset.annotate(value=expression).values('value')),
+            models.Value(0), output_field=models.IntegerField())
+
+    Ticket.objects.update(
+        review_count=aggregate(reviews, models.Count('pk')),
+        rating_sum=aggregate(reviews, models.Sum('rating')),
+        **{f'rating_{rating}': aggregate(reviews.filter(rating=rating), models.Count('pk'))
+           for rating in range(1, 6)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_ticket_title_bands'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, create_search_triggers),
+        migrations.AddField(
+            model_name='ticket',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(compute_aggregates, migrations.RunPython.noop),
+        migrations.RunPython(create_search_triggers, migrations.RunPython.noop),
+    ]
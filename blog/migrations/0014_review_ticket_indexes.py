@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:55
+
+from django.db import migrations, models
+
+# Plain indexes: unlike AddField, AddIndex does not remake the table on
+# SQLite, so the search triggers of 0011 are kept.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_ticket_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['ticket', '-time_created', '-id'], name='review_ticket_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['ticket', '-rating', '-time_created', '-id'], name='review_ticket_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_review_ticket_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('hours', models.PositiveSmallIntegerField(default=1)),
+                ('reviews', models.IntegerField(default=0)),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='blog.ticket')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket', 'ticket', 'reviews'], name='ticket_activity_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ticket', 'bucket', 'hours'), name='unique_ticket_activity')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 22:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_ticket_activity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['image'], name='ticket_image_idx'),
+        ),
+    ]
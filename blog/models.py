@@ -7,47 +7,276 @@ It includes:
   description, optional image, and timestamps.
 - Review: Represents a user's review of a Ticket,
   including a rating, headline, optional body, and timestamps.
-Both models handle image resizing and validation for ratings.
+- FeedEntry: A ticket or review materialized in the home feed of a user.
+- TicketTitleBand: A locality-sensitive hash bucket of a ticket's title.
+- TicketActivity: The reviews of a ticket during one hour or one day.
+- TicketQuerySet, ReviewQuerySet: Eager loading shared by the views.
+Both models handle image resizing and validation for ratings;
+tickets also keep resized WebP and JPEG variants of their image.
 """
+from io import BytesIO
+from django.core.files.base import ContentFile
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.conf import settings
 from django.db import models
 from PIL import Image
+from litrevu import images, storage
+
+class TicketQuerySet(models.QuerySet):
+    """
+    QuerySet of tickets, with the eager loading needed by the templates.
+    """
+    def for_cards(self):
+        """
+        Load the relations rendered by ticket_snippet.html (the author).
+        """
+        return self.select_related('user')
+
+
+class ReviewQuerySet(models.QuerySet):
+    """
+    QuerySet of reviews, with the eager loading needed by the templates.
+    """
+    def for_cards(self):
+        """
+        Load the relations rendered by review_snippet.html: the author,
+        the reviewed ticket and the ticket's author.
+        """
+        return self.select_related('user', 'ticket', 'ticket__user')
+
 
-# Create your models here.
 class Ticket(models.Model):
     """
     Represents a user-created ticket containing a title, description,
     optional image, and timestamps for creation and last update.
 
+    The review count, rating sum and rating histogram (rating_1 to
+    rating_5) summarize the ticket's reviews without querying them.
+
     Methods:
-        resize_image(): Resize the uploaded image to fit within IMAGE_MAX_SIZE.
+        prepare_image(): Resize, store and build the variants of a new upload.
+        resize_image(): Downscale a new upload and record its hash and size.
+        generate_image_variants(): Write the resized WebP and JPEG variants.
+        process_stored_image(): Do both for an image stored before them.
     """
     title = models.CharField(max_length=128)
     description = models.CharField(max_length=2048, blank=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     image = models.ImageField(blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_processed = models.BooleanField(default=False, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
     time_created = models.DateTimeField(auto_now_add=True)
     update_at = models.DateTimeField(auto_now=True)
     IMAGE_MAX_SIZE = (800, 800)
+    IMAGE_VARIANT_WIDTHS = (200, 800)
+    CARD_IMAGE_WIDTH = 200
+    IMAGE_METADATA_FIELDS = (
+        'image_variants', 'image_hash', 'image_width', 'image_height',
+        'image_processed')
+    # Kept up to date by blog.signals with F() updates, never by save().
+    REVIEW_AGGREGATE_FIELDS = (
+        'review_count', 'rating_sum',
+        'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5')
 
-    def resize_image(self):
+    # Set by prepare_image until the row is saved.
+    _image_prepared = False
+
+    # Title the ticket's buckets were computed from (see blog.duplicates);
+    # None when unknown.
+    indexed_title = None
+
+    objects = TicketQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the title the loaded ticket is indexed with.
+        """
+        instance = super().from_db(db, field_names, values)
+        if 'title' not in instance.get_deferred_fields():
+            instance.indexed_title = instance.title
+        return instance
+
+    class Meta:
+        """
+        Meta class to define the indexes of the feed and posts pages, and
+        of the media reference counts (see litrevu.storage.reference_count).
+        """
+        indexes = [
+            models.Index(fields=['user', '-time_created'], name='ticket_user_time_idx'),
+            models.Index(fields=['image'], name='ticket_image_idx'),
+        ]
+
+    def prepare_image(self):
         """
-        Resize the uploaded image to fit within IMAGE_MAX_SIZE,
-        preserving aspect ratio.
+        Process a new upload before the row is saved: resize and store it,
+        then write its variants. Does nothing if the image did not change.
+
+        Runs no query, so that views do it before their write rather than
+        while holding the write lock (see litrevu.writes); save() calls it
+        otherwise.
         """
-        if not self.image:
+        if not self.image or self.image._committed:
             return
-        image = Image.open(self.image)
-        image.thumbnail(self.IMAGE_MAX_SIZE)
-        image.save(self.image.path)
+        self.resize_image()
+        if not self.image._committed:
+            self.image.save(self.image.name, self.image.file, save=False)
+        self.generate_image_variants()
+        self._image_prepared = True
+
+    def resize_image(self):
+        """
+        Resize the newly uploaded image to fit within IMAGE_MAX_SIZE,
+        preserving aspect ratio, and record its content hash and size.
+
+        Runs once per upload, before the file is stored, so the image is
+        re-encoded at most once. Images that already fit, and every image
+        when settings.TICKET_IMAGE_KEEP_ORIGINAL is True, are stored as uploaded.
+        """
+        self.image.seek(0)
+        data = self.image.read()
+        image = images.open_image(BytesIO(data))
+        too_large = (image.width > self.IMAGE_MAX_SIZE[0]
+                     or image.height > self.IMAGE_MAX_SIZE[1])
+        if too_large and not getattr(settings, 'TICKET_IMAGE_KEEP_ORIGINAL', False):
+            image.thumbnail(self.IMAGE_MAX_SIZE)
+            data = images.encode_as(image, Image.open(BytesIO(data)).format)
+            self.image.save(self.image.name, ContentFile(data), save=False)
+        self.image_hash = images.content_hash(data)
+        self.image_width, self.image_height = image.size
+        self.image_variants = {}
+        self.image_processed = False
+
+    def generate_image_variants(self):
+        """
+        Write a WebP and a JPEG copy of the stored image for each
+        IMAGE_VARIANT_WIDTHS, record them in image_variants and mark
+        the image as processed. The row is not saved.
+        """
+        with self.image.open('rb'):
+            source = images.open_image(self.image)
+        self.image_variants = {
+            'source': self.image.name,
+            'sizes': images.save_variants(
+                self.image.storage, self.image.name,
+                source, self.IMAGE_VARIANT_WIDTHS),
+        }
+        self.image_processed = True
+
+    def process_stored_image(self):
+        """
+        Record the hash and size, and build the variants, of an image
+        stored before they existed (see the build_image_variants command),
+        and save them.
+        """
+        with self.image.open('rb'):
+            data = self.image.read()
+        image = images.open_image(BytesIO(data))
+        self.image_hash = images.content_hash(data)
+        self.image_width, self.image_height = image.size
+        self.generate_image_variants()
+        Ticket.objects.filter(pk=self.pk).update(**{
+            field: getattr(self, field) for field in self.IMAGE_METADATA_FIELDS
+        })
+
+    def media_names(self):
+        """
+        Return the storage names of the image and of its variants.
+        """
+        names = [self.image.name] if self.image else []
+        for variant in self.image_variants.get('sizes', {}).values():
+            names.extend(variant[ext] for ext in images.FORMATS)
+        return names
+
+    @property
+    def average_rating(self):
+        """
+        Return the mean rating of the reviews, or None without reviews.
+        """
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+    @property
+    def rating_histogram(self):
+        """
+        Return the number of reviews per rating, as (rating, count) pairs
+        from 1 to 5.
+        """
+        return [(rating, getattr(self, f'rating_{rating}')) for rating in range(1, 6)]
+
+    @property
+    def card_image(self):
+        """
+        Return the JPEG variant shown on cards, as a dict with 'url',
+        'width' and 'height'; None if the variants were not built.
+        """
+        variant = self.image_variants.get('sizes', {}).get(str(self.CARD_IMAGE_WIDTH))
+        if variant is None:
+            return None
+        return {
+            'url': self.image.storage.url(variant['jpg']),
+            'width': variant['width'],
+            'height': variant['height'],
+        }
+
+    @property
+    def image_srcset(self):
+        """
+        Return the srcset attribute of the variants, for each extension.
+
+        Example: {'webp': '/media/a_200.webp 200w, /media/a_800.webp 800w', 'jpg': ...}
+        """
+        sizes = self.image_variants.get('sizes', {}).values()
+        return {
+            ext: ', '.join(
+                f"{self.image.storage.url(variant[ext])} {variant['width']}w"
+                for variant in sizes)
+            for ext in images.FORMATS
+        }
 
     def save(self, *args, **kwargs):
         """
-        Override save method to ensure image resizing after initial save.
+        Override save method to process the image only when it changes.
+
+        A new upload is processed by prepare_image, unless the caller
+        already did; a cleared image resets the image metadata. The files
+        of a replaced or cleared image are released (see litrevu.storage).
+        Saves that do not touch the image (title or description edits)
+        skip image work. Updates never write the review aggregates, which
+        the instance may hold stale values of.
         """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.REVIEW_AGGREGATE_FIELDS
+            ]
+        self.prepare_image()
+        image_changed = self._image_prepared
+        image_cleared = not self.image and bool(self.image_hash or self.image_variants)
+        previous_files = []
+        if (image_changed or image_cleared) and self.pk:
+            previous = Ticket.objects.filter(pk=self.pk).first()
+            previous_files = previous.media_names() if previous else []
+        if image_cleared:
+            self.image_variants = {}
+            self.image_hash = ''
+            self.image_width = self.image_height = None
+            self.image_processed = False
         super().save(*args, **kwargs)
-        self.resize_image()
+        self._image_prepared = False
+        storage.release(previous_files, self.image.storage)
 
 class Review(models.Model):
     """
@@ -66,3 +295,137 @@ class Review(models.Model):
         to=settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     time_created = models.DateTimeField(auto_now_add=True)
     update_at = models.DateTimeField(auto_now=True)
+
+    objects = ReviewQuerySet.as_manager()
+
+    # (ticket_id, rating) the review is counted with in its ticket's
+    # aggregates (see blog.ratings); None for a review not saved yet.
+    counted_as = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the ticket and rating the loaded review is counted with.
+        """
+        instance = super().from_db(db, field_names, values)
+        if not {'ticket_id', 'rating'} & instance.get_deferred_fields():
+            instance.counted_as = (instance.ticket_id, instance.rating)
+        return instance
+
+    class Meta:
+        """
+        Meta class to define the constraints and indexes of reviews.
+
+        A user reviews a ticket at most once; the constraint's index also
+        serves the (ticket, user) lookups of is_reviewed_by. The ticket
+        indexes serve the pages of the reviews of a ticket, by recency
+        and by rating (see feed.paginate_reviews).
+        """
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ticket', 'user'], name='unique_review_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-time_created'], name='review_user_time_idx'),
+            models.Index(fields=['ticket', '-time_created', '-id'],
+                         name='review_ticket_time_idx'),
+            models.Index(fields=['ticket', '-rating', '-time_created', '-id'],
+                         name='review_ticket_rating_idx'),
+        ]
+
+
+class FeedEntry(models.Model):
+    """
+    A ticket or review pushed into the home feed of one user.
+
+    Entries are written when posts are saved (fan-out on write) and kept in
+    sync with follows and blocks by blog.signals; they are removed with the
+    post they point to through the CASCADE foreign keys.
+    Reading a feed page is a range scan of the (owner, time_created) index.
+    """
+    KIND_CHOICES = [('ticket', 'Billet'), ('review', 'Critique')]
+    owner = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='feed_entries')
+    author = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='+')
+    kind = models.CharField(max_length=6, choices=KIND_CHOICES)
+    ticket = models.ForeignKey(
+        to=Ticket, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='+')
+    review = models.ForeignKey(
+        to=Review, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='+')
+    object_id = models.PositiveBigIntegerField()
+    time_created = models.DateTimeField()
+
+    class Meta:
+        """
+        Meta class to define the constraints and indexes of the feed store.
+        """
+        constraints = [
+            models.UniqueConstraint(
+                fields=['owner', 'kind', 'object_id'],
+                name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['owner', '-time_created', '-kind', '-object_id'],
+                name='feed_entry_page_idx'),
+            models.Index(fields=['owner', 'author'], name='feed_entry_author_idx'),
+        ]
+
+
+class TicketTitleBand(models.Model):
+    """
+    One MinHash band of a ticket's title, hashed into a bucket.
+
+    Tickets with similar titles share buckets; the bucket index finds
+    them without reading the titles (see blog.duplicates). Rows are
+    written by blog.signals when a title is saved.
+    """
+    ticket = models.ForeignKey(
+        to=Ticket, on_delete=models.CASCADE, related_name='title_bands')
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        """
+        Meta class to define the index of the bucket lookups.
+        """
+        indexes = [
+            models.Index(fields=['bucket', 'ticket'], name='ticket_title_bucket_idx'),
+        ]
+
+
+class TicketActivity(models.Model):
+    """
+    The number of reviews a ticket received during one period: an hour,
+    or a whole day once compacted.
+
+    Rows are counted by blog.signals when reviews are created or deleted,
+    and summed over the recent buckets by the trending page (see
+    blog.trending). bucket is the start of the period, in UTC.
+    """
+    HOUR = 1
+    DAY = 24
+
+    ticket = models.ForeignKey(
+        to=Ticket, on_delete=models.CASCADE, related_name='activity')
+    bucket = models.DateTimeField()
+    hours = models.PositiveSmallIntegerField(default=HOUR)
+    reviews = models.IntegerField(default=0)
+
+    class Meta:
+        """
+        Meta class to define one row per ticket and period, and the
+        covering index of the window sums.
+        """
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ticket', 'bucket', 'hours'], name='unique_ticket_activity'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket', 'ticket', 'reviews'],
+                         name='ticket_activity_bucket_idx'),
+        ]
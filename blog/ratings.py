@@ -0,0 +1,131 @@
+"""
+docstring: blog/ratings.py
+This module keeps the review aggregates of the tickets: review_count,
+rating_sum and the histogram rating_1 to rating_5.
+It includes:
+- count_review: Counts a created or edited review on its ticket.
+- uncount_review: Removes a deleted review from its ticket.
+- live_aggregates: The aggregates computed from the reviews, as subqueries.
+- rebuild_aggregates, check_aggregates: Bulk repair and consistency check.
+
+The counters are changed by one UPDATE with F() expressions per review
+written, so concurrent reviews of a ticket do not overwrite each other.
+A review remembers the (ticket, rating) it is counted with (see
+Review.from_db), so an edit only moves it from one rating to the other.
+Decrements stop at zero: counters that drifted, e.g. after a bulk
+insert, are fixed by the rebuild_review_stats command.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from . import models
+
+
+def _decrement(field, amount=1):
+    return Greatest(F(field) - amount, Value(0))
+
+
+def _change(ticket_id, **changes):
+    models.Ticket.objects.filter(pk=ticket_id).update(**changes)
+
+
+def count_review(review, created):
+    """
+    Count a saved review on its ticket.
+
+    A new review adds one to the count, its rating to the sum and one to
+    the histogram; an edited review moves from its previous rating (or
+    ticket) to the new one, and costs nothing if neither changed.
+
+    Args:
+        review (Review): The saved review.
+        created (bool): Whether the review was just inserted.
+    """
+    previous = None if created else review.counted_as
+    current = (review.ticket_id, int(review.rating))
+    if previous == current:
+        return
+    ticket_id, rating = current
+    if previous is not None and previous[0] == ticket_id:
+        old_rating = previous[1]
+        _change(
+            ticket_id,
+            rating_sum=Greatest(F('rating_sum') + (rating - old_rating), Value(0)),
+            **{f'rating_{old_rating}': _decrement(f'rating_{old_rating}'),
+               f'rating_{rating}': F(f'rating_{rating}') + 1})
+    else:
+        if previous is not None:
+            _uncount(*previous)
+        _change(
+            ticket_id,
+            review_count=F('review_count') + 1,
+            rating_sum=F('rating_sum') + rating,
+            **{f'rating_{rating}': F(f'rating_{rating}') + 1})
+    review.counted_as = current
+
+
+def _uncount(ticket_id, rating):
+    _change(
+        ticket_id,
+        review_count=_decrement('review_count'),
+        rating_sum=_decrement('rating_sum', rating),
+        **{f'rating_{rating}': _decrement(f'rating_{rating}')})
+
+
+def uncount_review(review):
+    """
+    Remove a deleted review from the aggregates of its ticket.
+    """
+    counted = review.counted_as or (review.ticket_id, int(review.rating))
+    _uncount(*counted)
+    review.counted_as = None
+
+
+def live_aggregates():
+    """
+    Return the aggregates of a ticket computed from its reviews, as
+    subqueries on OuterRef('pk'), keyed by field name.
+    """
+    reviews = models.Review.objects.filter(
+        ticket=OuterRef('pk')).order_by().values('ticket')
+
+    def aggregate(queryset, expression):
+        return Coalesce(
+            Subquery(queryset.annotate(value=expression).values('value')),
+            Value(0), output_field=IntegerField())
+
+    aggregates = {
+        'review_count': aggregate(reviews, Count('pk')),
+        'rating_sum': aggregate(reviews, Sum('rating')),
+    }
+    for rating in range(1, 6):
+        aggregates[f'rating_{rating}'] = aggregate(
+            reviews.filter(rating=rating), Count('pk'))
+    return aggregates
+
+
+def rebuild_aggregates(tickets=None):
+    """
+    Recompute the aggregates of tickets from their reviews, in one UPDATE.
+
+    Args:
+        tickets (QuerySet): The tickets to repair, all of them by default.
+
+    Returns:
+        int: The number of tickets updated.
+    """
+    if tickets is None:
+        tickets = models.Ticket.objects.all()
+    return tickets.update(**live_aggregates())
+
+
+def check_aggregates(tickets=None):
+    """
+    Return the ids of the tickets whose stored aggregates differ from
+    their reviews.
+    """
+    if tickets is None:
+        tickets = models.Ticket.objects.all()
+    live = {f'live_{name}': expression for name, expression in live_aggregates().items()}
+    return list(tickets.annotate(**live).exclude(**{
+        name: F(f'live_{name}') for name in models.Ticket.REVIEW_AGGREGATE_FIELDS
+    }).values_list('pk', flat=True))
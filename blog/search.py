@@ -0,0 +1,260 @@
+"""
+docstring: blog/search.py
+This module searches the tickets and reviews with the SQLite FTS5 index
+blog_search, created by migration 0011 and kept in sync by triggers on
+blog_ticket and blog_review (bulk_create and raw SQL included).
+It includes:
+- match_expression: Turns what the user typed into an FTS5 query.
+- SearchResults: The matching posts, best first, for Paginator.
+- search: The posts matching a query that a user may see.
+- paginate_search: One page of results, as Ticket and Review instances.
+- rebuild, check, create_triggers, missing_triggers: Maintenance of
+  the index and of its triggers.
+
+Results are ranked by bm25, titles and headlines weighing ten times the
+descriptions and bodies. Ranking costs a score per matching row, so only
+the MAX_CANDIDATES most recent matches (highest rowids) are ranked: a
+common word matching most of the posts costs the same as a rare one.
+A page is a LIMIT/OFFSET over the ranking, and the number of results
+is capped by MAX_RESULTS.
+
+On SQLite, the migrations that add or alter a column of blog_ticket or
+blog_review copy the table into a new one, which drops its triggers:
+they must end with create_triggers (see migration 0013).
+"""
+import re
+from django.core.paginator import Paginator
+from django.db import connections, router, transaction
+from . import feed, models
+
+TABLE = 'blog_search'
+MAX_TERMS = 8
+MIN_PREFIX = 2
+MAX_RESULTS = 1000
+MAX_CANDIDATES = 10000
+
+# The statements of migration 0011, which keep the index in sync.
+TRIGGERS = {
+    'blog_search_ticket_insert': """
+        CREATE TRIGGER IF NOT EXISTS blog_search_ticket_insert
+        AFTER INSERT ON blog_ticket BEGIN
+            INSERT INTO blog_search (rowid, title, body, user_id)
+            VALUES (new.id * 2, new.title, new.description, new.user_id);
+        END
+    """,
+    'blog_search_ticket_update': """
+        CREATE TRIGGER IF NOT EXISTS blog_search_ticket_update
+        AFTER UPDATE OF title, description, user_id ON blog_ticket BEGIN
+            UPDATE blog_search
+            SET title = new.title, body = new.description, user_id = new.user_id
+            WHERE rowid = new.id * 2;
+        END
+    """,
+    'blog_search_ticket_delete': """
+        CREATE TRIGGER IF NOT EXISTS blog_search_ticket_delete
+        AFTER DELETE ON blog_ticket BEGIN
+            DELETE FROM blog_search WHERE rowid = old.id * 2;
+        END
+    """,
+    'blog_search_review_insert': """
+        CREATE TRIGGER IF NOT EXISTS blog_search_review_insert
+        AFTER INSERT ON blog_review BEGIN
+            INSERT INTO blog_search (rowid, title, body, user_id)
+            VALUES (new.id * 2 + 1, new.headline, new.body, new.user_id);
+        END
+    """,
+    'blog_search_review_update': """
+        CREATE TRIGGER IF NOT EXISTS blog_search_review_update
+        AFTER UPDATE OF headline, body, user_id ON blog_review BEGIN
+            UPDATE blog_search
+            SET title = new.headline, body = new.body, user_id = new.user_id
+            WHERE rowid = new.id * 2 + 1;
+        END
+    """,
+    'blog_search_review_delete': """
+        CREATE TRIGGER IF NOT EXISTS blog_search_review_delete
+        AFTER DELETE ON blog_review BEGIN
+            DELETE FROM blog_search WHERE rowid = old.id * 2 + 1;
+        END
+    """,
+}
+
+REBUILD_SQL = [
+    f'DELETE FROM {TABLE}',
+    f"""
+    INSERT INTO {TABLE} (rowid, title, body, user_id)
+    SELECT id * 2, title, description, user_id FROM blog_ticket
+    """,
+    f"""
+    INSERT INTO {TABLE} (rowid, title, body, user_id)
+    SELECT id * 2 + 1, headline, body, user_id FROM blog_review
+    """,
+    f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')",
+]
+
+
+def match_expression(query):
+    """
+    Return the FTS5 expression of a search typed by a user.
+
+    Every word must match; the last one also matches as a prefix, since
+    it may not be typed in full, unless it is followed by a space or
+    is a single character (the prefix indexes start at two). Operators and punctuation are not
+    interpreted, so any input gives a valid expression.
+
+    Args:
+        query (str): The search, as typed.
+
+    Returns:
+        str: The expression, empty when the query has no word.
+    """
+    words = re.findall(r'\w+', query)[:MAX_TERMS]
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    if len(words[-1]) >= MIN_PREFIX and query[-1:].isalnum():
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _row(rowid):
+    """
+    Return the feed row ({'kind', 'object_id'}) of an index rowid.
+    """
+    kind = feed.REVIEW if rowid % 2 else feed.TICKET
+    return {'kind': kind, 'object_id': rowid // 2}
+
+
+class SearchResults:
+    """
+    The posts matching an FTS5 expression, best first, as feed rows.
+
+    Behaves as the sequence Paginator expects: count() and each slice
+    run one query, on the database the posts are read from.
+    """
+    def __init__(self, expression, hidden=()):
+        self.expression = expression
+        self.hidden = sorted(hidden)
+
+    def _query(self, suffix, params, ranked='', ranked_params=()):
+        """
+        Return the rowids matching the expression, limited by suffix, and
+        if given, ranked and sliced by ranked.
+        """
+        where = f'{TABLE} MATCH %s'
+        if self.hidden:
+            where += f" AND user_id NOT IN ({', '.join(['%s'] * len(self.hidden))})"
+        if ranked:
+            sql = (f'SELECT rowid FROM (SELECT rowid, rank FROM {TABLE} '
+                   f'WHERE {where} {suffix}) {ranked}')
+        else:
+            sql = f'SELECT rowid FROM {TABLE} WHERE {where} {suffix}'
+        alias = router.db_for_read(models.Ticket)
+        with connections[alias].cursor() as cursor:
+            cursor.execute(sql, [self.expression, *self.hidden, *params, *ranked_params])
+            return cursor.fetchall()
+
+    def count(self):
+        if not self.expression:
+            return 0
+        return len(self._query('LIMIT %s', [MAX_RESULTS]))
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError('SearchResults only supports slices without step.')
+        start = index.start or 0
+        stop = MAX_RESULTS if index.stop is None else min(index.stop, MAX_RESULTS)
+        if not self.expression or stop <= start:
+            return []
+        rows = self._query(
+            'ORDER BY rowid DESC LIMIT %s', [MAX_CANDIDATES],
+            ranked='ORDER BY rank LIMIT %s OFFSET %s', ranked_params=[stop - start, start])
+        return [_row(row[0]) for row in rows]
+
+
+def search(query, graph):
+    """
+    Return the posts matching a query, leaving out those by the users
+    blocked by, or blocking, the viewer.
+
+    Args:
+        query (str): The search, as typed.
+        graph (SocialGraph): The cached relations of the viewer.
+
+    Returns:
+        SearchResults: The matching posts, best first.
+    """
+    return SearchResults(match_expression(query), graph.hidden)
+
+
+def paginate_search(request, results, per_page=feed.PAGE_SIZE):
+    """
+    Return the page of results asked for by ``?page=<n>``.
+
+    Returns:
+        Page: The page, iterable over Ticket and Review instances.
+    """
+    page_obj = Paginator(results, per_page).get_page(request.GET.get('page'))
+    page_obj.object_list = feed.hydrate(page_obj.object_list)
+    return page_obj
+
+
+def create_triggers(connection):
+    """
+    Create the triggers of the index that do not exist on a connection.
+    """
+    with connection.cursor() as cursor:
+        for statement in TRIGGERS.values():
+            cursor.execute(statement)
+
+
+def missing_triggers(using='default'):
+    """
+    Return the names of the triggers of the index that do not exist.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing = {row[0] for row in cursor.fetchall()}
+    return sorted(set(TRIGGERS) - existing)
+
+
+def rebuild(using='default'):
+    """
+    Create the missing triggers, fill the index again from the tickets
+    and reviews, then merge its segments.
+
+    Returns:
+        int: The number of indexed posts.
+    """
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        create_triggers(connections[using])
+        for statement in REBUILD_SQL:
+            cursor.execute(statement)
+        cursor.execute(f'SELECT count(*) FROM {TABLE}')
+        return cursor.fetchone()[0]
+
+
+def check(using='default'):
+    """
+    Compare the index with the tickets and reviews.
+
+    Returns:
+        tuple: (missing, extra) numbers of posts; missing posts are not
+        indexed, extra rows of the index have no post anymore.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"""
+            SELECT
+                (SELECT count(*) FROM blog_ticket
+                 WHERE id * 2 NOT IN (SELECT rowid FROM {TABLE}))
+                + (SELECT count(*) FROM blog_review
+                   WHERE id * 2 + 1 NOT IN (SELECT rowid FROM {TABLE})),
+                (SELECT count(*) FROM {TABLE} WHERE rowid % 2 = 0
+                 AND rowid / 2 NOT IN (SELECT id FROM blog_ticket))
+                + (SELECT count(*) FROM {TABLE} WHERE rowid % 2 = 1
+                   AND rowid / 2 NOT IN (SELECT id FROM blog_review))
+        """)
+        return cursor.fetchone()
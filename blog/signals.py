@@ -0,0 +1,157 @@
+"""
+docstring: blog/signals.py
+Signal handlers of the blog application.
+It includes:
+- push_post: Fans out a newly created Ticket or Review, and announces it
+  on the live feed channels of its readers once committed.
+- announce_post: Publishes a new post on its readers' live feed channels.
+- sync_follows: Backfills or prunes feeds when User.follows changes.
+- sync_blocks: Backfills or prunes feeds when User.blocked changes.
+- release_ticket_files: Releases the image files of deleted tickets.
+- index_ticket_title: Stores the title buckets of saved tickets, for the
+  near-duplicate suggestions.
+- count_review, uncount_review: Keep the review aggregates of the tickets,
+  and the hourly review counters of the trending page.
+Deleted posts leave the feeds through the CASCADE foreign keys of FeedEntry.
+"""
+from functools import partial
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from litrevu import events, storage
+from . import duplicates, feed, models, ratings, trending
+
+User = get_user_model()
+
+
+def _changed_pks(instance, action, pk_set, related):
+    """
+    Return the pks touched by an m2m change, or None if nothing changed yet.
+
+    A clear() gives no pk_set to its post_clear signal, so the pks of the
+    related manager are saved on the instance during pre_clear.
+    """
+    if action == 'pre_clear':
+        instance._feed_cleared_pks = set(related.values_list('pk', flat=True))
+        return None
+    if action == 'post_clear':
+        return instance.__dict__.pop('_feed_cleared_pks', set())
+    if action in ('post_add', 'post_remove'):
+        return pk_set
+    return None
+
+
+@receiver(post_save, sender=models.Ticket)
+@receiver(post_save, sender=models.Review)
+def push_post(sender, instance, created, **kwargs):
+    """
+    Push a newly created ticket or review into the feeds that show it.
+    """
+    if created:
+        owner_ids = feed.push(instance)
+        transaction.on_commit(partial(announce_post, instance, owner_ids))
+
+
+def announce_post(post, owner_ids):
+    """
+    Publish a new post on the live feed channel of its readers, its author
+    excepted (see blog.async_views.feed_events).
+    """
+    kind = feed.TICKET if isinstance(post, models.Ticket) else feed.REVIEW
+    message = {'kind': kind, 'id': post.id, 'author': post.user.username}
+    for owner_id in owner_ids:
+        if owner_id != post.user_id:
+            events.publish(events.feed_channel(owner_id), message)
+
+
+@receiver(m2m_changed, sender=User.follows.through)
+def sync_follows(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Backfill or prune the feeds of the followers when follows change.
+
+    In the forward direction instance is the follower; in the reverse
+    direction (user.followers) it is the followed user.
+    """
+    related = instance.followers if reverse else instance.follows
+    pks = _changed_pks(instance, action, pk_set, related)
+    if not pks:
+        return
+    if reverse:
+        feed.sync_feed(pks, [instance.pk])
+    else:
+        feed.sync_feed([instance.pk], pks)
+
+
+@receiver(m2m_changed, sender=User.blocked.through)
+def sync_blocks(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Backfill or prune both users' feeds when a block is added or removed.
+
+    A block hides posts in both directions, whoever blocked whom.
+    """
+    related = instance.blocked_by if reverse else instance.blocked
+    pks = _changed_pks(instance, action, pk_set, related)
+    if not pks:
+        return
+    feed.sync_feed([instance.pk], pks)
+    feed.sync_feed(pks, [instance.pk])
+
+
+@receiver(post_save, sender=models.Ticket)
+def index_ticket_title(sender, instance, created, update_fields, **kwargs):
+    """
+    Store the title buckets of a new ticket, or of a ticket whose title
+    changed since it was loaded (see blog.duplicates and
+    Ticket.indexed_title).
+    """
+    if update_fields is not None and 'title' not in update_fields:
+        return
+    if created or instance.title != instance.indexed_title:
+        duplicates.index_ticket(instance, created=created)
+        instance.indexed_title = instance.title
+
+
+@receiver(post_delete, sender=models.Ticket)
+def release_ticket_files(sender, instance, **kwargs):
+    """
+    Release the image and variants of a deleted ticket; they are deleted
+    unless another ticket or user shares them.
+    """
+    storage.release(instance.media_names())
+
+
+@receiver(pre_save, sender=models.Review)
+def load_counted_rating(sender, instance, raw, **kwargs):
+    """
+    Read the rating an updated review is counted with, when the instance
+    was not loaded from the database (see Review.from_db).
+    """
+    if raw or instance.pk is None or instance.counted_as is not None:
+        return
+    instance.counted_as = models.Review.objects.filter(
+        pk=instance.pk).values_list('ticket_id', 'rating').first()
+
+
+@receiver(post_save, sender=models.Review)
+def count_review(sender, instance, created, raw, **kwargs):
+    """
+    Count a new or edited review in its ticket's aggregates, and a new
+    one in the trending counters.
+    """
+    if not raw:
+        ratings.count_review(instance, created)
+        if created:
+            trending.count_review(instance)
+
+
+@receiver(post_delete, sender=models.Review)
+def uncount_review(sender, instance, origin, **kwargs):
+    """
+    Remove a deleted review from its ticket's aggregates and trending
+    counters, unless the ticket itself is being deleted.
+    """
+    if isinstance(origin, models.Ticket) or getattr(origin, 'model', None) is models.Ticket:
+        return
+    ratings.uncount_review(instance)
+    trending.uncount_review(instance)
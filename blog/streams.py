@@ -0,0 +1,140 @@
+"""
+docstring: blog/streams.py
+Server-Sent Events stream of the live feed, served by the ASGI app.
+It includes:
+- event_stream: The events of a user's live feed channel.
+- authenticate: The user of the session cookie of an ASGI request.
+- feed_events: ASGI application streaming the events to the user.
+- with_event_streams: Wraps the Django ASGI application to serve
+  feed_events at the URL of the 'feed_events' route.
+
+The stream bypasses Django's request handler, which keeps a thread per
+request (for the sync middleware) until the response is complete: for
+an open stream, until the user leaves. Here the user is authenticated
+once, then the stream only waits on the pub/sub of litrevu.events, so
+idle connections hold no thread. The WSGI app answers the same URL with
+204 (see views.feed_events).
+"""
+import asyncio
+import io
+import json
+import time
+from contextlib import aclosing
+from importlib import import_module
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aget_user
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.urls import reverse
+from litrevu import events
+
+# Milliseconds the browser waits before reconnecting a closed stream.
+EVENTS_RETRY = 5000
+
+HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    # Ask reverse proxies not to buffer the stream.
+    (b'x-accel-buffering', b'no'),
+]
+
+
+async def event_stream(user_id):
+    """
+    Yield the Server-Sent Events of a user's live feed channel: a 'post'
+    event per new post, {'kind', 'id', 'author'}, and a comment when idle,
+    until settings.EVENTS_MAX_AGE.
+    """
+    deadline = time.monotonic() + settings.EVENTS_MAX_AGE
+    yield f'retry: {EVENTS_RETRY}\n\n'
+    channel = events.subscribe(events.feed_channel(user_id), settings.EVENTS_HEARTBEAT)
+    async with aclosing(channel):
+        async for message in channel:
+            if message is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield f'event: post\ndata: {json.dumps(message)}\n\n'
+            if time.monotonic() >= deadline:
+                break
+
+
+async def authenticate(scope):
+    """
+    Return the user logged in by the session cookie of an ASGI request.
+
+    Raises:
+        DisallowedHost: If the Host header is not in ALLOWED_HOSTS.
+    """
+    request = ASGIRequest(scope, io.BytesIO())
+    request.get_host()
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    try:
+        return await aget_user(request)
+    finally:
+        await sync_to_async(close_old_connections)()
+
+
+async def respond(send, status):
+    """
+    Send an empty response with the given status.
+    """
+    await send({'type': 'http.response.start', 'status': status, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def wait_for_disconnect(receive):
+    """
+    Return once the client has disconnected.
+    """
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def feed_events(scope, receive, send):
+    """
+    ASGI application streaming the live feed of the logged-in user.
+
+    Answers 405 to other methods than GET, 400 to a disallowed host and
+    403 to anonymous users; EventSource does not reconnect after those.
+    """
+    if scope['method'] != 'GET':
+        return await respond(send, 405)
+    try:
+        user = await authenticate(scope)
+    except DisallowedHost:
+        return await respond(send, 400)
+    if not user.is_authenticated:
+        return await respond(send, 403)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': HEADERS})
+
+    async def stream():
+        async with aclosing(event_stream(user.pk)) as chunks:
+            async for chunk in chunks:
+                await send({'type': 'http.response.body',
+                            'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    tasks = {asyncio.ensure_future(stream()),
+             asyncio.ensure_future(wait_for_disconnect(receive))}
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def with_event_streams(application):
+    """
+    Return an ASGI application serving feed_events at the URL of the
+    'feed_events' route, and everything else with application.
+    """
+    async def router(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == reverse('feed_events'):
+            return await feed_events(scope, receive, send)
+        return await application(scope, receive, send)
+    return router
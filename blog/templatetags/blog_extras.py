@@ -5,6 +5,8 @@ Provides:
 - get_poster_display: Displays 'you' for the current user or their username.
 - get_posted_at_display: Formats the time since a post was created.
 - get_updated_at_display: Formats the time since a post was updated.
+- posted_at_time, updated_at_time: The same messages in <time> elements,
+  refreshed in the browser by static/js/relative_time.js.
 - is_reviewed_by: Checks if a user has reviewed a ticket.
 - is_author: Checks if a user is the author of an instance.
 - to_int: Converts a value to an integer, returning 0 on failure.
@@ -12,6 +14,7 @@ Provides:
 from datetime import timedelta
 from django.template import Library
 from django.utils import timezone
+from django.utils.html import format_html
 
 MINUTE = 60
 HOUR = 60 * MINUTE
@@ -64,11 +67,42 @@ def get_updated_at_display(created_at, updated_at):
         return f'Modifié il y a {int(seconds_ago // HOUR)} heures'
     return f'Modifié le {updated_at.strftime("%d %b %Y à %Hh%M")}'
 
-@register.filter
-def is_reviewed_by(ticket, user):
+@register.simple_tag
+def posted_at_time(posted_at):
+    """
+    Return a <time> element showing get_posted_at_display(posted_at).
+
+    The browser keeps the relative message up to date from the datetime
+    attribute, so the markup itself does not depend on the current time.
+    """
+    return format_html(
+        '<time datetime="{}" data-relative="posted">{}</time>',
+        posted_at.isoformat(), get_posted_at_display(posted_at))
+
+@register.simple_tag
+def updated_at_time(created_at, updated_at):
+    """
+    Return a <time> element showing get_updated_at_display(), preceded by a
+    separator; an empty string if the post was never updated.
+    """
+    message = get_updated_at_display(created_at, updated_at)
+    if not message:
+        return ''
+    return format_html(
+        '· <time datetime="{}" data-relative="updated">{}</time>',
+        updated_at.isoformat(), message)
+
+@register.simple_tag(takes_context=True)
+def is_reviewed_by(context, ticket, user):
     """
     Return True if the given user has already posted a review for this ticket.
+
+    Reads the 'reviewed_ticket_ids' set computed once per page by the view;
+    queries the database only when the view did not provide it.
     """
+    reviewed_ticket_ids = context.get('reviewed_ticket_ids')
+    if reviewed_ticket_ids is not None:
+        return ticket.id in reviewed_ticket_ids
     return ticket.review_set.filter(user=user).exists()
 
 @register.filter
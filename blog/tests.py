@@ -0,0 +1,1740 @@
+"""
+Tests for the blog application.
+
+QueryBudgetTests enforces the query budget declared by each view with
+@query_budget: a view must stay within its budget, and must run the same
+number of queries whatever the number of tickets and reviews it shows.
+AsyncQueryBudgetTests runs the same checks on the URLs served by
+litrevu.asgi, where the read-only pages are async views.
+
+FragmentCacheTests checks the cached ticket and review cards: shared by
+all viewers, invalidated by edits, with the viewer-dependent parts kept
+out of the cache.
+
+WriteRetryTests checks that writes failing on the SQLite lock are replayed.
+
+ReplicaRoutingTests checks which database the reads of a request go to.
+
+LiveFeedTests checks the pub/sub brokers and the Server-Sent Events stream.
+
+SearchTests checks the full-text index: kept in sync by its triggers,
+ranked, and filtered by the blocks of the viewer.
+
+DuplicateTicketTests checks the suggestions of similar tickets, and that
+an uploaded image survives the confirmation of a duplicate.
+
+ReviewAggregateTests checks the review counts and ratings kept on tickets,
+and that a user reviews a ticket once. ReviewMigrationTests checks that
+migration 0010 removes the duplicate reviews before enforcing it.
+
+TicketReviewsTests checks the keyset pages of the reviews of a ticket.
+
+TrendingTests checks the hourly review counters and the trending ranking.
+
+UsernameAutocompleteTests checks the username suggestions of the follow form.
+
+ReviewedTicketsTests checks which tickets the cards offer to review.
+
+FeedStoreTests checks that the FeedEntry store follows the posts, follows
+and blocks it is built from.
+
+FeedPaginationTests checks the keyset pages of the feeds: the order of
+posts created at the same time, and the fallbacks of the cursors.
+
+MediaStorageTests checks that identical uploads share one file, deleted
+with its last reference, and the dedupe_media command.
+
+ImageVariantTests checks the WebP and JPEG variants of ticket images, the
+<picture> markup of the cards and the build_image_variants command.
+
+TicketImageEditTests checks that ticket edits only process a new image.
+
+SQLitePragmaTests checks the pragmas set by the SQLite profiles, and that
+invalid ones are rejected.
+
+WriteSlotTests checks that images are processed, passwords checked and
+pages rendered outside of the write slot, and that a retry replays the
+writes only.
+
+BenchmarkCommandTests runs the generate_dataset and benchmark_views
+commands on a tiny dataset.
+
+LoadTestCommandTests runs a one-second load_test against the in-process
+server.
+"""
+import asyncio
+import json
+import os
+import runpy
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import urlsplit
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.views import LoginView
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection, router, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.models import Value
+from django.db.models.functions import Concat, Lower
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from authentication import social
+from PIL import Image
+from litrevu import events, images, replicas, sqlite, storage, writes
+from litrevu.storage import ContentAddressedStorage, family, reference_count
+from . import duplicates, feed, models, ratings, search, streams, trending, views
+from .management.commands import dedupe_media
+
+User = get_user_model()
+
+
+class MediaTestCase(TestCase):
+    """
+    Run each test with an empty temporary MEDIA_ROOT.
+    """
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    @staticmethod
+    def image_upload(name='cover.png', size=(1200, 600), color='red'):
+        """
+        Return an uploaded PNG image of the given size and color.
+        """
+        buffer = BytesIO()
+        Image.new('RGB', size, color).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    @staticmethod
+    def stored_files():
+        """
+        Return the names of the files of the default storage.
+        """
+        return set(dedupe_media.walk(default_storage))
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Check the query count of the blog views against their declared budget.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        cls.other = User.objects.create_user('other', password='password')
+        cls.viewer.follows.add(cls.author)
+
+    def setUp(self):
+        cache.clear()
+        social.clear_local()
+        self.client.force_login(self.viewer)
+
+    def add_posts(self, count):
+        """
+        Create count tickets by the followed author, each reviewed by the viewer
+        and by the author, and return the last ticket.
+        """
+        for i in range(count):
+            ticket = models.Ticket.objects.create(
+                title=f'Billet {i}', user=self.author)
+            models.Review.objects.create(
+                ticket=ticket, user=self.author, headline='Critique', rating=4)
+        return ticket
+
+    def count_queries(self, method, url, data=None):
+        """
+        Request url and return the number of queries it ran,
+        after checking it against the budget declared by its view.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data or {})
+        self.assertIn(response.status_code, (200, 302))
+        budget = resolve(urlsplit(url).path).func.query_budget
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{url} ran {len(queries)} queries, budget is {budget}:\n'
+            + '\n'.join(query['sql'] for query in queries))
+        return len(queries)
+
+    def assertConstantQueries(self, url_for):
+        """
+        Check that the page returned by url_for(ticket) runs the same number
+        of queries with one post and with a full page of posts.
+        Both requests start with an empty social graph cache.
+        """
+        few = self.count_queries('get', url_for(self.add_posts(1)))
+        cache.clear()
+        social.clear_local()
+        many = self.count_queries('get', url_for(self.add_posts(12)))
+        self.assertEqual(few, many)
+
+    def test_home(self):
+        self.assertConstantQueries(lambda ticket: reverse('home'))
+        self.count_queries('get', reverse('home') + '?page=2')
+
+    def test_display_posts(self):
+        self.author, self.viewer = self.viewer, self.author
+        self.assertConstantQueries(lambda ticket: reverse('posts'))
+
+    def test_view_ticket(self):
+        self.assertConstantQueries(
+            lambda ticket: reverse('view-ticket', args=[ticket.id]))
+        ticket = models.Ticket.objects.create(title='Billet', user=self.author)
+        models.Review.objects.bulk_create(
+            models.Review(ticket=ticket, user=user, headline='Critique', rating=3)
+            for user in User.objects.bulk_create(
+                User(username=f'reader{i}') for i in range(25)))
+        cursor = feed.ReviewCursor.from_instance(
+            'rating', models.Review.objects.filter(ticket=ticket).last()).encode()
+        self.count_queries(
+            'get', reverse('view-ticket', args=[ticket.id]) + f'?order=rating&before={cursor}')
+
+    def test_view_review(self):
+        self.assertConstantQueries(
+            lambda ticket: reverse('view-review', args=[ticket.review_set.get().id]))
+
+    def test_search(self):
+        self.assertConstantQueries(lambda ticket: reverse('search') + '?q=billet')
+        self.count_queries('get', reverse('search') + '?q=billet&page=2')
+
+    def test_trending(self):
+        self.assertConstantQueries(lambda ticket: reverse('trending'))
+        self.count_queries('get', reverse('trending') + '?window=7d')
+
+    def test_follow_users(self):
+        self.assertConstantQueries(lambda ticket: reverse('follow_users'))
+        self.count_queries('post', reverse('follow_users'), {
+            'username': self.other.username})
+        for name in ('block_user', 'unblock_user', 'unfollow_users'):
+            self.count_queries('post', reverse(name, args=[self.other.id]))
+
+    def test_create_ticket(self):
+        self.count_queries('get', reverse('create-ticket'))
+        self.count_queries('post', reverse('create-ticket'), {
+            'title': 'Billet', 'edit_ticket': True})
+
+    def test_similar_tickets(self):
+        self.assertConstantQueries(lambda ticket: reverse('similar_tickets') + '?title=Billet')
+
+    def test_username_autocomplete(self):
+        self.assertConstantQueries(
+            lambda ticket: reverse('username_autocomplete') + '?q=au')
+
+    def test_create_ticket_and_review(self):
+        self.count_queries('get', reverse('create-review-ticket'))
+        self.count_queries('post', reverse('create-review-ticket'), {
+            'ticket-title': 'Billet', 'ticket-edit_ticket': True,
+            'review-headline': 'Critique', 'review-rating': 3,
+            'review-edit_review': True})
+
+    def test_create_review(self):
+        ticket = self.add_posts(1)
+        url = reverse('create-review', args=[ticket.id])
+        self.count_queries('get', url)
+        self.count_queries('post', url, {
+            'headline': 'Critique', 'rating': 3, 'edit_review': True})
+        review = models.Review.objects.get(ticket=ticket, user=self.viewer)
+        self.assertRedirects(
+            self.client.get(url), reverse('edit_review', args=[review.id]))
+
+    def test_edit_ticket(self):
+        ticket = models.Ticket.objects.create(title='Billet', user=self.viewer)
+        url = reverse('edit_ticket', args=[ticket.id])
+        self.count_queries('get', url)
+        self.count_queries('post', url, {'title': 'Titre', 'edit_ticket': True})
+        self.count_queries('post', url, {'delete_ticket': True})
+
+    def test_edit_review(self):
+        ticket = self.add_posts(1)
+        review = models.Review.objects.create(
+            ticket=ticket, user=self.viewer, headline='Critique', rating=2)
+        url = reverse('edit_review', args=[review.id])
+        self.count_queries('get', url)
+        self.count_queries('post', url, {
+            'headline': 'Titre', 'rating': 5, 'edit_review': True})
+
+
+@override_settings(ROOT_URLCONF='litrevu.asgi_urls')
+class AsyncQueryBudgetTests(QueryBudgetTests):
+    """
+    Check the query budgets on the URLs of litrevu.asgi, with the async views.
+    """
+    def test_read_only_pages_are_async(self):
+        for url in (reverse('home'), reverse('posts')):
+            self.assertTrue(iscoroutinefunction(resolve(url).func))
+
+    async def test_async_client(self):
+        ticket = await sync_to_async(self.add_posts)(3)
+        await self.async_client.aforce_login(self.viewer)
+        response = await self.async_client.get(reverse('home'))
+        self.assertContains(response, ticket.title)
+        response = await self.async_client.get(reverse('view-ticket', args=[ticket.id]))
+        self.assertContains(response, ticket.title)
+        response = await self.async_client.get(reverse('view-ticket', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class FragmentCacheTests(TestCase):
+    """
+    Check the fragment cache of the ticket and review cards.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='password')
+        cls.reader = User.objects.create_user('reader', password='password')
+        cls.reader.follows.add(cls.author)
+        cls.ticket = models.Ticket.objects.create(title='Billet', user=cls.author)
+        models.Review.objects.create(
+            ticket=cls.ticket, user=cls.author, headline='Critique',
+            body='Corps', rating=4)
+
+    def setUp(self):
+        self.cache = caches['fragments']
+        self.cache.clear()
+
+    def get_home(self, user):
+        """
+        Render the home page for user; return it and the (hits, misses) it caused.
+        """
+        self.client.force_login(user)
+        before = self.cache.stats()
+        response = self.client.get(reverse('home'))
+        after = self.cache.stats()
+        return response, (after['hits'] - before['hits'],
+                          after['misses'] - before['misses'])
+
+    def test_cards_are_shared_between_viewers(self):
+        response, (hits, misses) = self.get_home(self.author)
+        self.assertGreater(misses, 0)
+        self.assertContains(response, 'vous avez')
+        response, (hits, misses) = self.get_home(self.reader)
+        self.assertEqual(misses, 0)
+        self.assertGreater(hits, 0)
+        self.assertNotContains(response, 'vous avez')
+        self.assertContains(response, 'author a')
+        self.assertContains(response, 'Corps')
+
+    def test_edit_invalidates_card(self):
+        self.get_home(self.reader)
+        self.ticket.title = 'Nouveau titre'
+        self.ticket.save()
+        response, (hits, misses) = self.get_home(self.reader)
+        self.assertGreater(misses, 0)
+        self.assertContains(response, 'Nouveau titre')
+
+    def test_stats_view_is_staff_only(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(reverse('runtime_stats')).status_code, 302)
+        staff = User.objects.create_user('staff', password='password', is_staff=True)
+        self.client.force_login(staff)
+        stats = self.client.get(reverse('runtime_stats')).json()['fragment_cache']
+        self.assertEqual(stats['max_entries'], 5000)
+
+
+@override_settings(WRITE_RETRY_ATTEMPTS=3, WRITE_RETRY_BASE_DELAY=0)
+class WriteRetryTests(TestCase):
+    """
+    Check the retries of litrevu.writes.run_write.
+    """
+    def failing(self, failures, message='database is locked'):
+        """
+        Return a write raising OperationalError(message) failures times,
+        then returning the number of calls.
+        """
+        calls = []
+
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return len(calls)
+        return write
+
+    def test_lock_errors_are_retried(self):
+        retries = writes.queue.retries
+        self.assertEqual(writes.run_write(self.failing(2)), 3)
+        self.assertEqual(writes.queue.retries - retries, 2)
+
+    def test_gives_up_after_the_last_attempt(self):
+        failures = writes.queue.failures
+        with self.assertRaises(OperationalError):
+            writes.run_write(self.failing(3))
+        self.assertEqual(writes.queue.failures - failures, 1)
+
+    def test_other_errors_are_not_retried(self):
+        with self.assertRaisesMessage(OperationalError, 'no such table'):
+            writes.run_write(self.failing(1, 'no such table: blog_ticket'))
+
+    def test_nested_writes_do_not_wait_for_the_slot_they_hold(self):
+        self.assertEqual(writes.run_write(lambda: writes.run_write(lambda: 1)), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    """
+    Check the routing of litrevu.replicas, without querying the replica.
+    """
+    def route(self, view, method='get', cookies=None):
+        """
+        Run a request to view through ReplicaMiddleware; return the response
+        and the databases a ticket and a user would be read from.
+        """
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        routes = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            routes['ticket'] = router.db_for_read(models.Ticket)
+            routes['user'] = router.db_for_read(User)
+            routes['blocks'] = router.db_for_read(User.blocked.through)
+            return HttpResponse()
+        middleware = replicas.ReplicaMiddleware(get_response)
+        return middleware(request), routes
+
+    def test_reads_of_blog_views_use_a_replica(self):
+        _, routes = self.route(views.home)
+        self.assertEqual(routes, {'ticket': 'replica', 'user': 'default', 'blocks': 'default'})
+        self.assertEqual(router.db_for_read(models.Ticket), 'default')
+
+    def test_other_views_use_the_primary(self):
+        _, routes = self.route(LoginView.as_view())
+        self.assertEqual(routes['ticket'], 'default')
+
+    def test_writes_stick_to_the_primary(self):
+        response, routes = self.route(views.home, method='post')
+        self.assertEqual(routes['ticket'], 'default')
+        cookie = response.cookies[replicas.STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 10)
+        _, routes = self.route(views.home, cookies={replicas.STICKY_COOKIE: cookie.value})
+        self.assertEqual(routes['ticket'], 'default')
+
+    def test_expired_window_uses_a_replica(self):
+        _, routes = self.route(views.home, cookies={replicas.STICKY_COOKIE: '0'})
+        self.assertEqual(routes['ticket'], 'replica')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replica(self):
+        _, routes = self.route(views.home)
+        self.assertEqual(routes['ticket'], 'default')
+
+
+@override_settings(EVENTS_HEARTBEAT=10)
+class LiveFeedTests(TestCase):
+    """
+    Check the live feed: brokers, and the stream of the ASGI app (blog.streams).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        cls.reader.follows.add(cls.author)
+
+    async def roundtrip(self, broker):
+        """
+        Subscribe to a channel of broker, publish from another thread,
+        and return the message received.
+        """
+        channel = broker.subscribe('test', heartbeat=10)
+        received = asyncio.ensure_future(anext(channel))
+        await asyncio.sleep(0.05)
+        await sync_to_async(broker.publish, thread_sensitive=False)('test', {'id': 1})
+        try:
+            return await asyncio.wait_for(received, 5)
+        finally:
+            await channel.aclose()
+
+    async def test_in_process_broker(self):
+        broker = events.InProcessBroker()
+        self.assertEqual(await self.roundtrip(broker), {'id': 1})
+        self.assertEqual(broker.subscribers('test'), 0)
+
+    async def test_cache_broker(self):
+        broker = events.CacheBroker(poll_interval=0.01)
+        self.assertEqual(await self.roundtrip(broker), {'id': 1})
+
+    async def test_heartbeat(self):
+        channel = events.InProcessBroker().subscribe('test', heartbeat=0.01)
+        self.assertIsNone(await anext(channel))
+        await channel.aclose()
+
+    def create_ticket(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return models.Ticket.objects.create(title='Billet', user=self.author)
+
+    async def test_new_posts_are_streamed(self):
+        await self.async_client.aforce_login(self.reader)
+        session = self.async_client.cookies[settings.SESSION_COOKIE_NAME].value
+        received, sent = asyncio.Queue(), asyncio.Queue()
+        application = streams.with_event_streams(None)
+        served = asyncio.ensure_future(application({
+            'type': 'http', 'method': 'GET', 'path': reverse('feed_events'),
+            'query_string': b'', 'headers': [
+                (b'host', b'testserver'),
+                (b'cookie', f'{settings.SESSION_COOKIE_NAME}={session}'.encode())],
+        }, received.get, sent.put))
+        start = await asyncio.wait_for(sent.get(), 5)
+        self.assertEqual(start['status'], 200)
+        self.assertEqual((await sent.get())['body'], b'retry: 5000\n\n')
+        await asyncio.sleep(0.05)
+        ticket = await sync_to_async(self.create_ticket)()
+        self.assertEqual(
+            (await asyncio.wait_for(sent.get(), 5))['body'],
+            b'event: post\ndata: {"kind": "ticket", "id": %d, "author": "author"}\n\n'
+            % ticket.id)
+        await received.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(served, 5)
+        self.assertEqual(events.get_broker().subscribers(
+            events.feed_channel(self.reader.id)), 0)
+
+    async def test_anonymous_users_are_refused(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+        await streams.feed_events({
+            'type': 'http', 'method': 'GET', 'path': reverse('feed_events'),
+            'query_string': b'', 'headers': [(b'host', b'testserver')],
+        }, None, send)
+        self.assertEqual(sent[0]['status'], 403)
+
+    def test_wsgi_endpoint_stops_the_client(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(reverse('feed_events')).status_code, 204)
+
+
+class SearchTests(TestCase):
+    """
+    Check the full-text search of the tickets and reviews (blog.search).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        cls.blocker = User.objects.create_user('blocker', password='password')
+        cls.blocker.blocked.add(cls.reader)
+        cls.ticket = models.Ticket.objects.create(
+            title='Les Misérables', description='Un roman de Victor Hugo.',
+            user=cls.author)
+        cls.review = models.Review.objects.create(
+            ticket=cls.ticket, user=cls.author, headline='Un classique',
+            body='Hugo au sommet de son art.', rating=5)
+        models.Ticket.objects.create(
+            title='Notre-Dame de Paris', description='Encore Hugo.', user=cls.blocker)
+
+    def setUp(self):
+        cache.clear()
+        social.clear_local()
+        self.client.force_login(self.reader)
+
+    def results(self, query):
+        """
+        Return the (kind, id) pairs found for query by the reader, best first.
+        """
+        page = self.client.get(reverse('search'), {'q': query}).context['page_obj']
+        return [(type(post).__name__, post.id) for post in page]
+
+    def test_match_expression(self):
+        self.assertEqual(search.match_expression('victor hu'), '"victor" "hu"*')
+        self.assertEqual(search.match_expression('"NOT* (OR'), '"NOT" "OR"*')
+        self.assertEqual(search.match_expression('victor h'), '"victor" "h"')
+        self.assertEqual(search.match_expression('victor hugo '), '"victor" "hugo"')
+        self.assertEqual(search.match_expression(' -- '), '')
+
+    def test_titles_rank_first_and_blocks_are_hidden(self):
+        self.assertEqual(self.results('hugo'), [
+            ('Ticket', self.ticket.id), ('Review', self.review.id)])
+        self.assertEqual(self.results('classique'), [('Review', self.review.id)])
+        self.assertEqual(self.results('miserables vic'), [('Ticket', self.ticket.id)])
+        self.assertEqual(self.results('notre dame'), [])
+        self.assertContains(self.client.get(reverse('search'), {'q': 'dame'}),
+                            'Aucun ticket ni review ne correspond')
+
+    def test_triggers_follow_edits_and_deletions(self):
+        self.review.headline = 'Un chef-d’œuvre'
+        self.review.save()
+        self.assertEqual(self.results('classique'), [])
+        self.assertEqual(self.results('chef'), [('Review', self.review.id)])
+        self.ticket.delete()
+        self.assertEqual(self.results('hugo'), [])
+        self.assertEqual(search.check(), (0, 0))
+
+    def test_rebuild(self):
+        # Migrations copying blog_ticket or blog_review drop the triggers.
+        self.assertEqual(search.missing_triggers(), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.TABLE} WHERE rowid = %s',
+                           [self.ticket.id * 2])
+        self.assertEqual(search.check(), (1, 0))
+        self.assertEqual(search.rebuild(), 3)
+        self.assertEqual(search.check(), (0, 0))
+
+
+class DuplicateTicketTests(MediaTestCase):
+    """
+    Check the near-duplicate ticket suggestions (blog.duplicates).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.writer = User.objects.create_user('writer', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        cls.blocker = User.objects.create_user('blocker', password='password')
+        cls.blocker.blocked.add(cls.writer)
+        cls.ticket = models.Ticket.objects.create(
+            title='Les Misérables, de Victor Hugo', user=cls.author)
+        models.Ticket.objects.create(title='Madame Bovary', user=cls.author)
+        models.Ticket.objects.create(title='Notre-Dame de Paris', user=cls.blocker)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        social.clear_local()
+        self.client.force_login(self.writer)
+
+    def suggest(self, title):
+        """
+        Return the titles suggested to the writer for title.
+        """
+        response = self.client.get(reverse('similar_tickets'), {'title': title})
+        return [ticket['title'] for ticket in response.json()['tickets']]
+
+    def test_similarity(self):
+        self.assertEqual(duplicates.normalize('  Les Misérables !'), 'les miserables')
+        self.assertEqual(duplicates.similarity('Les Misérables', 'les miserables'), 1.0)
+        self.assertLess(duplicates.similarity('Les Misérables', 'Madame Bovary'), 0.1)
+        self.assertEqual(duplicates.title_buckets('?!'), [])
+
+    def test_suggestions(self):
+        self.assertEqual(self.suggest('Les miserables (Victor Hugo)'),
+                         ['Les Misérables, de Victor Hugo'])
+        self.assertEqual(self.suggest('Le Rouge et le Noir'), [])
+        self.assertEqual(self.suggest('Notre Dame de Paris'), [])
+
+    def test_title_edits_are_indexed(self):
+        self.ticket.title = 'Le Rouge et le Noir, Stendhal'
+        self.ticket.save()
+        self.assertEqual(self.suggest('Les miserables (Victor Hugo)'), [])
+        self.assertEqual(self.suggest('Le rouge et le noir'),
+                         ['Le Rouge et le Noir, Stendhal'])
+        models.TicketTitleBand.objects.all().delete()
+        call_command('rebuild_title_index', stdout=StringIO())
+        self.assertEqual(self.suggest('Le rouge et le noir'),
+                         ['Le Rouge et le Noir, Stendhal'])
+
+    def test_title_indexed_again_only_when_it_changes(self):
+        ticket = models.Ticket.objects.get(pk=self.ticket.pk)
+        with mock.patch.object(duplicates, 'index_ticket', wraps=duplicates.index_ticket) as index:
+            ticket.description = 'Roman'
+            ticket.save()
+            ticket.image = self.image_upload()
+            ticket.save()
+            self.assertEqual(index.call_count, 0)
+            ticket.title = 'Les Misérables'
+            ticket.save()
+            ticket.save()
+            self.assertEqual(index.call_count, 1)
+        self.assertEqual(self.suggest('Les miserables'), ['Les Misérables'])
+
+    def test_creation_asks_before_publishing_a_duplicate(self):
+        url = reverse('create-ticket')
+        data = {'title': 'Madame Bovary', 'edit_ticket': True}
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Publier quand même')
+        self.assertContains(response, 'data-title-input="id_title"')
+        self.assertEqual(models.Ticket.objects.filter(title='Madame Bovary').count(), 1)
+        response = self.client.post(url, {**data, 'publish_anyway': '1'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(models.Ticket.objects.filter(title='Madame Bovary').count(), 2)
+
+        # Browsers do not send the file again: the upload is kept meanwhile.
+        response = self.client.post(url, {**data, 'image': self.image_upload(size=(1200, 600))})
+        self.assertContains(response, 'Publier quand même')
+        self.assertContains(response, 'L’illustration jointe sera publiée avec le billet.')
+        pending = response.context['ticket_form']['pending_image'].value()
+        self.assertTrue(ContentAddressedStorage.is_content_name(pending))
+        self.assertContains(response, f'name="pending_image" value="{pending}"')
+        self.assertEqual(self.stored_files(), {pending})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                url, {**data, 'publish_anyway': '1', 'pending_image': pending})
+        ticket = models.Ticket.objects.filter(title='Madame Bovary').latest('id')
+        self.assertRedirects(response, reverse('view-ticket', args=[ticket.id]),
+                             fetch_redirect_response=False)
+        self.assertTrue(ticket.image_processed)
+        self.assertEqual((ticket.image_width, ticket.image_height), (800, 400))
+        self.assertEqual(self.stored_files(), set(ticket.media_names()))
+
+    def test_pending_image_limited_to_stored_uploads(self):
+        url = reverse('create-ticket')
+        for pending in ['../../db.sqlite3', 'ab/cd/' + 'ab' * 32 + '.png']:
+            with self.subTest(pending=pending):
+                response = self.client.post(url, {
+                    'title': 'Le Horla', 'edit_ticket': True, 'publish_anyway': '1',
+                    'pending_image': pending})
+                self.assertEqual(response.status_code, 302)
+                self.assertFalse(models.Ticket.objects.filter(title='Le Horla').latest('id').image)
+
+
+class ReviewAggregateTests(TestCase):
+    """
+    Check the review aggregates of the tickets (blog.ratings).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='password')
+        cls.readers = [
+            User.objects.create_user(f'reader{i}', password='password') for i in range(3)]
+        cls.ticket = models.Ticket.objects.create(title='Billet', user=cls.author)
+
+    def review(self, reader, rating):
+        return models.Review.objects.create(
+            ticket=self.ticket, user=reader, headline='Critique', rating=rating)
+
+    def assertAggregates(self, count, total, histogram):
+        ticket = models.Ticket.objects.get(pk=self.ticket.pk)
+        self.assertEqual(
+            (ticket.review_count, ticket.rating_sum,
+             [number for rating, number in ticket.rating_histogram]),
+            (count, total, histogram))
+        self.assertEqual(ratings.check_aggregates(), [])
+
+    def test_created_edited_and_deleted_reviews(self):
+        first = self.review(self.readers[0], 5)
+        self.review(self.readers[1], 3)
+        self.assertAggregates(2, 8, [0, 0, 1, 0, 1])
+        first.rating = 2
+        first.save()
+        first.save()
+        self.assertAggregates(2, 5, [0, 1, 1, 0, 0])
+        # An instance that was not loaded reads the counted rating first.
+        models.Review(pk=first.pk, ticket=self.ticket, user=self.readers[0],
+                      headline='Critique', rating=4,
+                      time_created=first.time_created).save()
+        self.assertAggregates(2, 7, [0, 0, 1, 1, 0])
+        models.Review.objects.get(pk=first.pk).delete()
+        self.assertAggregates(1, 3, [0, 0, 1, 0, 0])
+
+    def test_ticket_saves_keep_the_aggregates(self):
+        stale = models.Ticket.objects.get(pk=self.ticket.pk)
+        self.review(self.readers[0], 4)
+        stale.title = 'Nouveau titre'
+        stale.save()
+        self.assertAggregates(1, 4, [0, 0, 0, 1, 0])
+        with CaptureQueriesContext(connection) as queries:
+            self.ticket.delete()
+        self.assertFalse(any('"review_count"' in query['sql'] for query in queries))
+
+    def test_rebuild_and_check(self):
+        self.review(self.readers[0], 4)
+        models.Ticket.objects.update(review_count=0, rating_4=3)
+        self.assertEqual(ratings.check_aggregates(), [self.ticket.pk])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_review_stats', check=True, stdout=StringIO())
+        call_command('rebuild_review_stats', stdout=StringIO())
+        self.assertAggregates(1, 4, [0, 0, 0, 1, 0])
+
+    def test_cards_show_the_average(self):
+        self.review(self.readers[0], 4)
+        self.review(self.readers[1], 5)
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('view-ticket', args=[self.ticket.id]))
+        self.assertContains(response, '4,5/5')
+        self.assertContains(response, '2 critiques')
+
+    def test_second_review_of_a_ticket_refused(self):
+        self.review(self.readers[0], 4)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.review(self.readers[0], 2)
+        self.assertAggregates(1, 4, [0, 0, 0, 1, 0])
+
+
+class ReviewMigrationTests(TransactionTestCase):
+    """
+    Check that migration 0010 keeps one review per ticket and user before
+    adding the unique constraint.
+    """
+    before = [('blog', '0009_ticket_image_metadata')]
+    after = [('blog', '0010_review_unique_and_time_indexes')]
+
+    def migrate(self, targets):
+        """
+        Migrate the test database to targets; return the models of that state.
+        """
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        executor.loader.build_graph()
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_duplicate_reviews_deleted(self):
+        apps = self.migrate(self.before)
+        Ticket = apps.get_model('blog', 'Ticket')
+        Review = apps.get_model('blog', 'Review')
+        # The users table is left as is.
+        reader = User.objects.create_user('reader', password='password')
+        other = User.objects.create_user('other', password='password')
+        ticket = Ticket.objects.create(title='Billet', user_id=reader.pk)
+        duplicates = [
+            Review.objects.create(ticket=ticket, user_id=reader.pk, headline=headline, rating=3)
+            for headline in ('Ancienne', 'Récente', 'Première')]
+        kept = Review.objects.create(ticket=ticket, user_id=other.pk, headline='Seule', rating=4)
+        now = timezone.now()
+        for review, age in zip(duplicates, (2, 0, 1)):
+            Review.objects.filter(pk=review.pk).update(update_at=now - timedelta(days=age))
+
+        apps = self.migrate(self.after)
+        self.assertEqual(
+            sorted(apps.get_model('blog', 'Review').objects.values_list('id', flat=True)),
+            [duplicates[1].pk, kept.pk])
+
+
+class TicketReviewsTests(TestCase):
+    """
+    Check the keyset pages of the reviews of a ticket (feed.paginate_reviews).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.ticket = models.Ticket.objects.create(title='Billet', user=cls.viewer)
+        readers = User.objects.bulk_create(User(username=f'reader{i}') for i in range(23))
+        # Reviews written at the same time, so that the pages split ties.
+        time_created = timezone.now()
+        models.Review.objects.bulk_create(
+            models.Review(ticket=cls.ticket, user=reader, headline=f'Critique {i}',
+                          rating=i % 5 + 1, time_created=time_created)
+            for i, reader in enumerate(readers))
+        # Blocks hide reviews in both directions.
+        cls.viewer.blocked.add(readers[0])
+        readers[1].blocked.add(cls.viewer)
+        cls.hidden = readers[:2]
+
+    def setUp(self):
+        cache.clear()
+        social.clear_local()
+        self.client.force_login(self.viewer)
+
+    def read_pages(self, order):
+        """
+        Follow the pages of the reviews in order and return the reviews read.
+        """
+        url = reverse('view-ticket', args=[self.ticket.id])
+        params = {'order': order}
+        reviews = []
+        while True:
+            page_obj = self.client.get(url, params).context['page_obj']
+            reviews.extend(page_obj)
+            if not page_obj.has_next():
+                return reviews
+            params['before'] = page_obj.next_cursor
+
+    def test_pages_follow_the_order(self):
+        visible = models.Review.objects.filter(ticket=self.ticket).exclude(user__in=self.hidden)
+        for order, key in [('recent', lambda review: -review.id),
+                           ('rating', lambda review: (-review.rating, -review.id))]:
+            with self.subTest(order=order):
+                reviews = self.read_pages(order)
+                self.assertEqual(reviews, sorted(visible, key=key))
+
+    def test_cursor_of_another_order_restarts(self):
+        recent = feed.ReviewCursor.from_instance(
+            'recent', models.Review.objects.last()).encode()
+        self.assertIsNone(feed.ReviewCursor.decode(recent, 'rating'))
+        self.assertIsNone(feed.ReviewCursor.decode('not-a-cursor', 'recent'))
+        response = self.client.get(
+            reverse('view-ticket', args=[self.ticket.id]), {'order': 'rating', 'before': recent})
+        self.assertTrue(response.context['page_obj'].is_first)
+
+    def test_pages_use_the_ticket_indexes(self):
+        review = models.Review.objects.first()
+        for order, index in [('recent', 'review_ticket_time_idx'),
+                             ('rating', 'review_ticket_rating_idx')]:
+            with self.subTest(order=order):
+                cursor = feed.ReviewCursor.from_instance(order, review)
+                plan = feed.ticket_reviews(
+                    self.ticket.id, {user.id for user in self.hidden}, order, cursor).explain()
+                self.assertIn(index, plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+
+class TrendingTests(TestCase):
+    """
+    Check the review counters of the trending page (blog.trending).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        cls.readers = User.objects.bulk_create(User(username=f'reader{i}') for i in range(3))
+        cls.hot = models.Ticket.objects.create(title='Billet en vogue', user=cls.author)
+        cls.calm = models.Ticket.objects.create(title='Billet calme', user=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def review(self, ticket, reader, age=timedelta()):
+        review = models.Review.objects.create(
+            ticket=ticket, user=reader, headline='Critique', rating=4)
+        if age:
+            # Moved back in time as a write would have left it, age ago.
+            models.TicketActivity.objects.all().delete()
+            models.Review.objects.filter(pk=review.pk).update(
+                time_created=review.time_created - age)
+            trending.rebuild()
+        return review
+
+    def test_reviews_are_counted_and_ranked(self):
+        for reader in self.readers:
+            self.review(self.hot, reader)
+        review = self.review(self.calm, self.readers[0])
+        self.assertEqual(trending.top_tickets('24h'), [(self.hot.id, 3), (self.calm.id, 1)])
+        review.delete()
+        cache.clear()
+        self.assertEqual(trending.top_tickets('24h'), [(self.hot.id, 3)])
+        self.assertEqual(trending.check(), [])
+        # Deleting a ticket drops its counters with it.
+        hot_id = self.hot.id
+        self.hot.delete()
+        self.assertFalse(models.TicketActivity.objects.filter(ticket_id=hot_id).exists())
+
+    def test_windows_and_compaction(self):
+        self.review(self.hot, self.readers[0])
+        self.review(self.calm, self.readers[0], age=timedelta(days=3))
+        self.review(self.calm, self.readers[1], age=timedelta(days=3))
+        self.review(self.calm, self.readers[2], age=timedelta(days=10))
+        self.assertEqual(trending.top_tickets('24h'), [(self.hot.id, 1)])
+        self.assertEqual(trending.top_tickets('7d'), [(self.calm.id, 2), (self.hot.id, 1)])
+        # rebuild() compacted the old hours into one daily bucket.
+        self.assertEqual(
+            list(models.TicketActivity.objects.filter(ticket=self.calm).values_list(
+                'hours', 'reviews')),
+            [(models.TicketActivity.DAY, 2)])
+        self.assertEqual(trending.check(), [])
+        # A review counted in a daily bucket leaves it when deleted.
+        models.Review.objects.filter(ticket=self.calm, user=self.readers[1]).get().delete()
+        self.assertEqual(trending.check(), [])
+
+    def test_check_and_command(self):
+        self.review(self.hot, self.readers[0])
+        models.TicketActivity.objects.update(reviews=5)
+        with self.assertRaises(CommandError):
+            call_command('compact_trending', check=True, stdout=StringIO())
+        call_command('compact_trending', rebuild=True, stdout=StringIO())
+        call_command('compact_trending', check=True, stdout=StringIO())
+
+    def test_page_hides_blocked_authors(self):
+        self.review(self.hot, self.readers[0])
+        self.client.force_login(self.viewer)
+        response = self.client.get(reverse('trending'))
+        self.assertEqual(response.context['tickets'], [self.hot])
+        self.assertContains(response, '1 critique en 24 heures')
+        self.author.blocked.add(self.viewer)
+        social.clear_local()
+        response = self.client.get(reverse('trending'))
+        self.assertEqual(response.context['tickets'], [])
+
+
+class UsernameAutocompleteTests(TestCase):
+    """
+    Check the username prefix suggestions (views.username_autocomplete).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('Martin', password='password')
+        for username in ('marie', 'MARC', 'maxime', 'alice', 'Marguerite'):
+            User.objects.create_user(username, password='password')
+        cls.viewer.blocked.add(User.objects.get(username='Marguerite'))
+
+    def setUp(self):
+        cache.clear()
+        social.clear_local()
+        self.client.force_login(self.viewer)
+
+    def complete(self, prefix):
+        return self.client.get(reverse('username_autocomplete'), {'q': prefix})
+
+    def test_case_insensitive_prefix_without_viewer_nor_blocks(self):
+        response = self.complete('mAr')
+        self.assertEqual(
+            [user['username'] for user in response.json()['users']], ['MARC', 'marie'])
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertEqual(self.complete('m').json(), {'users': []})
+
+    def test_prefix_uses_the_lower_index(self):
+        lowered = Lower(Value('mar'))
+        plan = User.objects.annotate(lowered=Lower('username')).filter(
+            lowered__gte=lowered, lowered__lt=Concat(lowered, Value(chr(0x10FFFF))),
+        ).order_by('lowered').explain()
+        self.assertIn('user_username_lower_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    @mock.patch('blog.decorators.time')
+    def test_rate_limit(self, clock):
+        clock.time.return_value = 1003.0
+        for _ in range(30):
+            self.assertEqual(self.complete('mar').status_code, 200)
+        response = self.complete('mar')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '7')
+        # The limit is per user.
+        self.client.force_login(User.objects.get(username='alice'))
+        self.assertEqual(self.complete('mar').status_code, 200)
+        # And per window.
+        clock.time.return_value = 1010.0
+        self.client.force_login(self.viewer)
+        self.assertEqual(self.complete('mar').status_code, 200)
+
+
+class FeedPaginationTests(TestCase):
+    """
+    Check the keyset pagination of the feeds (feed.paginate_feed).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        cls.viewer.follows.add(cls.author)
+        tickets = [models.Ticket.objects.create(title=f'Billet {i}', user=cls.author)
+                   for i in range(8)]
+        for ticket in tickets[:5]:
+            models.Review.objects.create(
+                ticket=ticket, user=cls.author, headline='Critique', rating=3)
+        # Two groups of posts sharing their creation time: only the kind
+        # and the id tell them apart.
+        now = timezone.now()
+        for model in (models.Ticket, models.Review):
+            model.objects.filter(id__lte=3).update(time_created=now)
+            model.objects.filter(id__gt=3).update(time_created=now - timedelta(hours=1))
+        feed.rebuild_feed(cls.viewer)
+
+    def setUp(self):
+        cache.clear()
+        social.clear_local()
+        self.client.force_login(self.viewer)
+
+    def expected(self):
+        """
+        Return the posts of the viewer's feed in the feed order.
+        """
+        posts = [*models.Ticket.objects.all(), *models.Review.objects.all()]
+        return sorted(posts, key=lambda post: (
+            post.time_created,
+            feed.REVIEW if isinstance(post, models.Review) else feed.TICKET,
+            post.id), reverse=True)
+
+    def cursor_pages(self):
+        """
+        Follow the ?before= links of the home feed and return its pages.
+        """
+        pages, params = [], {}
+        while True:
+            page_obj = self.client.get(reverse('home'), params).context['page_obj']
+            pages.append(list(page_obj))
+            if not page_obj.has_next():
+                return pages
+            params = {'before': page_obj.next_cursor}
+
+    def test_ties_are_ordered_by_kind_and_id(self):
+        stored = self.cursor_pages()
+        self.assertEqual([post for page in stored for post in page], self.expected())
+        with override_settings(BLOG_FEED_STORE=False):
+            self.assertEqual(self.cursor_pages(), stored)
+
+    def test_numbered_pages_match_cursor_pages(self):
+        for number, page in enumerate(self.cursor_pages(), start=1):
+            with self.subTest(page=number):
+                response = self.client.get(reverse('home'), {'page': number})
+                self.assertEqual(list(response.context['page_obj']), page)
+
+    def test_invalid_cursors_fall_back_to_the_first_page(self):
+        first = self.cursor_pages()[0]
+        naive = feed.FeedCursor(datetime(2026, 1, 1), feed.TICKET, 1).encode()
+        unknown_kind = feed.FeedCursor(timezone.now(), 'user', 1).encode()
+        for value in ('not-a-cursor', '%%%', naive, unknown_kind, naive[:-3]):
+            with self.subTest(cursor=value):
+                page_obj = self.client.get(reverse('home'), {'before': value}).context['page_obj']
+                self.assertTrue(page_obj.is_first)
+                self.assertEqual(list(page_obj), first)
+
+    def test_posts_deleted_after_the_read_are_skipped(self):
+        rows = list(feed.stored_feed(self.viewer)[:3])
+        self.assertEqual(rows[0]['kind'], feed.TICKET)
+        models.Ticket.objects.get(id=rows[0]['object_id']).delete()
+        self.assertEqual(
+            [(feed.REVIEW if isinstance(post, models.Review) else feed.TICKET, post.id)
+             for post in feed.hydrate(rows)],
+            [(row['kind'], row['object_id']) for row in rows[1:]])
+
+
+class FeedStoreTests(TestCase):
+    """
+    Check the materialized home feeds (FeedEntry) against the live query.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        cls.other = User.objects.create_user('other', password='password')
+        cls.ticket = models.Ticket.objects.create(title='Billet', user=cls.author)
+        models.Review.objects.create(
+            ticket=cls.ticket, user=cls.author, headline='Critique', rating=4)
+        models.Ticket.objects.create(title='Autre billet', user=cls.other)
+
+    def assertConsistent(self, *users):
+        """
+        Check that the stored feed of each user matches the live query.
+        """
+        for user in users or (self.reader, self.author, self.other):
+            self.assertEqual(feed.check_feed(user), (set(), set()), user.username)
+
+    def stored(self, user):
+        return {(row['kind'], row['object_id']) for row in feed.stored_feed(user)}
+
+    def test_posts_fan_out_and_leave_on_delete(self):
+        self.reader.follows.add(self.author)
+        ticket = models.Ticket.objects.create(title='Nouveau', user=self.author)
+        review = models.Review.objects.create(
+            ticket=ticket, user=self.other, headline='Réponse', rating=2)
+        # The reply reaches the author of the ticket, who does not follow other.
+        self.assertIn((feed.REVIEW, review.id), self.stored(self.author))
+        self.assertIn((feed.TICKET, ticket.id), self.stored(self.reader))
+        self.assertConsistent()
+        ticket.delete()
+        self.assertNotIn((feed.REVIEW, review.id), self.stored(self.author))
+        self.assertConsistent()
+
+    def test_follows_backfill_and_prune(self):
+        self.reader.follows.add(self.author, self.other)
+        self.assertEqual(len(self.stored(self.reader)), 3)
+        self.assertConsistent()
+        self.reader.follows.remove(self.other)
+        self.assertConsistent()
+        # Reverse side, and clear() whose pks are saved during pre_clear.
+        self.other.followers.add(self.reader)
+        self.assertConsistent()
+        self.reader.follows.clear()
+        self.assertEqual(self.stored(self.reader), set())
+        self.assertConsistent()
+        self.author.followers.add(self.reader)
+        self.author.followers.clear()
+        self.assertConsistent()
+
+    def test_blocks_prune_and_backfill_both_sides(self):
+        self.reader.follows.add(self.author)
+        self.author.follows.add(self.reader)
+        models.Ticket.objects.create(title='Billet du lecteur', user=self.reader)
+        self.reader.blocked.add(self.author)
+        self.assertFalse(models.FeedEntry.objects.filter(owner=self.reader, author=self.author))
+        self.assertFalse(models.FeedEntry.objects.filter(owner=self.author, author=self.reader))
+        self.assertConsistent()
+        self.reader.blocked.remove(self.author)
+        self.assertConsistent()
+        self.author.blocked_by.add(self.reader)
+        self.assertConsistent()
+        self.reader.blocked.clear()
+        self.assertConsistent()
+
+    def test_command_detects_and_repairs_a_corrupted_store(self):
+        self.reader.follows.add(self.author)
+        call_command('rebuild_feed', check=True, stdout=StringIO())
+        models.FeedEntry.objects.filter(owner=self.reader, kind=feed.TICKET).delete()
+        models.FeedEntry.objects.create(
+            owner=self.reader, author=self.other, kind=feed.TICKET,
+            ticket=models.Ticket.objects.get(user=self.other),
+            object_id=models.Ticket.objects.get(user=self.other).id,
+            time_created=timezone.now())
+        missing, extra = feed.check_feed(self.reader)
+        self.assertEqual((len(missing), len(extra)), (1, 1))
+        with self.assertRaises(CommandError):
+            call_command('rebuild_feed', check=True, stdout=StringIO())
+        call_command('rebuild_feed', usernames=['reader'], stdout=StringIO())
+        self.assertConsistent()
+
+
+class ReviewedTicketsTests(TestCase):
+    """
+    Check the tickets already reviewed by the viewer (views.reviewed_ticket_ids
+    and the is_reviewed_by tag).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='password')
+        cls.author = User.objects.create_user('author', password='password')
+        cls.viewer.follows.add(cls.author)
+        cls.reviewed = models.Ticket.objects.create(title='Déjà critiqué', user=cls.author)
+        cls.unreviewed = models.Ticket.objects.create(title='À critiquer', user=cls.author)
+        models.Review.objects.create(
+            ticket=cls.reviewed, user=cls.viewer, headline='Ma critique', rating=4)
+        cls.reply = models.Review.objects.create(
+            ticket=cls.reviewed, user=cls.author, headline='Sa critique', rating=2)
+        cls.other_reply = models.Review.objects.create(
+            ticket=cls.unreviewed, user=cls.author, headline='Autre', rating=3)
+
+    def test_tickets_and_nested_tickets_in_one_query(self):
+        with self.assertNumQueries(1):
+            reviewed = views.reviewed_ticket_ids(
+                self.viewer, [self.unreviewed, self.reply, self.other_reply])
+        self.assertEqual(reviewed, {self.reviewed.id})
+        with self.assertNumQueries(0):
+            self.assertEqual(views.reviewed_ticket_ids(self.viewer, []), set())
+
+    def test_tag_reads_the_set_or_falls_back_to_a_query(self):
+        template = Template(
+            '{% load blog_extras %}{% is_reviewed_by ticket user as done %}{{ done }}')
+        for ticket, expected in [(self.reviewed, 'True'), (self.unreviewed, 'False')]:
+            with self.subTest(ticket=ticket.title):
+                with self.assertNumQueries(0):
+                    self.assertEqual(template.render(Context({
+                        'ticket': ticket, 'user': self.viewer,
+                        'reviewed_ticket_ids': {self.reviewed.id}})), expected)
+                with self.assertNumQueries(1):
+                    self.assertEqual(template.render(Context({
+                        'ticket': ticket, 'user': self.viewer})), expected)
+
+    def test_page_offers_to_review_the_unreviewed_ticket_only(self):
+        self.client.force_login(self.viewer)
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['reviewed_ticket_ids'], {self.reviewed.id})
+        self.assertContains(response, reverse('create-review', args=[self.unreviewed.id]))
+        self.assertNotContains(response, reverse('create-review', args=[self.reviewed.id]))
+
+
+class MediaStorageTests(MediaTestCase):
+    """
+    Check the content-addressed storage and the release of media files.
+    """
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('author', password='password')
+
+    def create_ticket(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return models.Ticket.objects.create(title='Billet', user=self.user, **kwargs)
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.create_ticket(image=self.image_upload('a.png'))
+        second = self.create_ticket(image=self.image_upload('b.png'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image_variants['sizes'], second.image_variants['sizes'])
+        self.assertEqual(self.stored_files(), set(first.media_names()))
+        self.assertEqual(len(self.stored_files()), 1 + 2 * len(models.Ticket.IMAGE_VARIANT_WIDTHS))
+
+    # The claim of the second upload has expired.
+    @override_settings(MEDIA_CLAIM_SECONDS=0)
+    def test_replaced_or_cleared_image_kept_while_shared(self):
+        first = self.create_ticket(image=self.image_upload('a.png'))
+        second = self.create_ticket(image=self.image_upload('b.png'))
+        shared = set(second.media_names())
+        with self.captureOnCommitCallbacks(execute=True):
+            first.image = self.image_upload('c.png', color='blue')
+            first.save()
+        self.assertEqual(self.stored_files(), shared | set(first.media_names()))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.image = None
+            second.save()
+        self.assertEqual(self.stored_files(), set(first.media_names()))
+
+    @override_settings(MEDIA_CLAIM_SECONDS=0)
+    def test_last_reference_deleted_removes_the_files(self):
+        first = self.create_ticket(image=self.image_upload('a.png'))
+        second = self.create_ticket(image=self.image_upload('b.png'))
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.stored_files(), set(second.media_names()))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.stored_files(), set())
+
+    def test_reused_file_kept_until_its_row_is_saved(self):
+        ticket = self.create_ticket(image=self.image_upload('a.png'))
+        # Another request stores the same upload, and has not saved its row.
+        pending = models.Ticket(title='Billet', user=self.user, image=self.image_upload('b.png'))
+        pending.prepare_image()
+        self.assertEqual(pending.media_names(), ticket.media_names())
+        self.assertTrue(storage.is_claimed(default_storage, pending.image.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.save()
+        self.assertEqual(self.stored_files(), set(pending.media_names()))
+
+    def test_reference_appearing_during_a_release_keeps_the_file(self):
+        ticket = self.create_ticket(image=self.image_upload())
+        name = ticket.image.name
+        models.Ticket.objects.filter(pk=ticket.pk).update(image='')
+        # A row references the file again once it was moved aside.
+        with mock.patch.object(storage, 'reference_count', side_effect=[0, 1]):
+            self.assertFalse(storage.delete_unreferenced(default_storage, name))
+        self.assertIn(name, self.stored_files())
+        self.assertTrue(storage.delete_unreferenced(default_storage, name))
+        self.assertNotIn(name, self.stored_files())
+
+    def test_variants_counted_through_their_family(self):
+        ticket = self.create_ticket(image=self.image_upload())
+        variant = ticket.image_variants['sizes']['200']['webp']
+        self.assertEqual(family(variant), family(ticket.image.name))
+        self.assertEqual(reference_count(variant), 1)
+        self.assertEqual(reference_count(ticket.image.name), 1)
+        self.assertEqual(reference_count(variant.replace('_200', '_1')), 1)
+        self.assertEqual(reference_count('ab/cd/' + 'ab' * 32 + '_200.webp'), 0)
+
+    def test_reference_count_reads_the_file_field_indexes(self):
+        ticket = self.create_ticket(image=self.image_upload())
+        names = [ticket.image.name, ticket.image_variants['sizes']['200']['webp']]
+        for name in names:
+            with self.subTest(name=name), CaptureQueriesContext(connection) as queries:
+                reference_count(name)
+            for query in queries:
+                sql = query['sql']
+                self.assertNotIn('LIKE', sql)
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                    plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertRegex(plan, r'USING (COVERING )?INDEX (ticket_image_idx|user_profile_photo_idx)')
+
+    def write_legacy(self, name, data):
+        """
+        Store a file under a name that is not content-addressed.
+        """
+        return FileSystemStorage(location=settings.MEDIA_ROOT).save(name, ContentFile(data))
+
+    def test_dedupe_media_moves_duplicates_and_reclaims_them(self):
+        data = self.image_upload().read()
+        cover = self.write_legacy('cover.png', data)
+        copy = self.write_legacy('cover_NMfYUX3.png', data)
+        variant = self.write_legacy('cover_200.webp', b'variant')
+        first = models.Ticket.objects.create(title='Premier', user=self.user)
+        second = models.Ticket.objects.create(title='Second', user=self.user)
+        models.Ticket.objects.filter(pk=first.pk).update(
+            image=cover, image_processed=True, image_variants={
+                'source': cover, 'sizes': {'200': {'webp': variant, 'width': 200}}})
+        models.Ticket.objects.filter(pk=second.pk).update(image=copy)
+        files = self.stored_files()
+        rows = list(models.Ticket.objects.values_list('image', 'image_variants'))
+
+        out = StringIO()
+        call_command('dedupe_media', dry_run=True, stdout=out)
+        self.assertIn('2 file(s) moved to 1 content-addressed file(s)', out.getvalue())
+        self.assertEqual(self.stored_files(), files)
+        self.assertEqual(list(models.Ticket.objects.values_list('image', 'image_variants')), rows)
+
+        call_command('dedupe_media', stdout=StringIO())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(ContentAddressedStorage.is_content_name(first.image.name))
+        self.assertEqual(first.image_hash, family(first.image.name).rsplit('/', 1)[1])
+        for name in first.media_names():
+            self.assertEqual(family(name), family(first.image.name))
+        self.assertEqual(self.stored_files(), set(first.media_names()))
+
+
+class ImageVariantTests(MediaTestCase):
+    """
+    Check the resized variants of ticket images and the markup using them.
+    """
+    def setUp(self):
+        super().setUp()
+        caches['fragments'].clear()
+        self.user = User.objects.create_user('author', password='password')
+        self.client.force_login(self.user)
+
+    def assertImage(self, name, image_format, size):
+        with default_storage.open(name) as file:
+            image = Image.open(file)
+            self.assertEqual((image.format, image.size), (image_format, size))
+
+    def test_variants_written_per_width_and_format(self):
+        ticket = models.Ticket.objects.create(
+            title='Billet', user=self.user, image=self.image_upload(size=(1200, 600)))
+        self.assertTrue(ticket.image_processed)
+        self.assertEqual((ticket.image_width, ticket.image_height), (800, 400))
+        self.assertImage(ticket.image.name, 'PNG', (800, 400))
+        self.assertEqual(ticket.image_variants['source'], ticket.image.name)
+        sizes = ticket.image_variants['sizes']
+        self.assertEqual(set(sizes), {'200', '800'})
+        for width, size in [('200', (200, 100)), ('800', (800, 400))]:
+            with self.subTest(width=width):
+                variant = sizes[width]
+                self.assertEqual((variant['width'], variant['height']), size)
+                self.assertImage(variant['webp'], 'WEBP', size)
+                self.assertImage(variant['jpg'], 'JPEG', size)
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.image_variants['sizes'], sizes)
+
+    def test_small_images_not_enlarged(self):
+        source = Image.new('RGBA', (120, 60), (0, 0, 255, 0))
+        variants = images.save_variants(
+            default_storage, 'ab/cd/' + 'ab' * 32 + '.png', source, (200, 800))
+        for width in ('200', '800'):
+            with self.subTest(width=width):
+                self.assertEqual((variants[width]['width'], variants[width]['height']), (120, 60))
+                self.assertImage(variants[width]['webp'], 'WEBP', (120, 60))
+                self.assertImage(variants[width]['jpg'], 'JPEG', (120, 60))
+
+    def test_card_renders_picture_with_srcsets(self):
+        ticket = models.Ticket.objects.create(
+            title='Billet', user=self.user, image=self.image_upload(size=(1200, 600)))
+        sizes = ticket.image_variants['sizes']
+        url = default_storage.url
+        response = self.client.get(reverse('view-ticket', args=[ticket.id]))
+        self.assertContains(response, '<picture>')
+        self.assertContains(
+            response,
+            f'<source type="image/webp" srcset="{url(sizes["200"]["webp"])} 200w, '
+            f'{url(sizes["800"]["webp"])} 800w" sizes="200px">')
+        self.assertContains(response, f'src="{url(sizes["200"]["jpg"])}"')
+        self.assertContains(
+            response,
+            f'srcset="{url(sizes["200"]["jpg"])} 200w, {url(sizes["800"]["jpg"])} 800w"')
+        self.assertContains(response, 'width="200" height="100"')
+
+    def test_card_without_variants_shows_the_image(self):
+        ticket = models.Ticket.objects.create(
+            title='Billet', user=self.user, image=self.image_upload(size=(300, 150)))
+        models.Ticket.objects.filter(pk=ticket.pk).update(image_variants={}, image_processed=False)
+        response = self.client.get(reverse('view-ticket', args=[ticket.id]))
+        self.assertNotContains(response, '<picture>')
+        self.assertContains(response, f'src="{ticket.image.url}"')
+        self.assertContains(response, 'width="300" height="150"')
+
+    def test_build_image_variants_processes_stored_images(self):
+        ticket = models.Ticket.objects.create(
+            title='Billet', user=self.user, image=self.image_upload(size=(300, 150)))
+        processed = models.Ticket.objects.values(*models.Ticket.IMAGE_METADATA_FIELDS).get()
+        models.Ticket.objects.filter(pk=ticket.pk).update(
+            image_variants={}, image_hash='', image_width=None, image_height=None,
+            image_processed=False)
+        missing = models.Ticket.objects.create(title='Perdu', user=self.user)
+        models.Ticket.objects.filter(pk=missing.pk).update(image='gone.png')
+
+        out, err = StringIO(), StringIO()
+        call_command('build_image_variants', stdout=out, stderr=err)
+        self.assertIn('1 ticket image(s) processed', out.getvalue())
+        self.assertIn(f'Ticket {missing.pk}: missing file gone.png', err.getvalue())
+        self.assertEqual(
+            models.Ticket.objects.values(*models.Ticket.IMAGE_METADATA_FIELDS).get(pk=ticket.pk),
+            processed)
+
+        out = StringIO()
+        call_command('build_image_variants', stdout=out, stderr=StringIO())
+        self.assertIn('0 ticket image(s) processed', out.getvalue())
+        call_command('build_image_variants', force=True, stdout=out, stderr=StringIO())
+        self.assertIn('1 ticket image(s) processed', out.getvalue())
+
+
+class TicketImageEditTests(MediaTestCase):
+    """
+    Check that editing a ticket only processes its image when it changes.
+    """
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('author', password='password')
+        self.client.force_login(self.user)
+        self.ticket = models.Ticket.objects.create(
+            title='Billet', user=self.user, image=self.image_upload(size=(1200, 600)))
+
+    def edit(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('edit_ticket', args=[self.ticket.id]),
+                {'edit_ticket': True, 'title': 'Billet', 'description': '', **data})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        return models.Ticket.objects.get(pk=self.ticket.pk)
+
+    def image_state(self, ticket):
+        return (ticket.image.name, *(getattr(ticket, field)
+                                     for field in models.Ticket.IMAGE_METADATA_FIELDS))
+
+    def test_text_edit_leaves_the_image_untouched(self):
+        before = self.image_state(self.ticket)
+        files = self.stored_files()
+        with mock.patch.object(images, 'open_image', wraps=images.open_image) as open_image, \
+                mock.patch.object(models.Ticket, 'resize_image') as resize_image:
+            ticket = self.edit(title='Nouveau titre', description='Texte')
+        open_image.assert_not_called()
+        resize_image.assert_not_called()
+        self.assertEqual(ticket.title, 'Nouveau titre')
+        self.assertEqual(self.image_state(ticket), before)
+        self.assertEqual(self.stored_files(), files)
+
+    def test_new_upload_reprocessed_and_old_files_released(self):
+        old_files = set(self.ticket.media_names())
+        ticket = self.edit(image=self.image_upload(size=(400, 900), color='blue'))
+        self.assertNotEqual(ticket.image_hash, self.ticket.image_hash)
+        self.assertEqual((ticket.image_width, ticket.image_height), (356, 800))
+        self.assertTrue(ticket.image_processed)
+        self.assertEqual(ticket.image_variants['source'], ticket.image.name)
+        self.assertFalse(old_files & self.stored_files())
+        self.assertEqual(self.stored_files(), set(ticket.media_names()))
+
+    def test_cleared_image_resets_metadata_and_releases_files(self):
+        ticket = self.edit(**{'image-clear': 'on'})
+        self.assertFalse(ticket.image)
+        self.assertEqual(self.image_state(ticket), ('', {}, '', None, None, False))
+        self.assertEqual(self.stored_files(), set())
+
+
+class SQLitePragmaTests(SimpleTestCase):
+    """
+    Check the pragmas of the SQLite profiles and their overrides.
+    """
+    settings_path = settings.BASE_DIR / 'litrevu' / 'settings.py'
+
+    def open_connection(self, pragmas):
+        """
+        Open a connection to a temporary database file with the given pragmas.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        wrapper = DatabaseWrapper(
+            {**connection.settings_dict, 'NAME': f'{directory}/db.sqlite3'}, alias='pragmas')
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            wrapper.connect()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def load_settings(self, **environ):
+        with mock.patch.dict('os.environ', environ):
+            for name in ('LITREVU_DB_PROFILE', 'LITREVU_SQLITE_BUSY_TIMEOUT'):
+                if name not in environ:
+                    os.environ.pop(name, None)
+            return runpy.run_path(str(self.settings_path))
+
+    def test_production_profile_set_on_new_connections(self):
+        wrapper = self.open_connection(settings.SQLITE_PROFILES['production'])
+        with wrapper.cursor() as cursor:
+            values = {}
+            for name in sqlite.PRAGMAS:
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+        self.assertEqual(values, {
+            'journal_mode': 'wal',
+            'synchronous': 1,  # NORMAL
+            'busy_timeout': 5000,
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,
+        })
+
+    def test_settings_read_the_profile_and_overrides(self):
+        self.assertEqual(self.load_settings()['SQLITE_PRAGMAS'], {})
+        pragmas = self.load_settings(
+            LITREVU_DB_PROFILE='production', LITREVU_SQLITE_BUSY_TIMEOUT='10000',
+        )['SQLITE_PRAGMAS']
+        self.assertEqual(pragmas, {
+            **settings.SQLITE_PROFILES['production'], 'busy_timeout': '10000'})
+        with self.assertRaisesMessage(ImproperlyConfigured, "Unknown LITREVU_DB_PROFILE 'prod'"):
+            self.load_settings(LITREVU_DB_PROFILE='prod')
+
+    def test_invalid_pragmas_rejected(self):
+        for pragmas in [
+            {'journal_mode': 'WAL; DROP TABLE blog_ticket'},
+            {'journal_mode': 'FAST'},
+            {'synchronous': 'SOMETIMES'},
+            {'busy_timeout': '5s'},
+            {'mmap_size': '1e9'},
+            {'temp_store': 'MEMORY'},
+        ]:
+            with self.subTest(pragmas=pragmas), self.assertRaises(ImproperlyConfigured):
+                sqlite.pragma_statements(pragmas)
+        with self.assertRaisesMessage(
+                ImproperlyConfigured, "Invalid value for the SQLite pragma busy_timeout: 'soon'"):
+            self.open_connection({'busy_timeout': 'soon'})
+
+
+@override_settings(WRITE_RETRY_ATTEMPTS=3, WRITE_RETRY_BASE_DELAY=0)
+class WriteSlotTests(MediaTestCase):
+    """
+    Check that views hold the write slot for their writes only.
+    """
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('author', password='password')
+        self.client.force_login(self.user)
+        self.in_slot = False
+        self.calls = []
+        for target, name, wrapper in [
+                (writes.queue, 'slot', self.tracked_slot),
+                (images, 'open_image', self.tracked_call),
+                (views, 'render', self.tracked_call)]:
+            patcher = mock.patch.object(target, name, wrapper(name, getattr(target, name)))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tracked_slot(self, name, slot):
+        """
+        Wrap WriteQueue.slot to record when the slot is held.
+        """
+        @contextmanager
+        def tracked():
+            with slot():
+                self.in_slot = True
+                try:
+                    yield
+                finally:
+                    self.in_slot = False
+        return tracked
+
+    def tracked_call(self, name, function):
+        """
+        Wrap function to record its calls as (name, called in the slot).
+        """
+        def tracked(*args, **kwargs):
+            self.calls.append((name, self.in_slot))
+            return function(*args, **kwargs)
+        return tracked
+
+    def post_ticket(self, **data):
+        return self.client.post(reverse('create-ticket'), {
+            'title': 'Billet', 'edit_ticket': True, 'publish_anyway': '1',
+            'image': self.image_upload(), **data})
+
+    def test_image_processed_before_the_write(self):
+        admitted = writes.queue.admitted
+        response = self.post_ticket()
+        ticket = models.Ticket.objects.get()
+        self.assertRedirects(response, reverse('view-ticket', args=[ticket.id]),
+                             fetch_redirect_response=False)
+        self.assertTrue(ticket.image_processed)
+        self.assertEqual(writes.queue.admitted - admitted, 1)
+        self.assertEqual(self.calls, [('open_image', False)] * 2)
+
+    def test_lock_retry_replays_the_write_only(self):
+        immediate_atomic = writes.immediate_atomic
+        attempts = []
+
+        @contextmanager
+        def locked_once(*args, **kwargs):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+            with immediate_atomic(*args, **kwargs):
+                yield
+
+        with mock.patch.object(writes, 'immediate_atomic', locked_once):
+            self.post_ticket()
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(models.Ticket.objects.count(), 1)
+        self.assertEqual(self.calls, [('open_image', False)] * 2)
+
+    def test_form_errors_rendered_without_the_slot(self):
+        admitted = writes.queue.admitted
+        response = self.post_ticket(title='')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(writes.queue.admitted, admitted)
+        self.assertEqual(self.calls, [('render', False)])
+
+    def test_password_checked_outside_the_slot(self):
+        self.client.logout()
+        check_password = self.tracked_call('check_password', User.check_password)
+        with mock.patch.object(User, 'check_password', check_password):
+            response = self.client.post(
+                reverse('login'), {'username': 'author', 'password': 'password'})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertEqual(self.calls, [('check_password', False)])
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_failed_logins_do_not_take_the_slot(self):
+        self.client.logout()
+        admitted = writes.queue.admitted
+        response = self.client.post(
+            reverse('login'), {'username': 'author', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(writes.queue.admitted, admitted)
+
+    def test_logout_deletes_the_session(self):
+        response = self.client.post(reverse('logout'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+class BenchmarkCommandTests(MediaTestCase):
+    """
+    Smoke-test the generate_dataset and benchmark_views commands on a tiny
+    dataset.
+    """
+    # As with DEBUG and no ALLOWED_HOSTS, the settings the command is run with.
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_generate_dataset_then_benchmark_views(self):
+        call_command('generate_dataset', users=3, tickets=5, reviews=5,
+                     image_rate=1, images=2, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='synthetic_').count(), 3)
+        self.assertEqual(models.Ticket.objects.count(), 5)
+        self.assertTrue(models.Review.objects.exists())
+        self.assertTrue(self.stored_files())
+        self.assertEqual(ratings.check_aggregates(), [])
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', users=3, stdout=StringIO())
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = os.path.join(directory, 'before.json')
+        call_command('benchmark_views', requests=2, users=2, output=output, stdout=StringIO())
+        with open(output, encoding='utf-8') as file:
+            results = json.load(file)
+        self.assertEqual(list(results['views']),
+                         ['home', 'display_posts', 'view_ticket', 'follow_users', 'search'])
+        for name, view in results['views'].items():
+            with self.subTest(view=name):
+                self.assertGreater(view['queries_max'], 0)
+        report = StringIO()
+        call_command('benchmark_views', requests=2, views=['home'], compare=output, stdout=report)
+        self.assertIn('home', report.getvalue())
+
+
+@override_settings(ALLOWED_HOSTS=['127.0.0.1'])
+class LoadTestCommandTests(TransactionTestCase):
+    """
+    Smoke-test the load_test command against the in-process server, which
+    reads the committed rows from its own threads.
+    """
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        media_settings = override_settings(MEDIA_ROOT=directory)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.output = os.path.join(directory, 'load.json')
+        cache.clear()
+        social.clear_local()
+
+    def test_sessions_run_against_the_in_process_server(self):
+        with self.assertRaises(CommandError):
+            call_command('load_test', duration=1, workers=1, stdout=StringIO())
+        call_command('generate_dataset', users=3, tickets=5, reviews=5, stdout=StringIO())
+        call_command('load_test', duration=1, workers=1, output=self.output, stdout=StringIO())
+        with open(self.output, encoding='utf-8') as file:
+            results = json.load(file)
+        self.assertGreater(results['requests'], 0)
+        self.assertEqual(results['failed_logins'], 0)
+        self.assertEqual(results['errors'], 0)
+        self.assertEqual(results['server'], 'wsgi')
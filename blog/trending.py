@@ -0,0 +1,228 @@
+"""
+docstring: blog/trending.py
+This module ranks the tickets that received the most reviews recently.
+It includes:
+- hour_bucket, day_bucket, window_start: The periods of the counters.
+- count_review, uncount_review: Count a created or deleted review in the
+  hourly bucket of its ticket.
+- top_tickets: The most reviewed tickets of a window, cached briefly.
+- trending_tickets: The same tickets, loaded for the cards of a viewer.
+- compact, rebuild, check: Maintenance of the TicketActivity buckets.
+
+Reviews are counted per ticket and hour in TicketActivity, by one upsert
+per review written. A window sums the buckets that start inside it, so a
+ranking reads the activity of the window only, whatever the number of
+reviews. The compact_trending command rolls the hourly buckets of the days
+before yesterday into daily ones, and deletes the buckets older than the
+longest window: the last day of the 7-day window is counted by whole days.
+"""
+from datetime import timedelta, timezone as dt_timezone
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from . import models
+
+# Windows of the trending page: ranked from the buckets starting at most
+# this long before the current hour (24h) or day (7d).
+WINDOWS = {
+    '24h': ('hours', 23),
+    '7d': ('days', 6),
+}
+TOP_K = 20
+# Tickets kept in the cached ranking, before the blocks of a viewer.
+CANDIDATES = 50
+CACHE_KEY = 'trending:{}'
+CACHE_TIMEOUT = 60
+# Hourly buckets are kept for today and yesterday, the longest window
+# needing hours; all buckets are kept for RETENTION days.
+HOURLY_DAYS = 1
+RETENTION = timedelta(days=7)
+
+
+def hour_bucket(moment):
+    """
+    Return the start of the UTC hour of moment.
+    """
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(moment):
+    """
+    Return the start of the UTC day of moment.
+    """
+    return hour_bucket(moment).replace(hour=0)
+
+
+def window_start(window, now=None):
+    """
+    Return the start of the oldest bucket summed by a window of WINDOWS.
+    """
+    now = now or timezone.now()
+    unit, count = WINDOWS[window]
+    if unit == 'hours':
+        return hour_bucket(now) - timedelta(hours=count)
+    return day_bucket(now) - timedelta(days=count)
+
+
+def _upsert(rows):
+    """
+    Add (ticket_id, bucket, hours, reviews) rows to the counters, in one
+    statement per row.
+    """
+    alias = router.db_for_write(models.TicketActivity)
+    connection = connections[alias]
+    table = models.TicketActivity._meta.db_table
+    sql = f"""
+        INSERT INTO {table} (ticket_id, bucket, hours, reviews) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (ticket_id, bucket, hours) DO UPDATE SET reviews = reviews + excluded.reviews
+    """
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (ticket_id, connection.ops.adapt_datetimefield_value(bucket), hours, reviews)
+            for ticket_id, bucket, hours, reviews in rows
+        ])
+
+
+def count_review(review):
+    """
+    Count a new review in the hourly bucket of its ticket.
+    """
+    _upsert([(review.ticket_id, hour_bucket(review.time_created),
+              models.TicketActivity.HOUR, 1)])
+
+
+def uncount_review(review):
+    """
+    Remove a deleted review from the bucket it was counted in: its hour,
+    or its day once compacted.
+    """
+    activity = models.TicketActivity.objects.filter(
+        ticket_id=review.ticket_id, reviews__gt=0)
+    if not activity.filter(
+            bucket=hour_bucket(review.time_created),
+            hours=models.TicketActivity.HOUR).update(reviews=F('reviews') - 1):
+        activity.filter(
+            bucket=day_bucket(review.time_created),
+            hours=models.TicketActivity.DAY).update(reviews=F('reviews') - 1)
+
+
+def top_tickets(window):
+    """
+    Return the most reviewed tickets of a window, read from the cache or
+    summed from the buckets of the window.
+
+    Args:
+        window (str): A key of WINDOWS.
+
+    Returns:
+        list: Up to CANDIDATES (ticket_id, reviews) pairs, most reviewed first.
+    """
+    key = CACHE_KEY.format(window)
+    top = cache.get(key)
+    if top is None:
+        top = list(
+            models.TicketActivity.objects
+            .filter(bucket__gte=window_start(window))
+            .values('ticket')
+            .annotate(total=Sum('reviews'))
+            .filter(total__gt=0)
+            .order_by('-total', '-ticket')
+            .values_list('ticket', 'total')[:CANDIDATES])
+        cache.set(key, top, CACHE_TIMEOUT)
+    return top
+
+
+def trending_tickets(window, hidden, limit=TOP_K):
+    """
+    Return the most reviewed tickets of a window, for the cards of a viewer.
+
+    Args:
+        window (str): A key of WINDOWS.
+        hidden (iterable): Ids of the users whose tickets are left out.
+        limit (int): Number of tickets returned.
+
+    Returns:
+        list: Ticket instances, most reviewed first, each with the number
+        of reviews of the window in recent_reviews.
+    """
+    top = top_tickets(window)
+    tickets = models.Ticket.objects.for_cards().filter(
+        id__in=[ticket_id for ticket_id, reviews in top]).exclude(user__in=hidden).in_bulk()
+    trending = []
+    for ticket_id, reviews in top:
+        ticket = tickets.get(ticket_id)
+        if ticket is not None:
+            ticket.recent_reviews = reviews
+            trending.append(ticket)
+    return trending[:limit]
+
+
+def compact(now=None):
+    """
+    Roll the hourly buckets older than HOURLY_DAYS full days into daily
+    buckets, and delete the buckets older than RETENTION and the empty ones.
+
+    Returns:
+        tuple: The numbers of hourly buckets rolled up and of buckets deleted.
+    """
+    today = day_bucket(now or timezone.now())
+    hourly = models.TicketActivity.objects.filter(
+        hours=models.TicketActivity.HOUR,
+        bucket__lt=today - timedelta(days=HOURLY_DAYS))
+    with transaction.atomic(using=router.db_for_write(models.TicketActivity)):
+        days = (hourly.order_by()
+                .values('ticket', day=TruncDay('bucket', tzinfo=dt_timezone.utc))
+                .annotate(total=Sum('reviews')))
+        _upsert([(day['ticket'], day['day'], models.TicketActivity.DAY, day['total'])
+                 for day in days])
+        rolled, _ = hourly.delete()
+        deleted, _ = models.TicketActivity.objects.filter(
+            bucket__lt=today - RETENTION).delete()
+        empty, _ = models.TicketActivity.objects.filter(reviews__lte=0).delete()
+    return rolled, deleted + empty
+
+
+def rebuild(now=None):
+    """
+    Recount the buckets of the last RETENTION days from the reviews, then
+    compact them.
+
+    Returns:
+        int: The number of hourly buckets written.
+    """
+    now = now or timezone.now()
+    hours = (models.Review.objects
+             .filter(time_created__gte=day_bucket(now) - RETENTION)
+             .order_by()
+             .values('ticket', hour=TruncHour('time_created', tzinfo=dt_timezone.utc))
+             .annotate(total=Count('id')))
+    with transaction.atomic(using=router.db_for_write(models.TicketActivity)):
+        models.TicketActivity.objects.all().delete()
+        buckets = models.TicketActivity.objects.bulk_create(
+            (models.TicketActivity(ticket_id=hour['ticket'], bucket=hour['hour'],
+                                   hours=models.TicketActivity.HOUR, reviews=hour['total'])
+             for hour in hours.iterator()),
+            batch_size=2000)
+        compact(now)
+    return len(buckets)
+
+
+def check(now=None):
+    """
+    Return the ids of the tickets whose counted reviews, over the 7-day
+    window, differ from their reviews.
+    """
+    since = window_start('7d', now)
+    counted = dict(
+        models.TicketActivity.objects.filter(bucket__gte=since)
+        .values('ticket').annotate(total=Sum('reviews')).filter(total__gt=0)
+        .values_list('ticket', 'total'))
+    live = dict(
+        models.Review.objects.filter(time_created__gte=since).order_by()
+        .values('ticket').annotate(total=Count('id'))
+        .values_list('ticket', 'total'))
+    return sorted(
+        ticket_id for ticket_id in counted.keys() | live.keys()
+        if counted.get(ticket_id) != live.get(ticket_id))
@@ -7,73 +7,121 @@ It includes functionality for creating, editing,
 deleting, and viewing tickets and reviews,
 as well as user follow management.
 """
-from itertools import chain
+from functools import partial
+from urllib.parse import urlencode
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.db.models import Value
+from django.db.models.functions import Concat, Lower
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
-from django.db.models import Q
-from . import forms, models
+from authentication import social
+from authentication.models import FollowSuggestion
+from litrevu import storage, writes
+from . import duplicates, feed, forms, models, search as post_search, trending as trends
+from .decorators import query_budget, rate_limit
 
 
 User = get_user_model()
+# Username autocomplete: shortest prefix looked up, and usernames returned.
+USERNAME_MIN_PREFIX = 2
+USERNAME_SUGGESTIONS = 8
+
+def reviewed_ticket_ids(user, posts):
+    """
+    Return the ids of the tickets, shown by the given posts, that the user reviewed.
+
+    Covers the tickets themselves and the tickets nested in reviews,
+    with a single query whatever the number of posts.
+
+    Args:
+        user (User): The viewer.
+        posts (iterable): Ticket and Review instances rendered on the page.
+
+    Returns:
+        set: Primary keys of the tickets already reviewed by the user.
+    """
+    ticket_ids = {
+        post.ticket_id if isinstance(post, models.Review) else post.id
+        for post in posts
+    }
+    if not ticket_ids:
+        return set()
+    return set(models.Review.objects.filter(
+        user=user, ticket_id__in=ticket_ids
+    ).values_list('ticket_id', flat=True))
+
+def duplicate_tickets(request, ticket_form):
+    """
+    Return the existing tickets similar to the one being created, unless
+    the user chose to publish it anyway.
+
+    When some are found, the uploaded image is kept for the form shown
+    again (see TicketForm.keep_image).
+
+    Args:
+        request (HttpRequest): The POST request of a valid ticket form.
+        ticket_form (TicketForm): The validated form.
+
+    Returns:
+        list: Dicts {'id', 'title', 'similarity'} (see blog.duplicates),
+        empty when the ticket can be saved.
+    """
+    if request.POST.get('publish_anyway'):
+        return []
+    similar = duplicates.similar_tickets(
+        ticket_form.cleaned_data['title'], social.get_graph(request.user).hidden)
+    if similar:
+        ticket_form.keep_image()
+    return similar
 
 @login_required
+@query_budget(7)
 def home(request):
     """
     Display the blog homepage with a paginated feed of tickets and reviews.
 
-    - Retrieves users the current user follows (including self) and handles block lists.
-    - Queries tickets and reviews by these users, excluding blocked ones.
-    - Merges and sorts results by creation time (newest first).
-    - Paginates the combined list (6 items per page).
+    - Reads the tickets and reviews visible to the current user from the
+      materialized feed store (see feed.home_feed), newest first.
+    - Paginates the feed (6 items per page), by cursor or by page number.
 
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        HttpResponse: Renders 'blog/home.html' with context {'page_obj'}.
-    """
-    following = list(request.user.follows.all()) + [request.user]
-    blocked = request.user.blocked.all()
-    blocked_by = request.user.blocked_by.all()
-    tickets = models.Ticket.objects.filter(user__in=following)\
-                                    .exclude(user__in=blocked)\
-                                    .exclude(user__in=blocked_by)
-    reviews = models.Review.objects.filter(
-        Q(user__in=following) | Q(ticket__user=request.user)
-    ).exclude(user__in=blocked).exclude(user__in=blocked_by)
-
-    tickets_and_reviews = sorted(
-        chain(tickets, reviews),
-        key=lambda instance : instance.time_created,
-        reverse=True
-    )
-    paginator = Paginator(tickets_and_reviews, 6)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        HttpResponse: Renders 'blog/home.html' with context
+        {'page_obj', 'reviewed_ticket_ids'}.
+    """
+    page_obj = feed.paginate_feed(request, feed.home_feed(request.user))
     context = {
         'page_obj': page_obj,
+        'reviewed_ticket_ids': reviewed_ticket_ids(request.user, page_obj),
         'show_edit': False,
     }
     return render(request,
                   'blog/home.html', context=context)
 
 @login_required
+@query_budget(7)
 def display_posts(request):
     """
     Display the current user's tickets and reviews.
 
     - Fetches tickets and reviews created by the user.
-    - Merges and sorts them by creation time (newest first).
-    - Paginates the list (6 items per page).
+    - Merges and sorts them by creation time (newest first) in the database.
+    - Paginates the merged list (6 items per page), by cursor or by page number.
 
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        HttpResponse: Renders 'blog/posts.html' with context {'page_obj'}.
+        HttpResponse: Renders 'blog/posts.html' with context
+        {'page_obj', 'reviewed_ticket_ids'}.
     """
     tickets = models.Ticket.objects.filter(
         user=request.user
@@ -81,37 +129,122 @@ def display_posts(request):
     reviews = models.Review.objects.filter(
         user=request.user
     )
-    tickets_and_reviews = sorted(
-        chain(tickets, reviews),
-        key=lambda instance : instance.time_created,
-        reverse=True
-    )
-    paginator = Paginator(tickets_and_reviews, 6)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = feed.paginate_feed(
+        request, partial(feed.merged_feed, tickets, reviews))
     context = {
         'page_obj': page_obj,
+        'reviewed_ticket_ids': reviewed_ticket_ids(request.user, page_obj),
         'show_edit': True,
     }
     return render(request,
                   'blog/posts.html', context=context)
 
 @login_required
+@query_budget(9)
+def search(request):
+    """
+    Search the tickets and reviews with the full-text index.
+
+    - Ranks the posts matching every word of ``?q=`` by relevance
+      (see blog.search), the last word also matching as a prefix.
+    - Leaves out the posts by users blocked by, or blocking, the viewer.
+    - Paginates the results (6 items per page) by page number.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: Renders 'blog/search.html' with context
+        {'query', 'page_obj', 'reviewed_ticket_ids'}.
+    """
+    query = request.GET.get('q', '')
+    page_obj = None
+    if query.strip():
+        results = post_search.search(query, social.get_graph(request.user))
+        page_obj = post_search.paginate_search(request, results)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'reviewed_ticket_ids': reviewed_ticket_ids(request.user, page_obj or []),
+        'show_edit': False,
+        'page_params': urlencode({'q': query}) + '&',
+        'max_results': post_search.MAX_RESULTS,
+    }
+    return render(request,
+                  'blog/search.html', context=context)
+
+@login_required
+@query_budget(7)
+def trending(request):
+    """
+    Display the tickets that received the most reviews in the last 24 hours
+    (default) or, with ``?window=7d``, the last 7 days.
+
+    The ranking is shared by all viewers and cached briefly (see
+    blog.trending); tickets by users blocked by, or blocking, the viewer
+    are left out.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: Renders 'blog/trending.html' with context
+        {'tickets', 'window', 'reviewed_ticket_ids'}.
+    """
+    window = request.GET.get('window')
+    if window not in trends.WINDOWS:
+        window = '24h'
+    tickets = trends.trending_tickets(
+        window, social.get_graph(request.user).hidden)
+    return render(request, 'blog/trending.html', {
+        'tickets': tickets,
+        'window': window,
+        'reviewed_ticket_ids': reviewed_ticket_ids(request.user, tickets),
+        'show_edit': False,
+    })
+
+@login_required
+@query_budget(2)
+def feed_events(request):
+    """
+    Live feed endpoint of the WSGI app.
+
+    Streams would each hold a worker thread, so they are only served by
+    the ASGI app (see blog.streams). Answers 204 No Content, which tells
+    EventSource not to reconnect.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: An empty 204 response.
+    """
+    return HttpResponse(status=204)
+
+@login_required
+@query_budget(13)
 def create_review(request, ticket_id):
     """
     Create a review for an existing ticket.
 
     - Displays an empty ReviewForm or processes a submitted form.
     - Associates the new review with the current user and specified ticket.
+    - A user reviews a ticket only once: if they already did, redirects
+      to the edition of their review.
 
     Args:
         request (HttpRequest): The HTTP request object.
         ticket_id (int): Primary key of the ticket to review.
 
     Returns:
-        HttpResponse: Renders 'blog/create_review.html' or redirects to 'view-review'.
+        HttpResponse: Renders 'blog/create_review.html' or redirects to
+        'view-review' or 'edit_review'.
     """
-    ticket = get_object_or_404(models.Ticket, id=ticket_id)
+    ticket = get_object_or_404(models.Ticket.objects.for_cards(), id=ticket_id)
+    existing = models.Review.objects.filter(
+        ticket=ticket, user=request.user).values_list('id', flat=True).first()
+    if existing is not None:
+        return redirect('edit_review', existing)
     review_form = forms.ReviewForm()
     if request.method == 'POST':
         review_form = forms.ReviewForm(request.POST)
@@ -119,7 +252,7 @@ def create_review(request, ticket_id):
             review = review_form.save(commit=False)
             review.user = request.user
             review.ticket = ticket
-            review.save()
+            writes.run_write(review.save)
             return redirect('view-review', review.id)
     return render(request,
                   'blog/create_review.html', context={
@@ -128,6 +261,7 @@ def create_review(request, ticket_id):
                   })
 
 @login_required
+@query_budget(21)
 def edit_ticket(request, ticket_id):
     """
     Edit or delete an existing ticket owned by the user.
@@ -149,12 +283,14 @@ def edit_ticket(request, ticket_id):
         if 'edit_ticket' in request.POST:
             ticket_form = forms.TicketForm(request.POST, request.FILES, instance=ticket)
             if ticket_form.is_valid():
-                ticket_form.save()
+                ticket = ticket_form.save(commit=False)
+                ticket.prepare_image()
+                writes.run_write(ticket.save)
                 return redirect(settings.LOGIN_REDIRECT_URL)
         if 'delete_ticket' in request.POST:
             delete_form = forms.DeleteTicketForm(request.POST)
             if delete_form.is_valid:
-                ticket.delete()
+                writes.run_write(ticket.delete)
                 return redirect(settings.LOGIN_REDIRECT_URL)
     context={
         'ticket_form':ticket_form,
@@ -163,6 +299,7 @@ def edit_ticket(request, ticket_id):
     return render(request, 'blog/edit_ticket.html', context=context)
 
 @login_required
+@query_budget(7)
 def edit_review(request, review_id):
     """
     Edit or delete an existing review owned by the user.
@@ -177,19 +314,19 @@ def edit_review(request, review_id):
     Returns:
         HttpResponse: Renders 'blog/edit_review.html' or redirects on success.
     """
-    review = get_object_or_404(models.Review, id=review_id)
+    review = get_object_or_404(models.Review.objects.for_cards(), id=review_id)
     review_form = forms.ReviewForm(instance=review)
     delete_form = forms.DeleteReviewForm()
     if request.method == 'POST':
         if 'edit_review' in request.POST:
             review_form = forms.ReviewForm(request.POST, instance=review)
             if review_form.is_valid():
-                review_form.save()
+                writes.run_write(review_form.save)
                 return redirect('view-review', review.id)
         if 'delete_review' in request.POST:
             delete_form = forms.DeleteReviewForm(request.POST)
             if delete_form.is_valid:
-                review.delete
+                writes.run_write(review.delete)
                 return redirect('posts')
     context={
         'review_form':review_form,
@@ -199,12 +336,15 @@ def edit_review(request, review_id):
     return render(request, 'blog/edit_review.html', context=context)
 
 @login_required
+@query_budget(17)
 def create_ticket_and_review(request):
     """
     Create both a ticket and its initial review in a single form.
 
     - Displays two forms (TicketForm and ReviewForm) with prefixes.
-    - On POST, validates and saves both objects, linking them correctly.
+    - On POST, validates and saves both objects, linking them correctly,
+      unless similar tickets exist: they are shown first, with the
+      choice to review one of them or to publish anyway.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -214,48 +354,98 @@ def create_ticket_and_review(request):
     """
     ticket_form = forms.TicketForm(prefix='ticket')
     review_form = forms.ReviewForm(prefix='review')
+    similar = []
     if request.method == 'POST':
         ticket_form = forms.TicketForm(request.POST, request.FILES, prefix='ticket')
         review_form = forms.ReviewForm(request.POST, prefix='review')
-        if ticket_form.is_valid() and review_form.is_valid():
+        if (ticket_form.is_valid() and review_form.is_valid()
+                and not (similar := duplicate_tickets(request, ticket_form))):
             ticket = ticket_form.save(commit=False)
             ticket.user = request.user
-            ticket.save()
+            ticket.prepare_image()
             review = review_form.save(commit=False)
             review.user = request.user
-            review.ticket = ticket
-            review.save()
+
+            def publish():
+                ticket.save()
+                review.ticket = ticket
+                review.save()
+            writes.run_write(publish)
+            storage.release([ticket_form.cleaned_data['pending_image']])
             return redirect(settings.LOGIN_REDIRECT_URL)
     return render(request, 'blog/create_ticket_and_review.html', {
         'ticket_form': ticket_form,
         'review_form': review_form,
+        'similar_tickets': similar,
     })
 
 @login_required
+@query_budget(5)
+@cache_control(private=True, max_age=60)
+def similar_tickets(request):
+    """
+    Suggest the existing tickets whose title is close to ``?title=``,
+    while a ticket is being written (see static/js/similar_tickets.js).
+
+    Tickets by users blocked by, or blocking, the viewer are left out.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: {'tickets': [{'id', 'title', 'similarity', 'url',
+        'review_url'}]}, most similar first.
+    """
+    suggestions = duplicates.similar_tickets(
+        request.GET.get('title', '')[:models.Ticket._meta.get_field('title').max_length],
+        social.get_graph(request.user).hidden)
+    return JsonResponse({'tickets': [
+        {**ticket,
+         'url': reverse('view-ticket', args=[ticket['id']]),
+         'review_url': reverse('create-review', args=[ticket['id']])}
+        for ticket in suggestions
+    ]})
+
+@login_required
+@query_budget(7)
 def view_ticket(request, ticket_id):
     """
-    Display details of a single ticket.
+    Display details of a single ticket, with a keyset page of its reviews.
+
+    - ``?order=recent`` (default) or ``?order=rating`` sorts the reviews.
+    - Reviews by users blocked by, or blocking, the viewer are left out.
 
     Args:
         request (HttpRequest): The HTTP request object.
         ticket_id (int): Primary key of the ticket to view.
 
     Returns:
-        HttpResponse: Renders 'blog/view_ticket.html' with {'ticket'}.
+        HttpResponse: Renders 'blog/view_ticket.html' with
+        {'ticket', 'reviewed_ticket_ids', 'page_obj', 'order', 'page_params'}.
     """
-    ticket = get_object_or_404(models.Ticket, id=ticket_id)
+    ticket = get_object_or_404(models.Ticket.objects.for_cards(), id=ticket_id)
+    order = feed.review_order(request)
     return render(request,
                   'blog/view_ticket.html', {
                       'ticket': ticket,
+                      'reviewed_ticket_ids': reviewed_ticket_ids(
+                          request.user, [ticket]),
+                      'page_obj': feed.paginate_reviews(
+                          request, ticket.id, social.get_graph(request.user).hidden),
+                      'order': order,
+                      'page_params': urlencode({'order': order}) + '&',
                       'show_edit': True
                       })
 
 @login_required
+@query_budget(11)
 def create_ticket(request):
     """
     Create a new ticket.
 
     - Displays TicketForm or processes it on POST.
+    - Shows the existing tickets with a similar title instead of saving,
+      until the user chooses to publish anyway.
     - Associates the new ticket with the current user.
 
     Args:
@@ -265,17 +455,25 @@ def create_ticket(request):
         HttpResponse: Renders 'blog/create_ticket.html' or redirects.
     """
     ticket_form = forms.TicketForm()
+    similar = []
     if request.method == 'POST':
         ticket_form = forms.TicketForm(request.POST, request.FILES)
-        if ticket_form.is_valid():
+        if (ticket_form.is_valid()
+                and not (similar := duplicate_tickets(request, ticket_form))):
             ticket = ticket_form.save(commit=False)
             ticket.user = request.user
-            ticket.save()
+            ticket.prepare_image()
+            writes.run_write(ticket.save)
+            storage.release([ticket_form.cleaned_data['pending_image']])
             return redirect('view-ticket', ticket.id)
     return render(request,
-                  'blog/create_ticket.html', context={'ticket_form': ticket_form})
+                  'blog/create_ticket.html', context={
+                      'ticket_form': ticket_form,
+                      'similar_tickets': similar,
+                  })
 
 @login_required
+@query_budget(4)
 def view_review(request, review_id):
     """
     Display details of a single review.
@@ -285,41 +483,92 @@ def view_review(request, review_id):
         review_id (int): Primary key of the review to view.
 
     Returns:
-        HttpResponse: Renders 'blog/view_review.html' with {'review'}.
+        HttpResponse: Renders 'blog/view_review.html' with
+        {'review', 'reviewed_ticket_ids'}.
     """
-    review = get_object_or_404(models.Review, id=review_id)
+    review = get_object_or_404(models.Review.objects.for_cards(), id=review_id)
     return render(request,
                   'blog/view_review.html', context={
                       'review': review,
+                      'reviewed_ticket_ids': reviewed_ticket_ids(
+                          request.user, [review]),
                       'show_edit': True
                   })
 
 @login_required
+@query_budget(16)
 def follow_users(request):
     """
     Manage following/unfollowing other users.
 
     - Displays FollowUsersForm to select users to follow.
     - Saves changes and redirects to homepage.
+    - Reads the followed and blocked ids from the social graph cache.
+    - Suggests accounts followed by the users the viewer follows, computed
+      by the suggest_follows command; those followed or blocked since are
+      left out.
 
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        HttpResponse: Renders 'blog/follow_users_form.html' with {'form'}.
+        HttpResponse: Renders 'blog/follow_users_form.html' with
+        {'form', 'follows', 'followers', 'blocked_ids', 'suggestions'}.
     """
     form = forms.FollowUsersForm(instance=request.user)
     if request.method == 'POST':
         form = forms.FollowUsersForm(request.POST, instance=request.user)
         if form.is_valid():
-            form.save()
+            writes.run_write(form.save)
             return redirect('follow_users')
+    graph = social.get_graph(request.user)
     return render(request,
                   'blog/follow_users_form.html', context={
                       'form': form,
+                      'follows': User.objects.filter(pk__in=graph.follows),
+                      'followers': request.user.followers.all(),
+                      'blocked_ids': graph.blocked,
+                      'suggestions': FollowSuggestion.objects.filter(
+                          user=request.user).exclude(
+                          suggested__in=graph.follows | graph.hidden).select_related(
+                          'suggested').order_by('rank'),
                       })
 
 @login_required
+@rate_limit('username_autocomplete', limit=30, period=10)
+@query_budget(5)
+@cache_control(private=True, max_age=60)
+def username_autocomplete(request):
+    """
+    Suggest the usernames starting with ``?q=``, case-insensitively, while
+    the follow form is typed (see static/js/username_autocomplete.js).
+
+    The prefix is looked up as a range of the Lower('username') index;
+    the viewer and the users blocked by, or blocking, them are left out.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: {'users': [{'username', 'avatar'}]}, in alphabetical
+        order; 429 past the rate limit.
+    """
+    prefix = request.GET.get('q', '').strip()[:User._meta.get_field('username').max_length]
+    if len(prefix) < USERNAME_MIN_PREFIX:
+        return JsonResponse({'users': []})
+    lowered = Lower(Value(prefix))
+    users = User.objects.annotate(lowered=Lower('username')).filter(
+        lowered__gte=lowered, lowered__lt=Concat(lowered, Value(chr(0x10FFFF))),
+    ).exclude(
+        pk__in=social.get_graph(request.user).hidden | {request.user.pk},
+    ).only('username', 'profile_photo', 'avatar_variants').order_by('lowered')
+    return JsonResponse({'users': [
+        {'username': user.username, 'avatar': user.avatar_small_url}
+        for user in users[:USERNAME_SUGGESTIONS]
+    ]})
+
+@login_required
+@query_budget(12)
 def unfollow_users(request, user_id):
     """
     Unfollow a specific user.
@@ -332,10 +581,11 @@ def unfollow_users(request, user_id):
         HttpResponse: Redirects to 'follow_users' view.
     """
     target_user = get_object_or_404(User, id=user_id)
-    request.user.follows.remove(target_user)
+    writes.run_write(partial(request.user.follows.remove, target_user))
     return redirect('follow_users')
 
 @login_required
+@query_budget(19)
 def blocked_users(request, user_id):
     """
     Block the specified user for the current user.
@@ -345,10 +595,11 @@ def blocked_users(request, user_id):
     back to the follow users page.
     """
     target_user = get_object_or_404(User, id=user_id)
-    request.user.blocked.add(target_user)
+    writes.run_write(partial(request.user.blocked.add, target_user))
     return redirect('follow_users')
 
 @login_required
+@query_budget(18)
 def unblocked_users(request, user_id):
     """
     Unblock the specified user for the current user.
@@ -358,5 +609,20 @@ def unblocked_users(request, user_id):
     back to the follow users page.
     """
     target_user = get_object_or_404(User, id=user_id)
-    request.user.blocked.remove(target_user)
+    writes.run_write(partial(request.user.blocked.remove, target_user))
     return redirect('follow_users')
+
+@staff_member_required
+@query_budget(2)
+def runtime_stats(request):
+    """
+    Report the runtime counters of this process, as JSON (staff only).
+
+    Returns:
+        JsonResponse: The hit and miss counts of the card fragment cache,
+        and the depth, wait times and retries of the write queue.
+    """
+    return JsonResponse({
+        'fragment_cache': caches['fragments'].stats(),
+        'write_queue': writes.stats(),
+    })
@@ -0,0 +1,7 @@
+"""
+The litrevu project.
+
+Importing it connects the SQLite tuning of litrevu.sqlite to the database
+connections, whatever the installed apps.
+"""
+from . import sqlite  # noqa: F401
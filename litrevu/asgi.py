@@ -2,6 +2,10 @@
 ASGI config for litrevu project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Unless LITREVU_URLCONF says otherwise, it serves litrevu.asgi_urls, where
+the feed, posts, ticket and review pages are async views, and serves the
+live feed stream outside of Django's request handler (see blog.streams).
+Run it with e.g. ``uvicorn litrevu.asgi:application --workers 4``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +16,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'litrevu.settings')
+os.environ.setdefault('LITREVU_URLCONF', 'litrevu.asgi_urls')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from blog.streams import with_event_streams  # noqa: E402 (needs the apps loaded)
+
+application = with_event_streams(django_application)
@@ -0,0 +1,20 @@
+"""
+URL configuration served by litrevu.asgi.
+
+The read-only pages (home feed, posts, ticket and review) are served by
+the async views of blog.async_views; every other URL is the one of
+litrevu.urls. The async routes come first, so they take precedence.
+"""
+from django.urls import path
+import blog.async_views
+from litrevu import urls
+
+urlpatterns = [
+    path('home/', blog.async_views.home, name='home'),
+    path('posts', blog.async_views.display_posts, name='posts'),
+    path('ticket/<int:ticket_id>', blog.async_views.view_ticket,
+         name='view-ticket'),
+    path('review/<int:review_id>', blog.async_views.view_review,
+         name='view-review'),
+    *urls.urlpatterns,
+]
@@ -0,0 +1,53 @@
+"""
+Cache backends of the litrevu project.
+
+It includes:
+- StatsLocMemCache: Local-memory cache counting its hits and misses.
+
+The 'fragments' cache (see settings.CACHES) stores the rendered ticket and
+review cards. LocMemCache keeps its keys in least-recently-used order and
+culls the oldest ones past MAX_ENTRIES, which bounds its memory use.
+"""
+import threading
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class StatsLocMemCache(LocMemCache):
+    """
+    LocMemCache keeping hit and miss counters, reported by stats().
+
+    The counters are per process, like the cache itself.
+    """
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key, default=None, version=None):
+        sentinel = object()
+        value = super().get(key, sentinel, version)
+        self._count(value is not sentinel)
+        return default if value is sentinel else value
+
+    def stats(self):
+        """
+        Return the hit and miss counts, hit ratio and number of entries.
+        """
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 3) if lookups else None,
+            'entries': len(self._cache),
+            'max_entries': self._max_entries,
+        }
@@ -0,0 +1,179 @@
+"""
+Publish/subscribe of live events, for the Server-Sent Events endpoints.
+
+It includes:
+- InProcessBroker: Delivers messages to the subscribers of this process,
+  on their asyncio event loops.
+- CacheBroker: Delivers messages across processes through a shared cache,
+  polled by the subscribers.
+- get_broker: The broker of settings.EVENTS_BROKER.
+- publish, subscribe: Shortcuts to the configured broker.
+- feed_channel: Name of the channel of a user's home feed.
+
+Messages are published from sync code (signal handlers, after the commit)
+and consumed by async views: subscribe() is an async iterator yielding
+the messages of a channel, or None when nothing came for `heartbeat`
+seconds, so the view can keep the connection alive.
+Delivery is best effort: a subscriber that does not keep up loses the
+oldest messages, and nothing is replayed after a reconnection.
+"""
+import asyncio
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class InProcessBroker:
+    """
+    Broker reaching the subscribers of the current process only.
+
+    Each subscriber has a bounded asyncio.Queue; publish() may be called
+    from any thread and hands the message to the subscriber's event loop.
+    """
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, message)
+            except RuntimeError:
+                # The loop of the subscriber is closed.
+                pass
+
+    @staticmethod
+    def _put(queue, message):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    async def subscribe(self, channel, heartbeat=15):
+        queue = asyncio.Queue(self.max_queue)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscriber)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                subscribers = self._channels.get(channel)
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._channels[channel]
+
+    def subscribers(self, channel):
+        """
+        Return the number of subscribers of a channel in this process.
+        """
+        with self._lock:
+            return len(self._channels.get(channel, ()))
+
+
+class CacheBroker:
+    """
+    Broker sharing the messages through a Django cache, for several
+    processes: use a cache shared by them (Redis, Memcached, database).
+
+    A channel is a counter and one key per message; subscribers poll the
+    counter every poll_interval seconds and read the messages they missed.
+    """
+    def __init__(self, cache='default', poll_interval=1.0, timeout=300, max_batch=100):
+        self.cache_alias = cache
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_batch = max_batch
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def publish(self, channel, message):
+        key = f'events:{channel}'
+        self.cache.add(key, 0, None)
+        try:
+            number = self.cache.incr(key)
+        except ValueError:
+            # The counter was evicted meanwhile.
+            self.cache.add(key, 0, None)
+            number = self.cache.incr(key)
+        self.cache.set(f'{key}:{number}', message, self.timeout)
+
+    async def subscribe(self, channel, heartbeat=15):
+        key = f'events:{channel}'
+        seen = await self.cache.aget(key, 0)
+        idle_since = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            last = await self.cache.aget(key, 0)
+            if last < seen:
+                # The counter was evicted and restarted.
+                seen = 0
+            if last > seen:
+                numbers = range(max(seen + 1, last - self.max_batch + 1), last + 1)
+                messages = await self.cache.aget_many([f'{key}:{n}' for n in numbers])
+                seen = last
+                for number in numbers:
+                    if f'{key}:{number}' in messages:
+                        idle_since = time.monotonic()
+                        yield messages[f'{key}:{number}']
+            if time.monotonic() - idle_since >= heartbeat:
+                idle_since = time.monotonic()
+                yield None
+
+
+_broker = None
+
+
+def get_broker():
+    """
+    Return the broker configured by settings.EVENTS_BROKER, built once.
+    """
+    global _broker
+    if _broker is None:
+        config = settings.EVENTS_BROKER
+        _broker = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    """
+    Build the broker again when the tests override EVENTS_BROKER.
+    """
+    global _broker
+    if setting == 'EVENTS_BROKER':
+        _broker = None
+
+
+def publish(channel, message):
+    """
+    Publish a message (a JSON-serializable dict) on a channel.
+    """
+    get_broker().publish(channel, message)
+
+
+def subscribe(channel, heartbeat=15):
+    """
+    Return an async iterator over the messages of a channel, yielding None
+    when no message came for heartbeat seconds.
+    """
+    return get_broker().subscribe(channel, heartbeat)
+
+
+def feed_channel(user_id):
+    """
+    Return the channel of the new posts of a user's home feed.
+    """
+    return f'feed:{user_id}'
@@ -0,0 +1,149 @@
+"""
+Image processing helpers shared by the litrevu applications.
+
+It includes:
+- open_image: Decode an uploaded or stored image, applying its EXIF orientation.
+- encode: Encode an image as WebP or JPEG bytes.
+- encode_as: Encode an image in a Pillow format, such as its original one.
+- content_hash: Hash the bytes of an image file.
+- variant_name: Derive the storage name of a resized variant.
+- save_variants: Write the resized variants of an image to a storage.
+- square: Center-crop and resize an image to a square.
+- encode_within: Encode an image under a maximum number of bytes.
+
+Variants are written once, when an image is uploaded; templates only read
+the names recorded on the model and never trigger image processing.
+"""
+import hashlib
+from io import BytesIO
+from pathlib import PurePosixPath
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Pillow format name and encoder options for each variant file extension.
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def open_image(file):
+    """
+    Open an image file and return it upright, in RGB or RGBA mode.
+
+    The pixels are decoded right away, so the file can be closed afterwards.
+    """
+    file.seek(0)
+    image = Image.open(file)
+    image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    return image
+
+
+def encode(image, ext, **options):
+    """
+    Encode an image in the format of the given extension ('webp' or 'jpg').
+
+    No metadata (EXIF, ICC, XMP) is written. JPEG has no alpha channel:
+    transparent images are flattened on a white background.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    image_format, defaults = FORMATS[ext]
+    if image_format == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, image_format, **{**defaults, **options})
+    return buffer.getvalue()
+
+
+def encode_as(image, image_format):
+    """
+    Encode an image in the given Pillow format (e.g. 'JPEG', 'PNG').
+
+    Returns:
+        bytes: The encoded image.
+    """
+    if image_format == 'JPEG':
+        return encode(image, 'jpg')
+    buffer = BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def content_hash(data):
+    """
+    Return the SHA-256 hex digest of the bytes of a file.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def variant_name(name, label, ext):
+    """
+    Return the storage name of a variant, next to the source image.
+
+    Example: variant_name('ab/cd/abcd...ef.png', 200, 'webp')
+    -> 'ab/cd/abcd...ef_200.webp'
+    """
+    path = PurePosixPath(name)
+    return str(path.with_name(f'{path.stem}_{label}.{ext}'))
+
+
+def save_variants(storage, name, image, widths, exts=tuple(FORMATS)):
+    """
+    Write resized copies of an image, one per width and extension.
+
+    Each variant fits in a width x width box, preserving the aspect ratio;
+    images smaller than the box are not enlarged. The variants are named
+    after the source, so ContentAddressedStorage keeps an existing variant
+    rather than writing it again.
+
+    Args:
+        storage (Storage): The storage the variants are written to.
+        name (str): Storage name of the source image.
+        image (Image): The decoded source image.
+        widths (iterable): Bounding box sizes, in pixels.
+        exts (iterable): Extensions of the formats to write.
+
+    Returns:
+        dict: For each width (as a string), the storage name of each
+        extension and the 'width' and 'height' of the variant.
+    """
+    variants = {}
+    for width in widths:
+        resized = image.copy()
+        resized.thumbnail((width, width))
+        variant = {'width': resized.width, 'height': resized.height}
+        for ext in exts:
+            variant[ext] = storage.save(
+                variant_name(name, width, ext), ContentFile(encode(resized, ext)))
+        variants[str(width)] = variant
+    return variants
+
+
+def square(image, size):
+    """
+    Return the centered square crop of an image, resized to size x size.
+    """
+    return ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+
+
+def encode_within(image, ext, max_bytes, qualities=(85, 75, 65, 55, 45, 35)):
+    """
+    Encode an image with the best quality that fits in max_bytes.
+
+    The qualities are tried in order; if none fits, the last one is used.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    for quality in qualities:
+        data = encode(image, ext, quality=quality)
+        if len(data) <= max_bytes:
+            break
+    return data
@@ -0,0 +1,408 @@
+"""
+Load generator running scripted user sessions against the site over HTTP.
+
+It includes:
+- serve: Run litrevu.wsgi.application in a wsgiref server with a thread pool.
+- serve_asgi: Run litrevu.asgi.application in a uvicorn server.
+- Browser: A minimal HTTP client keeping cookies and the CSRF token.
+- SESSIONS: The scripted sessions (browse, post, review, follow).
+- run_workers: Run sessions from many threads for a given duration.
+- run_process: The same, as the target of a worker process.
+- report: Aggregate the recorded requests into throughput, latency
+  percentiles, error rate and "database is locked" counts.
+
+Used by the load_test management command. Sessions log in as existing
+users (see the generate_dataset command), so they exercise the real
+login, CSRF, multipart upload and redirect paths.
+"""
+import http.cookiejar
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from PIL import Image
+from litrevu import images, metrics
+
+NEXT_PAGE_RE = re.compile(r'href="\?before=([^"]+)"')
+TICKET_RE = re.compile(r'href="/ticket/(\d+)"')
+REVIEW_LINK_RE = re.compile(r'href="/ticket/(\d+)/create/review"')
+LOCKED = 'database is locked'
+
+
+class PooledWSGIServer(WSGIServer):
+    """
+    wsgiref server handling requests in a fixed pool of threads.
+
+    Like a threaded production server, the threads, and therefore their
+    database connections when CONN_MAX_AGE is set, are reused across requests.
+    """
+    request_queue_size = 128
+
+    def __init__(self, *args, threads=16, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class QuietHandler(WSGIRequestHandler):
+    """
+    Request handler that does not log every request to stderr.
+    """
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(application, host='127.0.0.1', port=0, threads=16):
+    """
+    Serve a WSGI application from a background thread.
+
+    Args:
+        application (callable): The WSGI application.
+        host (str): Interface to listen on.
+        port (int): Port to listen on; 0 picks a free one.
+        threads (int): Number of threads handling the requests.
+
+    Returns:
+        tuple: (server, base URL). Call server.shutdown() then
+        server.server_close() to stop it.
+    """
+    server = make_server(host, port, application,
+                         server_class=partial(PooledWSGIServer, threads=threads),
+                         handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_port}'
+
+
+class ASGIServer:
+    """
+    uvicorn server running its event loop in a background thread, stopped
+    like the wsgiref servers: shutdown(), then server_close().
+    """
+    def __init__(self, application, host, port):
+        import uvicorn
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.server_port = self.socket.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(
+            application, lifespan='off', log_level='warning', access_log=False,
+            backlog=PooledWSGIServer.request_queue_size))
+        self.thread = threading.Thread(
+            target=self.server.run, kwargs={'sockets': [self.socket]}, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started and self.thread.is_alive():
+            time.sleep(0.01)
+
+    def shutdown(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+    def server_close(self):
+        self.socket.close()
+
+
+def serve_asgi(application, host='127.0.0.1', port=0):
+    """
+    Serve an ASGI application with uvicorn from a background thread.
+
+    The sync parts of Django (sync middleware and views, templates run
+    with sync_to_async) use the thread pool of asgiref.
+
+    Args:
+        application (callable): The ASGI application.
+        host (str): Interface to listen on.
+        port (int): Port to listen on; 0 picks a free one.
+
+    Returns:
+        tuple: (server, base URL), as serve().
+
+    Raises:
+        ImportError: If uvicorn is not installed.
+    """
+    server = ASGIServer(application, host, port)
+    server.start()
+    return server, f'http://{host}:{server.server_port}'
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Browser:
+    """
+    HTTP client of one simulated user: keeps its cookies, sends the CSRF
+    token, and records every request in a shared list.
+
+    Redirects are not followed, so each request is timed on its own.
+    """
+    def __init__(self, base_url, records, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.records = records
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, action, path, data=None, files=None):
+        """
+        Send a GET, or a POST when data is given; record and return
+        (status, body text).
+
+        Args:
+            action (str): Label of the request in the report.
+            path (str): Path of the URL, e.g. '/home/'.
+            data (dict): Form fields; the CSRF token is added.
+            files (dict): Field name -> (file name, bytes, content type),
+                sent as multipart/form-data.
+        """
+        headers = {'Referer': self.base_url + '/'}
+        body = None
+        if data is not None:
+            data = {**data, 'csrfmiddlewaretoken': self.csrf_token()}
+            if files:
+                body, content_type = encode_multipart(data, files)
+            else:
+                body = urllib.parse.urlencode(data).encode()
+                content_type = 'application/x-www-form-urlencoded'
+            headers['Content-Type'] = content_type
+        request = urllib.request.Request(self.base_url + path, body, headers)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, text = response.status, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as error:
+            status, text = error.code, error.read().decode('utf-8', 'replace')
+        except OSError as error:
+            status, text = 0, str(error)
+        self.records.append({
+            'action': action,
+            'duration': time.perf_counter() - start,
+            'status': status,
+            'locked': (status == 0 or status >= 500) and LOCKED in text,
+        })
+        return status, text
+
+    def login(self, username, password):
+        """
+        Log in through the login page; return True on success.
+        """
+        self.request('login_form', '/')
+        status, _ = self.request('login', '/', {'username': username, 'password': password})
+        return status == 302
+
+
+def encode_multipart(fields, files):
+    """
+    Encode form fields and files as multipart/form-data.
+
+    Returns:
+        tuple: (body bytes, Content-Type header value).
+    """
+    boundary = uuid.uuid4().hex
+    lines = []
+    for name, value in fields.items():
+        lines += [f'--{boundary}'.encode(),
+                  f'Content-Disposition: form-data; name="{name}"'.encode(),
+                  b'', str(value).encode()]
+    for name, (filename, content, content_type) in files.items():
+        lines += [f'--{boundary}'.encode(),
+                  (f'Content-Disposition: form-data; name="{name}"; '
+                   f'filename="{filename}"').encode(),
+                  f'Content-Type: {content_type}'.encode(), b'', content]
+    lines += [f'--{boundary}--'.encode(), b'']
+    return b'\r\n'.join(lines), f'multipart/form-data; boundary={boundary}'
+
+
+def sample_image(seed):
+    """
+    Return the bytes of a small JPEG, different for each seed.
+    """
+    rng = random.Random(seed)
+    color = tuple(rng.randrange(256) for _ in range(3))
+    return images.encode_as(Image.new('RGB', (640, 480), color), 'JPEG')
+
+
+def browse(browser, rng, context):
+    """
+    Read the first home feed pages, then one of the tickets shown.
+    """
+    status, page = browser.request('home', '/home/')
+    ticket_ids = TICKET_RE.findall(page)
+    for _ in range(rng.randint(0, 2)):
+        cursor = NEXT_PAGE_RE.search(page)
+        if status != 200 or cursor is None:
+            break
+        status, page = browser.request('home_next', f'/home/?before={cursor.group(1)}')
+        ticket_ids += TICKET_RE.findall(page)
+    if ticket_ids:
+        browser.request('view_ticket', f'/ticket/{rng.choice(ticket_ids)}')
+
+
+def post(browser, rng, context):
+    """
+    Create a ticket with an image.
+    """
+    browser.request('create_ticket_form', '/create/ticket')
+    browser.request('create_ticket', '/create/ticket', {
+        'title': f'Livre {rng.randrange(10 ** 6)}',
+        'description': 'Ticket créé par le test de charge.',
+        'edit_ticket': 'on',
+    }, files={'image': ('cover.jpg', rng.choice(context['images']), 'image/jpeg')})
+
+
+def review(browser, rng, context):
+    """
+    Review one of the home feed tickets the user has not reviewed yet.
+    """
+    _, page = browser.request('home', '/home/')
+    ticket_ids = REVIEW_LINK_RE.findall(page)
+    if not ticket_ids:
+        return
+    path = f'/ticket/{rng.choice(ticket_ids)}/create/review'
+    browser.request('create_review_form', path)
+    browser.request('create_review', path, {
+        'headline': 'Critique', 'rating': rng.randint(1, 5),
+        'body': 'Critique écrite par le test de charge.', 'edit_review': 'on',
+    })
+
+
+def follow(browser, rng, context):
+    """
+    Open the follow page and follow a random user.
+    """
+    browser.request('follow_users_form', '/follow-users')
+    browser.request('follow_user', '/follow-users', {
+        'username': rng.choice(context['usernames'])})
+
+
+SESSIONS = {
+    'browse': browse,
+    'post': post,
+    'review': review,
+    'follow': follow,
+}
+
+
+def worker(base_url, context, mix, deadline, seed, records, failures):
+    """
+    Log in as a random user and run sessions picked from mix until deadline.
+    """
+    rng = random.Random(seed)
+    browser = Browser(base_url, records)
+    if not browser.login(rng.choice(context['usernames']), context['password']):
+        failures.append('login')
+        return
+    names, weights = zip(*mix.items())
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        SESSIONS[name](browser, rng, context)
+
+
+def run_workers(base_url, context, mix, workers, duration, seed=0):
+    """
+    Run workers concurrent threads of sessions for duration seconds.
+
+    Args:
+        base_url (str): URL of the site, e.g. 'http://127.0.0.1:8000'.
+        context (dict): 'usernames', 'password' and 'images' of the sessions.
+        mix (dict): Session name -> weight.
+        workers (int): Number of concurrent simulated users.
+        duration (float): Seconds of load.
+        seed (int): Seed of the workers' random generators.
+
+    Returns:
+        tuple: (list of request records, elapsed seconds, failed logins).
+    """
+    records, failures = [], []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=worker, args=(
+            base_url, context, mix, deadline, seed * 1000 + index, records, failures))
+        for index in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - start, len(failures)
+
+
+def run_process(args):
+    """
+    Call run_workers with a tuple of its arguments, from a worker process.
+
+    Returns:
+        tuple: (list of request records, failed logins).
+    """
+    records, _, failures = run_workers(*args)
+    return records, failures
+
+
+def is_error(record):
+    """
+    Return True if a request failed: no response, or a 4xx/5xx status.
+    """
+    return record['status'] == 0 or record['status'] >= 400
+
+
+def report(records, elapsed):
+    """
+    Aggregate request records.
+
+    Returns:
+        dict: Totals ('requests', 'throughput_rps', 'error_rate', 'locked')
+        and, under 'actions', the latency summary and errors per action.
+    """
+    actions = {}
+    for record in records:
+        actions.setdefault(record['action'], []).append(record)
+    errors = sum(1 for record in records if is_error(record))
+    return {
+        'requests': len(records),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(records) / elapsed, 2) if elapsed else None,
+        'errors': errors,
+        'error_rate': round(errors / len(records), 4) if records else None,
+        'locked': sum(1 for record in records if record['locked']),
+        **{f'all_{key}': value for key, value in metrics.summarize(
+            [record['duration'] for record in records]).items() if key != 'count'},
+        'actions': {
+            action: {
+                **metrics.summarize([record['duration'] for record in rows]),
+                'errors': sum(1 for record in rows if is_error(record)),
+                'locked': sum(1 for record in rows if record['locked']),
+            }
+            for action, rows in sorted(actions.items())
+        },
+    }
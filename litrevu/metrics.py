@@ -0,0 +1,49 @@
+"""
+Measurement helpers shared by the benchmark commands.
+
+It includes:
+- percentile: The nearest-rank percentile of a list of values.
+- summarize: Count, mean and p50/p95/p99 of durations, in milliseconds.
+"""
+import math
+
+
+def percentile(values, point):
+    """
+    Return the nearest-rank percentile of values (point in 0-100).
+
+    Args:
+        values (list): Sorted numbers.
+        point (float): The percentile to read, e.g. 95.
+
+    Returns:
+        float: The value below which point percent of values fall,
+        or None if values is empty.
+    """
+    if not values:
+        return None
+    rank = max(math.ceil(point / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def summarize(durations):
+    """
+    Summarize durations given in seconds.
+
+    Returns:
+        dict: 'count', and 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'
+        rounded to the microsecond (None when there are no durations).
+    """
+    values = sorted(duration * 1000 for duration in durations)
+
+    def ms(value):
+        return None if value is None else round(value, 3)
+
+    return {
+        'count': len(values),
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'p50_ms': ms(percentile(values, 50)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'max_ms': ms(values[-1]) if values else None,
+    }
@@ -0,0 +1,164 @@
+"""
+Read replicas: routing of the read-only requests away from the primary.
+
+It includes:
+- ReplicaRouter: Database router sending reads to the replica chosen for
+  the current request, and everything else to the primary ('default').
+- ReplicaMiddleware: Chooses a replica for the GET requests of the views
+  of settings.REPLICA_READ_VIEWS, unless the user wrote recently.
+- replica_aliases, is_primary: The configured replicas, and whether one
+  is the primary itself (a test mirror).
+
+A request that writes (any method but GET, HEAD, OPTIONS and TRACE) sets
+a cookie keeping the reads of the user on the primary for
+settings.REPLICA_STICKY_SECONDS, long enough for the replicas to catch up:
+a ticket shows up right after the redirect to its page.
+Sessions, users and their follows and blocks are always read from the
+primary, so a new account, a new login or a social graph read right after
+a change (see authentication.social) never depends on the replication lag.
+
+The replicas are the DATABASES aliases of settings.DATABASE_REPLICAS;
+locally they are SQLite copies of the primary refreshed by the
+sync_replicas command.
+"""
+import random
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+STICKY_COOKIE = 'primary_until'
+
+# Models read from the primary whatever the request.
+PRIMARY_MODELS = (
+    'sessions.session',
+    settings.AUTH_USER_MODEL.lower(),
+    f'{settings.AUTH_USER_MODEL.lower()}_follows',
+    f'{settings.AUTH_USER_MODEL.lower()}_blocked',
+)
+
+# Replica alias the reads of the current request go to, None for the primary.
+_replica = ContextVar('replica', default=None)
+
+
+def replica_aliases():
+    """
+    Return the aliases of the configured replicas.
+    """
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def is_primary(alias):
+    """
+    Return True if a replica alias is the primary database itself, as
+    test mirrors are.
+    """
+    if alias not in connections.settings:
+        return False
+    return (connections[alias].settings_dict['NAME']
+            == connections[DEFAULT_DB_ALIAS].settings_dict['NAME'])
+
+
+class ReplicaRouter:
+    """
+    Send reads to the replica of the current request, writes to the primary.
+
+    Outside of a routed request (commands, writes, sticky users), every
+    query goes to the primary.
+    """
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in PRIMARY_MODELS:
+            return DEFAULT_DB_ALIAS
+        return _replica.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the migrated primary.
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Route the reads of eligible GET requests to a random replica, and keep
+    the users who just wrote on the primary.
+
+    Must come first in settings.MIDDLEWARE, so the replica is released
+    once the response is complete. Works in sync and async mode, so that
+    the async views are not run in a thread under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # The handler runs a sync process_view in a thread; an async
+            # one is awaited in the request's context.
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _replica.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica.reset(token)
+        return self.stick(request, response)
+
+    async def __acall__(self, request):
+        token = _replica.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica.reset(token)
+        return self.stick(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        aliases = replica_aliases()
+        if (aliases and request.method in SAFE_METHODS
+                and view_func.__module__ in settings.REPLICA_READ_VIEWS
+                and not self.is_sticky(request)):
+            alias = random.choice(aliases)
+            if not is_primary(alias):
+                _replica.set(alias)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        ReplicaMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
+
+    @staticmethod
+    def stick(request, response):
+        """
+        Keep the reads of a user who wrote on the primary for
+        REPLICA_STICKY_SECONDS.
+        """
+        if request.method not in SAFE_METHODS:
+            window = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time() + window)), max_age=window,
+                httponly=True, samesite='Lax')
+        return response
+
+    @staticmethod
+    def is_sticky(request):
+        """
+        Return True if the user wrote less than REPLICA_STICKY_SECONDS ago.
+        """
+        try:
+            return float(request.COOKIES[STICKY_COOKIE]) > time.time()
+        except (KeyError, ValueError):
+            return False
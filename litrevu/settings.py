@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -42,8 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'litrevu.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'litrevu.writes.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -51,7 +54,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'litrevu.urls'
+# litrevu.asgi selects litrevu.asgi_urls, which serves the async feed views.
+ROOT_URLCONF = os.environ.get('LITREVU_URLCONF', 'litrevu.urls')
 
 TEMPLATES = [
     {
@@ -76,13 +80,67 @@ WSGI_APPLICATION = 'litrevu.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite profile, chosen with the LITREVU_DB_PROFILE environment variable.
+# 'production' turns on the write-ahead log (readers no longer block the
+# writer), a busy timeout, memory-mapped reads, a larger page cache and
+# persistent connections. Each pragma can be overridden on its own, e.g.
+# LITREVU_SQLITE_BUSY_TIMEOUT=10000; the pragmas are applied to every new
+# connection by litrevu.sqlite.
+SQLITE_PROFILES = {
+    'default': {},
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,  # milliseconds
+        'mmap_size': 256 * 1024 * 1024,  # bytes
+        'cache_size': -64 * 1024,  # negative: KiB, i.e. 64 MiB per connection
+    },
+}
+DB_PROFILE = os.environ.get('LITREVU_DB_PROFILE', 'default')
+if DB_PROFILE not in SQLITE_PROFILES:
+    raise ImproperlyConfigured(
+        f"Unknown LITREVU_DB_PROFILE {DB_PROFILE!r}, expected one of: "
+        f"{', '.join(SQLITE_PROFILES)}.")
+SQLITE_PRAGMAS = {
+    **SQLITE_PROFILES[DB_PROFILE],
+    **{
+        name: os.environ[f'LITREVU_SQLITE_{name.upper()}']
+        for name in SQLITE_PROFILES['production']
+        if f'LITREVU_SQLITE_{name.upper()}' in os.environ
+    },
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Seconds a connection is kept open between requests (0: closed after each).
+        'CONN_MAX_AGE': int(os.environ.get(
+            'LITREVU_CONN_MAX_AGE', 600 if DB_PROFILE == 'production' else 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas: LITREVU_DB_REPLICAS=2 adds the aliases 'replica1' and
+# 'replica2', SQLite copies of the primary refreshed by the sync_replicas
+# command. The GET requests of REPLICA_READ_VIEWS read from a random
+# replica, except for REPLICA_STICKY_SECONDS after the user wrote
+# (see litrevu.replicas): longer than the period of sync_replicas (a
+# minute from cron) and its copy. Tests use the primary for every replica.
+DATABASE_REPLICAS = [
+    f'replica{index}'
+    for index in range(1, int(os.environ.get('LITREVU_DB_REPLICAS', 0)) + 1)
+]
+for alias in DATABASE_REPLICAS:
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / f'db.{alias}.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['litrevu.replicas.ReplicaRouter']
+REPLICA_READ_VIEWS = ('blog.views', 'blog.async_views', 'authentication.views')
+REPLICA_STICKY_SECONDS = int(os.environ.get('LITREVU_REPLICA_STICKY_SECONDS', 90))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -140,3 +198,67 @@ LOGOUT_REDIRECT_URL ='login'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR.joinpath('media/')
+
+# Uploaded files are named after the hash of their content, so identical
+# uploads share one file (see litrevu/storage.py).
+STORAGES = {
+    'default': {
+        'BACKEND': 'litrevu.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Seconds a stored file reused by an upload is kept, even if released,
+# for the row about to reference it (see litrevu.storage).
+MEDIA_CLAIM_SECONDS = 60 * 60
+
+# Keep uploaded ticket images at their original size; by default they are
+# downscaled to Ticket.IMAGE_MAX_SIZE. Resized variants are built either way.
+TICKET_IMAGE_KEEP_ORIGINAL = False
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered ticket and review cards, keyed on the post id and update time.
+    # The least recently used cards are evicted past MAX_ENTRIES.
+    'fragments': {
+        'BACKEND': 'litrevu.cache.StatsLocMemCache',
+        'LOCATION': 'fragments',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 5000, 'CULL_FREQUENCY': 10},
+    },
+}
+
+# Per-process LRU of the social graphs (authentication.social): number of
+# users kept, and seconds before a graph is read again. SOCIAL_GRAPH_CACHE
+# names a cache shared by the processes (e.g. Redis) to keep the graphs in
+# as well; never a LocMemCache, which the other processes cannot invalidate.
+SOCIAL_GRAPH_LRU_SIZE = 1024
+SOCIAL_GRAPH_LOCAL_TTL = 5
+SOCIAL_GRAPH_CACHE = None
+
+# Write requests (litrevu.writes): attempts when the SQLite write lock cannot
+# be obtained, and bounds of the jittered exponential backoff, in seconds.
+WRITE_RETRY_ATTEMPTS = 5
+WRITE_RETRY_BASE_DELAY = 0.02
+WRITE_RETRY_MAX_DELAY = 0.5
+
+# Read the home feed from the materialized FeedEntry store (fan-out on write).
+# Set to False to merge the feed from the ticket and review tables instead.
+BLOG_FEED_STORE = True
+
+# Live feed notices (litrevu.events), streamed by the Server-Sent Events
+# endpoint of the ASGI app. The in-process broker only reaches the clients
+# connected to the process of the author; with several processes, use
+# 'litrevu.events.CacheBroker' over a cache they share.
+EVENTS_BROKER = {
+    'BACKEND': 'litrevu.events.InProcessBroker',
+    'OPTIONS': {'max_queue': 100},
+}
+# Seconds between two keep-alive comments, and before a stream is closed
+# (the browser then reconnects).
+EVENTS_HEARTBEAT = 15
+EVENTS_MAX_AGE = 300
@@ -0,0 +1,64 @@
+"""
+SQLite tuning applied to every new database connection.
+
+It includes:
+- pragma_statements: The PRAGMA statements of settings.SQLITE_PRAGMAS.
+- apply_pragmas: connection_created receiver running them, connected when
+  the litrevu package is imported (see litrevu/__init__.py).
+
+The pragmas are chosen by the database profile (see SQLITE_PROFILES in
+the settings); with the default profile none is set.
+"""
+import re
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size')
+# Values of the keyword pragmas; the others take an integer.
+KEYWORDS = {
+    'journal_mode': ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'),
+    'synchronous': ('OFF', 'NORMAL', 'FULL', 'EXTRA'),
+}
+INTEGER_RE = re.compile(r'^-?\d+$')
+
+
+def pragma_statements(pragmas):
+    """
+    Return the PRAGMA statements setting the given pragmas, in PRAGMAS order.
+
+    Raises:
+        ImproperlyConfigured: If a pragma or a value is not allowed.
+    """
+    unknown = set(pragmas) - set(PRAGMAS)
+    if unknown:
+        raise ImproperlyConfigured(f"Unsupported SQLite pragmas: {', '.join(sorted(unknown))}.")
+    statements = []
+    for name in PRAGMAS:
+        if name not in pragmas:
+            continue
+        value = str(pragmas[name])
+        if name in KEYWORDS:
+            valid = value.upper() in KEYWORDS[name]
+        else:
+            valid = bool(INTEGER_RE.match(value))
+        if not valid:
+            raise ImproperlyConfigured(f"Invalid value for the SQLite pragma {name}: {value!r}.")
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    """
+    Set settings.SQLITE_PRAGMAS on a new SQLite connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    statements = pragma_statements(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if not statements:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
@@ -0,0 +1,208 @@
+"""
+Content-addressed media storage.
+
+It includes:
+- ContentAddressedStorage: File system storage naming files after the
+  SHA-256 of their content, so identical uploads share one file.
+- MEDIA_REFERENCES: The model fields that reference media files.
+- family: The content name a file is, or is derived from.
+- reference_count: Count the rows referencing a media file.
+- is_claimed, delete_unreferenced: Whether a file is claimed by a row about
+  to be saved, and delete a file unless it is claimed or referenced.
+- release: Delete media files once no row references them anymore.
+
+Because a file can be shared by several tickets and users, media files
+must never be deleted directly: callers release the names they stop
+using, and a file is only deleted when its reference count drops to zero.
+
+An upload identical to a stored file reuses it before the row referencing
+it is saved, so a release counting the references meanwhile would find
+none. Reusing a file therefore claims it for settings.MEDIA_CLAIM_SECONDS,
+by setting its modification time that far ahead, and a released file is
+moved aside before it is deleted: it is put back if it was claimed, or if a
+row references it again.
+
+The variants of an image are named after its content name plus a label
+('ab/cd/abcd...ef_200.webp', see litrevu.images.variant_name): a variant
+is referenced by the rows whose file field belongs to the same family,
+which the indexes of the file fields find without reading the variants.
+"""
+import hashlib
+import os
+import re
+import time
+import uuid
+from pathlib import PurePosixPath
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import Q
+
+CONTENT_NAME_RE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+VARIANT_NAME_RE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}_\w+\.\w+$')
+FAMILY_RE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?=[._]|$)')
+# The names of a family sort between its content name without extension
+# and that name followed by '`', the character after '.' and '_'.
+FAMILY_END = '`'
+
+# (model label, file field, JSON field holding the names of its variants,
+#  method rebuilding the variants from the stored file)
+MEDIA_REFERENCES = (
+    ('blog.Ticket', 'image', 'image_variants', 'process_stored_image'),
+    ('authentication.User', 'profile_photo', 'avatar_variants', 'process_profile_photo'),
+)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage naming each file after the hash of its content.
+
+    'cover.JPG' is stored as 'ab/cd/abcd...ef.jpg', sharded by the first
+    bytes of its SHA-256 digest. Saving content that is already stored
+    writes nothing, claims the existing file and returns its name. Variant
+    names derived from a content name are kept as given, and only written
+    once.
+    """
+    def content_name(self, name, content):
+        """
+        Return the content-addressed name of a file, keeping its extension.
+        """
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        ext = PurePosixPath(name).suffix.lower()
+        return f'{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+    def save(self, name, content, max_length=None):
+        """
+        Store content under its content-addressed name and return that name.
+        """
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if not self.is_variant_name(name):
+            name = self.content_name(name, content)
+        if self.claim(name):
+            return name
+        return self._save(name, content)
+
+    def claim(self, name):
+        """
+        Keep a stored file from being released for MEDIA_CLAIM_SECONDS, for
+        the row about to reference it.
+
+        Returns:
+            bool: False if the file is not stored.
+        """
+        until = time.time() + getattr(settings, 'MEDIA_CLAIM_SECONDS', 60 * 60)
+        try:
+            os.utime(self.path(name), (until, until))
+        except FileNotFoundError:
+            return False
+        return True
+
+    @staticmethod
+    def is_content_name(name):
+        """
+        Return True if name is already a content-addressed name.
+        """
+        return bool(CONTENT_NAME_RE.match(name))
+
+    @staticmethod
+    def is_variant_name(name):
+        """
+        Return True if name is derived from a content-addressed name.
+        """
+        return bool(VARIANT_NAME_RE.match(name))
+
+
+def family(name):
+    """
+    Return the family of a content or variant name: the content name it
+    is, or is derived from, without extension; None for other names.
+
+    Example: family('ab/cd/abcd...ef_200.webp') -> 'ab/cd/abcd...ef'
+    """
+    match = FAMILY_RE.match(name)
+    return match.group(0) if match else None
+
+
+def reference_count(name):
+    """
+    Return the number of rows referencing a media file (see MEDIA_REFERENCES).
+
+    A file is referenced by the rows whose file field holds its name; a
+    variant, by the rows whose file field belongs to its family. Both are
+    lookups on the index of the file field; the variants are not read.
+    """
+    key = family(name) if ContentAddressedStorage.is_variant_name(name) else None
+    count = 0
+    for label, file_field, *_ in MEDIA_REFERENCES:
+        if key:
+            lookup = Q(**{f'{file_field}__gte': key, f'{file_field}__lt': key + FAMILY_END})
+        else:
+            lookup = Q(**{file_field: name})
+        count += apps.get_model(label)._default_manager.filter(lookup).count()
+    return count
+
+
+def is_claimed(storage, name):
+    """
+    Return True if a stored file was claimed and its claim has not expired.
+    """
+    try:
+        return os.stat(storage.path(name)).st_mtime > time.time()
+    except FileNotFoundError:
+        return False
+
+
+def delete_unreferenced(storage, name):
+    """
+    Delete a file that no row references, unless it is claimed.
+
+    The file is moved aside first: a claim made before the move is seen on
+    the moved file, and a save after it writes the file again. The file is
+    put back if it was claimed, or if a row references it by then.
+
+    Returns:
+        bool: True if the file was deleted.
+    """
+    if reference_count(name):
+        return False
+    path = storage.path(name)
+    aside = f'{path}.{uuid.uuid4().hex}.released'
+    try:
+        os.replace(path, aside)
+    except FileNotFoundError:
+        return False
+    if os.stat(aside).st_mtime > time.time() or reference_count(name):
+        # A file saved meanwhile has the same content.
+        os.replace(aside, path)
+        return False
+    os.remove(aside)
+    return True
+
+
+def release(names, storage=None):
+    """
+    Delete the given media files that no row references anymore.
+
+    The check runs once the current transaction commits, so that the rows
+    no longer referencing the files are visible.
+    """
+    storage = storage or default_storage
+    names = {name for name in names if name}
+    if not names:
+        return
+
+    def delete_released():
+        for name in names:
+            delete_unreferenced(storage, name)
+
+    transaction.on_commit(delete_released)
@@ -22,17 +22,17 @@ import authentication.forms
 import authentication.views
 import blog.views
 from authentication.forms import CustomAuthenticationForm
-from django.contrib.auth.views import LoginView, LogoutView, PasswordChangeView,PasswordChangeDoneView
+from django.contrib.auth.views import PasswordChangeView,PasswordChangeDoneView
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', LoginView.as_view(
+    path('', authentication.views.LoginView.as_view(
         template_name='authentication/login.html',
         authentication_form=CustomAuthenticationForm,
         redirect_authenticated_user=True),
         name='login'),
-    path('logout/', LogoutView.as_view(), name='logout'),
+    path('logout/', authentication.views.LogoutView.as_view(), name='logout'),
     path('home/', blog.views.home, name='home'),
     path('password_change/', authentication.views.password_change, name='password_change'),
     path('password_change/done/', PasswordChangeDoneView.as_view(
@@ -42,6 +42,7 @@ urlpatterns = [
     path('photo/profile/upload', authentication.views.upload_profile_photo,
          name='profile_photo_upload'),
     path('create/ticket', blog.views.create_ticket, name="create-ticket"),
+    path('tickets/similar', blog.views.similar_tickets, name='similar_tickets'),
     path('ticket/<int:ticket_id>/create/review', blog.views.create_review,
           name='create-review'),
     path('create/review-ticket', blog.views.create_ticket_and_review,
@@ -51,13 +52,19 @@ urlpatterns = [
     path('review/<int:review_id>', blog.views.view_review,
          name='view-review'),
     path('follow-users', blog.views.follow_users, name='follow_users'),
+    path('users/autocomplete', blog.views.username_autocomplete,
+         name='username_autocomplete'),
     path('unfollow/<int:user_id>/', blog.views.unfollow_users,
           name='unfollow_users'),
     path('posts', blog.views.display_posts, name='posts'),
+    path('events/feed', blog.views.feed_events, name='feed_events'),
+    path('search', blog.views.search, name='search'),
+    path('trending', blog.views.trending, name='trending'),
     path('edit/ticket/<int:ticket_id>', blog.views.edit_ticket, name='edit_ticket'),
     path('edit/review/<int:review_id>', blog.views.edit_review, name='edit_review'),
     path('blocks-users/<int:user_id>/', blog.views.blocked_users, name='block_user'),
     path('unblocks-users/<int:user_id>/', blog.views.unblocked_users, name='unblock_user'),
+    path('stats/', blog.views.runtime_stats, name='runtime_stats'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,223 @@
+"""
+Write admission control for SQLite's single writer.
+
+It includes:
+- WriteQueue: A process-local FIFO admitting one write transaction at a time.
+- immediate_atomic: transaction.atomic() starting with BEGIN IMMEDIATE.
+- run_write: Run a write in the queue, retrying on lock errors.
+- SessionMiddleware: Saves modified sessions with run_write too.
+- stats: Queue depth, wait times, retries and failures, for the stats view.
+
+SQLite lets one connection write at a time. A deferred transaction that
+reads before it writes fails at once with "database is locked" when
+another connection got the write lock meanwhile; the busy timeout does
+not help there. Writes therefore take the write lock up front
+(BEGIN IMMEDIATE, which does wait for the busy timeout), after queueing
+behind the other writes of the process, and are retried with jittered
+exponential backoff if the lock still cannot be taken.
+
+Views pass run_write their ORM writes only: decoding and resizing images,
+checking and hashing passwords and rendering templates happen before or
+after, so the slot and the lock are held for the writes alone, and a
+retry replays the writes alone.
+"""
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware as BaseSessionMiddleware
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from litrevu import metrics
+
+LOCK_ERRORS = ('database is locked', 'database table is locked')
+
+
+class WriteQueue:
+    """
+    FIFO lock: writers are admitted one at a time, in arrival order.
+
+    Records the number of waiting writers and how long each one waited.
+    The thread holding the slot can enter it again without queueing.
+    """
+    def __init__(self, samples=1000):
+        self._condition = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+        self._holder = None
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.retries = 0
+        self.failures = 0
+        self.waits = deque(maxlen=samples)
+
+    @contextmanager
+    def slot(self):
+        """
+        Wait for the turn of the caller, then hold the write slot.
+        """
+        if self._holder == threading.get_ident():
+            yield
+            return
+        start = time.perf_counter()
+        with self._condition:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            while ticket != self._serving:
+                self._condition.wait()
+            self.waiting -= 1
+            self.admitted += 1
+            self.waits.append(time.perf_counter() - start)
+            self._holder = threading.get_ident()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._holder = None
+                self._serving += 1
+                self._condition.notify_all()
+
+    def record(self, counter):
+        """
+        Increment a counter of the queue ('retries' or 'failures').
+        """
+        with self._condition:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        """
+        Return the queue counters and the wait time percentiles.
+        """
+        with self._condition:
+            waits = list(self.waits)
+            counters = {
+                'depth': self.waiting,
+                'max_depth': self.max_waiting,
+                'admitted': self.admitted,
+                'retries': self.retries,
+                'failures': self.failures,
+            }
+        summary = metrics.summarize(waits)
+        return {
+            **counters,
+            'wait_p50_ms': summary['p50_ms'],
+            'wait_p95_ms': summary['p95_ms'],
+            'wait_max_ms': summary['max_ms'],
+        }
+
+
+queue = WriteQueue()
+
+
+def is_lock_error(error):
+    """
+    Return True if a database error means the write lock was not obtained.
+    """
+    return isinstance(error, OperationalError) and any(
+        message in str(error) for message in LOCK_ERRORS)
+
+
+@contextmanager
+def immediate_atomic(using=DEFAULT_DB_ALIAS):
+    """
+    transaction.atomic() whose outermost transaction takes the SQLite write
+    lock when it begins (BEGIN IMMEDIATE) instead of at its first write.
+
+    Inner blocks, and other databases, behave as transaction.atomic().
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+    connection.ensure_connection()
+    mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
+
+
+def backoff(attempt):
+    """
+    Return the delay before retry number attempt (from 0), with full jitter.
+    """
+    base = getattr(settings, 'WRITE_RETRY_BASE_DELAY', 0.02)
+    cap = getattr(settings, 'WRITE_RETRY_MAX_DELAY', 0.5)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def rewind_uploads(request):
+    """
+    Seek the uploaded files of a request back to their start, for a retry.
+    """
+    if request is None:
+        return
+    for upload in request.FILES.values():
+        upload.seek(0)
+
+
+def run_write(func, request=None):
+    """
+    Run func in a queued, immediate transaction; retry it on lock errors.
+
+    func is called again from scratch on each attempt, so it must only have
+    effects that the rollback undoes or that are safe to repeat (files are
+    content-addressed, so saving one twice stores it once).
+
+    Args:
+        func (callable): The write, without arguments.
+        request (HttpRequest): The request, whose uploads are rewound
+            before a retry.
+
+    Returns:
+        The return value of func.
+
+    Raises:
+        OperationalError: If the lock is still not obtained after
+            settings.WRITE_RETRY_ATTEMPTS attempts.
+    """
+    attempts = getattr(settings, 'WRITE_RETRY_ATTEMPTS', 5)
+    for attempt in range(attempts):
+        try:
+            with queue.slot(), immediate_atomic():
+                return func()
+        except OperationalError as error:
+            if not is_lock_error(error):
+                raise
+            if attempt == attempts - 1:
+                queue.record('failures')
+                raise
+            queue.record('retries')
+        rewind_uploads(request)
+        time.sleep(backoff(attempt))
+
+
+class SessionMiddleware(BaseSessionMiddleware):
+    """
+    Session middleware saving modified sessions through run_write.
+
+    The session is saved after the view returned, outside of its writes;
+    a login, for one, writes the user then the session.
+    """
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        if session is None or not (
+                session.modified or settings.SESSION_SAVE_EVERY_REQUEST):
+            return super().process_response(request, response)
+        return run_write(lambda: super(SessionMiddleware, self).process_response(
+            request, response))
+
+
+def stats():
+    """
+    Return the counters of the write queue of this process.
+    """
+    return queue.stats()
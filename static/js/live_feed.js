@@ -0,0 +1,35 @@
+/*
+ * Announce the new posts of the home feed without reloading it.
+ *
+ * The home page renders a hidden link with a data-live-feed attribute: the
+ * URL of the Server-Sent Events stream (see blog/streams.py).
+ * Each 'post' event increments a counter shown in the link, which reloads
+ * the feed. Served by the WSGI app, the stream answers 204 and the
+ * EventSource gives up without retrying.
+ */
+(function () {
+  function label(count) {
+    return count === 1
+      ? '1 nouveau post dans votre flux. Afficher'
+      : count + ' nouveaux posts dans votre flux. Afficher';
+  }
+
+  function connect() {
+    var banner = document.querySelector('[data-live-feed]');
+    if (!banner || !window.EventSource) {
+      return;
+    }
+    var count = 0;
+    var source = new EventSource(banner.dataset.liveFeed);
+    source.addEventListener('post', function () {
+      count += 1;
+      banner.textContent = label(count);
+      banner.hidden = false;
+    });
+    window.addEventListener('pagehide', function () {
+      source.close();
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', connect);
+})();
@@ -0,0 +1,41 @@
+/*
+ * Keep the relative dates of the cards ("il y a 5 minutes") up to date.
+ *
+ * The server renders <time datetime="..." data-relative="posted|updated">
+ * elements (see the posted_at_time and updated_at_time template tags) with
+ * the message computed at render time. Cached cards may be served long
+ * after that, so the messages are recomputed here from the datetime
+ * attribute, with the same wording. Dates older than a day are absolute
+ * and left untouched.
+ */
+(function () {
+  var MINUTE = 60;
+  var HOUR = 60 * MINUTE;
+  var DAY = 24 * HOUR;
+  var PREFIXES = {posted: 'il y a ', updated: 'Modifié il y a '};
+
+  function message(element) {
+    var seconds = (Date.now() - Date.parse(element.getAttribute('datetime'))) / 1000;
+    var prefix = PREFIXES[element.dataset.relative];
+    if (isNaN(seconds) || !prefix || seconds > DAY) {
+      return null;
+    }
+    if (seconds <= HOUR) {
+      return prefix + Math.floor(Math.max(seconds, 0) / MINUTE) + ' minutes';
+    }
+    var hours = Math.floor(seconds / HOUR);
+    return prefix + hours + (element.dataset.relative === 'posted' ? ' heures.' : ' heures');
+  }
+
+  function refresh() {
+    document.querySelectorAll('time[data-relative]').forEach(function (element) {
+      var text = message(element);
+      if (text !== null) {
+        element.textContent = text;
+      }
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', refresh);
+  setInterval(refresh, MINUTE * 1000);
+})();
@@ -0,0 +1,63 @@
+/*
+ * Suggest the existing tickets close to the one being written.
+ *
+ * The ticket forms render a hidden box with a data-similar-tickets
+ * attribute (the URL of the suggestions, see blog.views.similar_tickets)
+ * and data-title-input (the id of the title field). While the title is
+ * typed, the suggestions are fetched once the typing pauses, and the box
+ * lists them with links to the tickets and to their review forms.
+ */
+(function () {
+  var DELAY = 300;
+  var MIN_LENGTH = 4;
+
+  function item(ticket) {
+    var li = document.createElement('li');
+    var link = document.createElement('a');
+    link.href = ticket.url;
+    link.textContent = ticket.title;
+    var review = document.createElement('a');
+    review.href = ticket.review_url;
+    review.textContent = 'le critiquer';
+    li.append(link, ' — ', review);
+    return li;
+  }
+
+  function watch(box) {
+    var input = document.getElementById(box.dataset.titleInput);
+    var list = box.querySelector('[data-similar-list]');
+    if (!input || !list || !window.fetch) {
+      return;
+    }
+    var timer = null;
+    var controller = null;
+
+    function suggest() {
+      var title = input.value.trim();
+      if (controller) {
+        controller.abort();
+      }
+      if (title.length < MIN_LENGTH) {
+        return;
+      }
+      controller = new AbortController();
+      var url = box.dataset.similarTickets + '?title=' + encodeURIComponent(title);
+      fetch(url, {signal: controller.signal, credentials: 'same-origin'})
+        .then(function (response) { return response.ok ? response.json() : {tickets: []}; })
+        .then(function (data) {
+          list.replaceChildren.apply(list, data.tickets.map(item));
+          box.hidden = data.tickets.length === 0;
+        })
+        .catch(function () {});
+    }
+
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(suggest, DELAY);
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('[data-similar-tickets]').forEach(watch);
+  });
+})();
@@ -0,0 +1,74 @@
+/*
+ * Complete the username typed in the follow form.
+ *
+ * The follow form renders a datalist with a data-username-autocomplete
+ * attribute (the URL of the suggestions, see
+ * blog.views.username_autocomplete), used by the inputs whose list
+ * attribute names it. Once the typing pauses, the usernames starting with
+ * the input are fetched and offered by the datalist. Answers are kept per
+ * prefix; after a 429, the input waits for Retry-After before asking again.
+ */
+(function () {
+  var DELAY = 250;
+  var MIN_LENGTH = 2;
+
+  function option(user) {
+    var item = document.createElement('option');
+    item.value = user.username;
+    return item;
+  }
+
+  function watch(list) {
+    var input = document.querySelector('input[list="' + list.id + '"]');
+    if (!input || !window.fetch) {
+      return;
+    }
+    var timer = null;
+    var controller = null;
+    var pausedUntil = 0;
+    var answers = {};
+
+    function show(users) {
+      list.replaceChildren.apply(list, users.map(option));
+    }
+
+    function complete() {
+      var prefix = input.value.trim();
+      if (controller) {
+        controller.abort();
+      }
+      if (prefix.length < MIN_LENGTH || Date.now() < pausedUntil) {
+        return;
+      }
+      if (answers[prefix]) {
+        show(answers[prefix]);
+        return;
+      }
+      controller = new AbortController();
+      var url = list.dataset.usernameAutocomplete + '?q=' + encodeURIComponent(prefix);
+      fetch(url, {signal: controller.signal, credentials: 'same-origin'})
+        .then(function (response) {
+          if (response.status === 429) {
+            pausedUntil = Date.now() + 1000 * (parseInt(response.headers.get('Retry-After'), 10) || 5);
+          }
+          return response.ok ? response.json() : null;
+        })
+        .then(function (data) {
+          if (data) {
+            answers[prefix] = data.users;
+            show(data.users);
+          }
+        })
+        .catch(function () {});
+    }
+
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(complete, DELAY);
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('datalist[data-username-autocomplete]').forEach(watch);
+  });
+})();